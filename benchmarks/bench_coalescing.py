@@ -0,0 +1,103 @@
+"""
+  Concurrent plugin invocations missing the cache at the same time.
+
+  Starts several processes at once against one profile (shared built-in
+  SQLite cache) and a local server answering slowly, each listing the
+  providers then the channels of the first one, as widgets and the user
+  browsing would. Checks that cats.txt and the playlist were fetched once
+  and that every process got the same result, then runs the same with the
+  locks disabled for comparison.
+
+  Usage:
+    python benchmarks/bench_coalescing.py [--processes 6] [--delay 0.5]
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+
+import fixtures  # noqa: E402
+from provider_server import ProviderServer  # noqa: E402
+
+CHILD = """
+import sys, time, json, contextlib
+sys.path.insert(0, {bench_dir!r})
+import kodi_stubs
+kodi_stubs.install({addon_dir!r}, {profile_dir!r}, storage_server=False)
+import lib.providers
+if not {locks!r}:
+  lib.providers.single_flight = lambda name: contextlib.nullcontext()
+time.sleep(max(0, {start_at!r} - time.time()))
+providers = lib.providers.get_providers()
+channels = lib.providers.get_channels(providers[0]["catLink"])
+sys.stdout.write(json.dumps([len(providers), [ch.title for ch in channels]]))
+"""
+
+
+def run(processes: int, delay: float, channels: int, locks: bool) -> tuple[dict, list, float]:
+  """
+  :return: Tuple (requests by path, results of the processes, wall time in seconds)
+  """
+  with tempfile.TemporaryDirectory() as tmp, ProviderServer() as server:
+    root = Path(tmp)
+    addon_dir = fixtures.make_addon_dir(root)
+    profile_dir = root / "profile"
+    profile_dir.mkdir()
+
+    server.add("/cats.txt", fixtures.encrypt_data(
+      json.dumps(fixtures.synthetic_providers(3, server.base_url))), delay=delay)
+    server.add("/provider0.m3u", fixtures.encrypt_content(fixtures.synthetic_m3u(channels)),
+               delay=delay)
+    (profile_dir / "remote_config.json").write_text(json.dumps({
+      "entries": {"cric_api2": server.base_url},
+      "fetch_time": time.time(),
+    }), encoding="utf-8")
+
+    code = CHILD.format(bench_dir=str(BENCH_DIR), addon_dir=str(addon_dir),
+                        profile_dir=str(profile_dir), locks=locks,
+                        start_at=time.time() + 1.0)
+    started = time.perf_counter()
+    children = [subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.PIPE)
+                for _ in range(processes)]
+    results = [json.loads(child.communicate()[0] or "null") for child in children]
+    return dict(server.hits), results, time.perf_counter() - started - 1.0
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--processes", type=int, default=6)
+  parser.add_argument("--delay", type=float, default=0.5, help="Seconds the server takes to answer")
+  parser.add_argument("--channels", type=int, default=2000)
+  args = parser.parse_args()
+
+  failures = []
+  for locks in (True, False):
+    hits, results, elapsed = run(args.processes, args.delay, args.channels, locks)
+    label = "coalesced" if locks else "without locks"
+    print(f"{label:>14}: cats.txt fetched {hits.get('/cats.txt', 0)}x, "
+          f"playlist fetched {hits.get('/provider0.m3u', 0)}x by {args.processes} processes "
+          f"in {elapsed:.2f}s")
+    if not locks:
+      continue
+    if hits.get("/cats.txt") != 1:
+      failures.append(f"cats.txt fetched {hits.get('/cats.txt', 0)} times")
+    if hits.get("/provider0.m3u") != 1:
+      failures.append(f"Playlist fetched {hits.get('/provider0.m3u', 0)} times")
+    if None in results or any(result != results[0] for result in results):
+      failures.append("Processes got different results")
+    elif len(results[0][1]) != args.channels:
+      failures.append(f"{len(results[0][1])} channels listed, expected {args.channels}")
+
+  for failure in failures:
+    print(f"FAIL: {failure}")
+  sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,94 @@
+"""
+  Connection reuse and revalidation of the plugin's fetches.
+
+  Fetches the provider list and --playlists playlists from one local host
+  through the shared session (lib.req.get_session), then refreshes every
+  playlist again. Checks that all of it went over a single kept-alive
+  connection and that the unchanged playlists came back as 304 Not
+  Modified, then compares the time of these fetches with a new connection
+  for each.
+
+  Usage:
+    python benchmarks/bench_connections.py [--playlists 4] [--channels 2000]
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+
+import kodi_stubs  # noqa: E402
+import fixtures  # noqa: E402
+from provider_server import ProviderServer  # noqa: E402
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--playlists", type=int, default=4)
+  parser.add_argument("--channels", type=int, default=2000)
+  parser.add_argument("--requests", type=int, default=50, help="Fetches timed per mode")
+  args = parser.parse_args()
+
+  failures = []
+  with tempfile.TemporaryDirectory() as tmp, ProviderServer() as server:
+    root = Path(tmp)
+    profile_dir = root / "profile"
+    profile_dir.mkdir()
+    (profile_dir / "remote_config.json").write_text(json.dumps({
+      "entries": {"cric_api2": server.base_url},
+      "fetch_time": time.time(),
+    }), encoding="utf-8")
+    kodi_stubs.install(fixtures.make_addon_dir(root), profile_dir)
+    server.add("/cats.txt", fixtures.encrypt_data(
+      json.dumps(fixtures.synthetic_providers(args.playlists, server.base_url))))
+    paths = [f"/provider{i}.m3u" for i in range(args.playlists)]
+    for i, path in enumerate(paths):
+      server.add(path, fixtures.encrypt_content(fixtures.synthetic_m3u(args.channels, seed=i)))
+
+    import requests
+    from lib.providers import get_providers, get_channels, refresh_channels_once
+    from lib.req import custom_headers, get_session
+
+    providers = get_providers()
+    for provider in providers:
+      get_channels(provider["catLink"])
+    for provider in providers:
+      refresh_channels_once(provider["catLink"])
+
+    fetches = sum(server.hits.values())
+    print(f"{fetches} fetches over {server.connections} connection(s)")
+    if len(providers) != args.playlists:
+      failures.append(f"{len(providers)} providers listed, expected {args.playlists}")
+    if server.connections != 1:
+      failures.append(f"{fetches} fetches used {server.connections} connections, expected 1")
+    for path in paths:
+      print(f"  {path}: {server.statuses.get(path)}")
+      if server.statuses.get(path) != [200, 304]:
+        failures.append(f"{path} answered {server.statuses.get(path)}, expected [200, 304]")
+
+    # Revalidations only, the payload size doesn't hide the connection setup
+    url = server.base_url + paths[0]
+    headers = {**custom_headers, "If-None-Match": server.request_headers[paths[0]]["If-None-Match"]}
+    for name, fetch in (
+      ("shared session", lambda: get_session().get(url, headers=headers, timeout=15)),
+      ("new connections", lambda: requests.get(url, headers=headers, timeout=15)),
+    ):
+      connections = server.connections
+      started = time.perf_counter()
+      for _ in range(args.requests):
+        fetch().close()
+      elapsed = time.perf_counter() - started
+      print(f"  {name:>15}: {elapsed / args.requests * 1000:6.2f}ms per revalidation, "
+            f"{server.connections - connections} new connection(s)")
+
+  for failure in failures:
+    print(f"FAIL: {failure}")
+  sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+  main()
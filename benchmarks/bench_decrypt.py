@@ -0,0 +1,120 @@
+"""
+  Decryption of cats.txt, screened keys against the original sequential path.
+
+  Encrypts provider lists of growing sizes with the first key, with the
+  second one (keys rotated, the first one fails) and with neither, then
+  times as a fresh plugin process would (best of --repeat runs):
+  - sequential: every key decrypts the whole ciphertext in turn, as
+    decrypt_data did before keys were screened
+  - screened: decrypt_data, keys checked against two blocks first
+  - memoized: _decrypt_providers with the result of a previous run in the
+    profile, no AES at all
+  Checks that the paths give the same text, and that the key which
+  decrypted last is tried first by the next process.
+
+  Usage:
+    python benchmarks/bench_decrypt.py [--providers 100,1000,10000] [--repeat 5]
+"""
+import sys
+import json
+import time
+import base64
+import argparse
+import tempfile
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+
+import kodi_stubs  # noqa: E402
+import fixtures  # noqa: E402
+
+WRONG_SECRET = "0f" * 16 + ":" + "f0" * 16  # Neither of the add-on's keys
+
+
+def sequential_decrypt(crypto_utils, encrypted_base64: str):
+  """
+  decrypt_data as it was: whole ciphertext decrypted with each key in turn.
+  """
+  clean_base64 = (
+    encrypted_base64.strip()
+    .replace("\n", "")
+    .replace("\r", "")
+    .replace(" ", "")
+    .replace("\t", "")
+  )
+  ciphertext = base64.b64decode(clean_base64)
+  for key_info in crypto_utils.keys().values():
+    result = crypto_utils._decrypt(ciphertext, key_info)
+    if result is not None:
+      return result
+  return None
+
+
+def best_time(run, before, repeat: int) -> tuple[object, float]:
+  """
+  :return: Tuple (result of the last run, best wall time in seconds)
+  """
+  best = float("inf")
+  for _ in range(repeat):
+    before()
+    started = time.perf_counter()
+    result = run()
+    best = min(best, time.perf_counter() - started)
+  return result, best
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--providers", default="100,1000,10000")
+  parser.add_argument("--repeat", type=int, default=5)
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as tmp:
+    root = Path(tmp)
+    kodi_stubs.install(fixtures.make_addon_dir(root), root / "profile")
+    from lib import crypto_utils, providers
+
+    def fresh_process():
+      # A profile where no key has worked yet
+      crypto_utils.LAST_KEY_FILE_PATH.unlink(missing_ok=True)
+
+    def no_memo():
+      fresh_process()
+      providers.PROVIDERS_MEMO_FILE_PATH.unlink(missing_ok=True)
+
+    failures = []
+    print(f"{'providers':>9} {'encrypted with':>14} {'size (KB)':>10} "
+          f"{'sequential':>11} {'screened':>10} {'memoized':>10}")
+    for count in (int(size) for size in args.providers.split(",")):
+      text = json.dumps(fixtures.synthetic_providers(count, "https://example.com"))
+      for label, secret in (("first key", fixtures.SECRET1), ("second key", fixtures.SECRET2),
+                            ("no key", WRONG_SECRET)):
+        encrypted = fixtures.encrypt_data(text, secret)
+        expected = text if secret != WRONG_SECRET else None
+        results = {}
+        results["sequential"], sequential = best_time(
+          lambda: sequential_decrypt(crypto_utils, encrypted), fresh_process, args.repeat)
+        results["screened"], screened = best_time(
+          lambda: crypto_utils.decrypt_data(encrypted), fresh_process, args.repeat)
+        if expected is not None:
+          first_key = crypto_utils._keys_by_preference(crypto_utils._read_last_key_name())[0][0]
+          if first_key != ("key1" if secret == fixtures.SECRET1 else "key2"):
+            failures.append(f"{count} providers, {label}: {first_key} tried first next time")
+        no_memo()
+        providers._decrypt_providers(encrypted)
+        results["memoized"], memoized = best_time(
+          lambda: providers._decrypt_providers(encrypted), fresh_process, args.repeat)
+        print(f"{count:>9} {label:>14} {len(encrypted) / 1024:10.1f} {sequential * 1000:9.2f}ms "
+              f"{screened * 1000:8.2f}ms {memoized * 1000:8.2f}ms")
+        for name, result in results.items():
+          if result != expected:
+            failures.append(f"{count} providers, {label}: {name} gave another result")
+
+  for failure in failures:
+    print(f"FAIL: {failure}")
+  sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,129 @@
+"""
+  #EXTVLCOPT, #EXTHTTP and #KODIPROP directives, from playlist to playback.
+
+  golden/directives.json holds playlist entries using the directives (DRM
+  systems, declared inputstream properties, other inputstream add-ons,
+  malformed lines) with the channel each parses to, the errors it logs and
+  the path and ListItem properties it plays with. Checks both parsers, the
+  channel file round trip and build_playback against them, then reports
+  the parsing throughput of a playlist where every entry carries several
+  directives.
+
+  Usage:
+    python benchmarks/bench_directives.py [--channels 50000] [--repeat 3]
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+
+import kodi_stubs  # noqa: E402
+import fixtures  # noqa: E402
+
+GOLDEN_PATH = BENCH_DIR / "golden" / "directives.json"
+
+
+def directive_m3u(channels: int) -> str:
+  """
+  Playlist where every entry declares its DRM, manifest type and headers.
+  """
+  lines = ["#EXTM3U"]
+  for i in range(channels):
+    lines += [
+      "#KODIPROP:inputstream.adaptive.license_type=com.widevine.alpha",
+      f"#KODIPROP:inputstream.adaptive.license_key=https://lic{i % 3}.example.com/wv?id={i}",
+      "#KODIPROP:inputstream.adaptive.manifest_type=mpd",
+      f"#EXTVLCOPT:http-user-agent=Mozilla/5.0 Player/{i % 3}",
+      f"#EXTVLCOPT:http-referrer=https://ref{i % 4}.example.com/",
+      f'#EXTHTTP:{{"cookie":"session={i:x}","Origin":"https://o{i % 5}.example.com"}}',
+      f'#EXTINF:-1 tvg-logo="https://logo.example.com/{i % 200}.png" '
+      f'group-title="Group {i % 25}",Channel {i}',
+      f"https://cdn{i % 9}.example.com/live/{i}/index.mpd",
+    ]
+  return "\n".join(lines) + "\n"
+
+
+def _set_fields(channel) -> dict:
+  return {name: value for name, value in channel.to_dict().items() if value}
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--channels", type=int, default=50000)
+  parser.add_argument("--repeat", type=int, default=3)
+  args = parser.parse_args()
+
+  cases = json.loads(GOLDEN_PATH.read_text(encoding="utf-8"))
+
+  with tempfile.TemporaryDirectory() as tmp:
+    root = Path(tmp)
+    kodi_stubs.install(fixtures.make_addon_dir(root), root / "profile")
+    import xbmc
+    from lib.m3u_parser import PlaylistItem, iter_m3u, iter_m3u_batch
+    from lib.playback import build_playback
+    from lib.channel_store import ChannelFile, write_channel_file
+
+    errors = []
+    xbmc.log = lambda msg, level=0: errors.append(msg) if level == xbmc.LOGERROR else None
+
+    failures = []
+    for case in cases:
+      name = case["name"]
+      for parser_name, parse in (("line", iter_m3u), ("batch", iter_m3u_batch)):
+        errors.clear()
+        channels = list(parse(case["m3u"]))
+        if len(errors) != case["errors"]:
+          failures.append(f"{name} ({parser_name}): {len(errors)} errors logged, "
+                          f"expected {case['errors']}")
+        if len(channels) != 1:
+          failures.append(f"{name} ({parser_name}): {len(channels)} channels parsed")
+          continue
+        if _set_fields(channels[0]) != case["channel"]:
+          failures.append(f"{name} ({parser_name}): parsed {_set_fields(channels[0])}, "
+                          f"expected {case['channel']}")
+
+      file_path = root / "channels.bin"
+      write_channel_file(file_path, [channels[0].to_list()])
+      with ChannelFile(file_path) as channel_file:
+        stored = channel_file.record(0)
+      if PlaylistItem.from_list(stored).to_list() != channels[0].to_list():
+        failures.append(f"{name}: stored {stored}, expected {channels[0].to_list()}")
+
+      playback = build_playback(channels[0])
+      # Property order included, Kodi gets them in this order
+      if playback != case["playback"] or list(playback["properties"]) != list(case["playback"]["properties"]):
+        failures.append(f"{name}: plays with {playback}, expected {case['playback']}")
+    print(f"{len(cases)} directive cases checked")
+
+    content = directive_m3u(args.channels)
+    size_mb = len(content.encode("utf-8")) / (1024 * 1024)
+    directives = content.count("\n#") - args.channels  # Besides #EXTINF
+    print(f"{args.channels} channels, {directives} directives ({size_mb:.1f}MB)")
+    for parser_name, parse in (("line", iter_m3u), ("batch", iter_m3u_batch)):
+      best = float("inf")
+      for _ in range(args.repeat):
+        started = time.perf_counter()
+        channels = list(parse(content))
+        best = min(best, time.perf_counter() - started)
+      print(f"  {parser_name:>6}: {best * 1000:8.1f}ms {size_mb / best:7.1f}MB/s "
+            f"{directives / best / 1e6:5.2f}M directives/s")
+      if len(channels) != args.channels:
+        failures.append(f"{parser_name}: {len(channels)} channels parsed, expected {args.channels}")
+
+    started = time.perf_counter()
+    for channel in channels:
+      build_playback(channel)
+    print(f"  build_playback: {(time.perf_counter() - started) / len(channels) * 1e6:.1f}us per channel")
+
+  for failure in failures:
+    print(f"FAIL: {failure}")
+  sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,121 @@
+"""
+  Stream health prober against local HTTP stand-ins.
+
+  Serves a playlist whose channels point at two local "CDN" servers, some of
+  them dead (404) or slow, runs the service's prober over it and checks that
+  the concurrency and rate limits held, that the channels' headers were
+  sent and that listings rank and filter the channels as expected. Reports
+  the probing throughput.
+
+  Usage:
+    python benchmarks/bench_health.py [--channels 400] [--rate 100] ...
+"""
+import sys
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+
+import kodi_stubs  # noqa: E402
+import fixtures  # noqa: E402
+from provider_server import ProviderServer  # noqa: E402
+
+
+def build_playlist(cdns: list[ProviderServer], channels: int, dead_ratio: float,
+                   slow_ratio: float, slow_delay: float, seed: int = 0):
+  """
+  Serves channel manifests from the CDN stand-ins.
+  :return: Tuple (M3U content, dead titles, slow titles)
+  """
+  rng = random.Random(seed)
+  lines = ["#EXTM3U"]
+  dead, slow = set(), set()
+  for i in range(channels):
+    cdn = cdns[i % len(cdns)]
+    title = f"Channel {i}"
+    path = f"/live/{i}/index.m3u8"
+    roll = rng.random()
+    if roll < dead_ratio:
+      dead.add(title)
+    elif roll < dead_ratio + slow_ratio:
+      slow.add(title)
+      cdn.add(path, "#EXTM3U\n#EXT-X-VERSION:3\n", delay=slow_delay)
+    else:
+      cdn.add(path, "#EXTM3U\n#EXT-X-VERSION:3\n")
+    lines += [
+      f"#EXTVLCOPT:http-user-agent=Player/{i}",
+      f'#EXTHTTP:{{"cookie":"session={i}"}}',
+      f'#EXTINF:-1 tvg-logo="" group-title="Group {i % 5}",{title}',
+      f"{cdn.base_url}{path}|Referer=https://ref{i}.example.com/",
+    ]
+  return "\n".join(lines) + "\n", dead, slow
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--channels", type=int, default=400)
+  parser.add_argument("--dead-ratio", type=float, default=0.2)
+  parser.add_argument("--slow-ratio", type=float, default=0.1)
+  parser.add_argument("--slow-delay", type=float, default=0.2, help="Seconds")
+  parser.add_argument("--workers", type=int, default=8)
+  parser.add_argument("--per-host", type=int, default=2)
+  parser.add_argument("--rate", type=float, default=100, help="Probes started per second")
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as tmp, ProviderServer() as provider, \
+          ProviderServer() as cdn_a, ProviderServer() as cdn_b:
+    root = Path(tmp)
+    kodi_stubs.install(fixtures.make_addon_dir(root), root / "profile")
+    from lib.health import probe_channels, rank_channels
+    from lib.providers import get_channels
+
+    m3u, dead, slow = build_playlist(
+      [cdn_a, cdn_b], args.channels, args.dead_ratio, args.slow_ratio, args.slow_delay)
+    playlist_url = provider.add("/provider.m3u", m3u)
+    channels = get_channels(playlist_url)
+
+    started = time.perf_counter()
+    probed = probe_channels(
+      [playlist_url], max_workers=args.workers, max_per_host=args.per_host,
+      rate=args.rate, time_budget=600)
+    elapsed = time.perf_counter() - started
+
+    failures = []
+    for name, cdn in (("cdn_a", cdn_a), ("cdn_b", cdn_b)):
+      if cdn.max_in_flight > args.per_host:
+        failures.append(f"{name}: {cdn.max_in_flight} probes in flight, limit {args.per_host}")
+    requests = cdn_a.requests + cdn_b.requests
+    # Starts are spaced by 1/rate, so n probes can't take less than (n - 1)/rate
+    if args.rate and elapsed < (requests - 1) / args.rate * 0.95:
+      failures.append(f"{requests} probes in {elapsed:.2f}s exceed {args.rate}/s")
+
+    sent = cdn_a.request_headers.get("/live/0/index.m3u8", {})
+    expected = {"User-Agent": "Player/0", "Cookie": "session=0",
+                "Referer": "https://ref0.example.com/"}
+    for header, value in expected.items():
+      if sent.get(header) != value:
+        failures.append(f"{header} sent as {sent.get(header)!r}, expected {value!r}")
+
+    kept = rank_channels(playlist_url, channels, hide_dead=True)
+    if {ch.title for ch in kept} != {ch.title for ch in channels} - dead:
+      failures.append("Dead channels not hidden or live ones dropped")
+    ranked = rank_channels(playlist_url, kept, sort_by_latency=True)
+    slowest = {ch.title for ch in ranked[len(ranked) - len(slow):]}
+    if slowest != slow:
+      failures.append("Slow channels not ranked last")
+
+    print(f"{probed} channels probed in {elapsed:.2f}s ({probed / elapsed:.1f}/s), "
+          f"{len(dead)} dead, {len(slow)} slow")
+    print(f"Peak probes in flight per host: {cdn_a.max_in_flight}, {cdn_b.max_in_flight} "
+          f"(limit {args.per_host})")
+    for failure in failures:
+      print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+  main()
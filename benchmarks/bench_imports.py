@@ -0,0 +1,141 @@
+"""
+  Import-time benchmark of the plugin entry point, per router mode.
+
+  Every mode runs in a fresh interpreter (as Kodi does for each plugin
+  invocation) under -X importtime, against a warm cache. The "eager" column
+  imports the network and crypto stack up front, the way main.py used to
+  through lib.providers, to show what the lazy imports save.
+
+  Usage: python benchmarks/bench_imports.py [--runs N]
+"""
+import os
+import sys
+import json
+import ast
+import argparse
+import statistics
+import subprocess
+import tempfile
+from pathlib import Path
+from urllib.parse import urlencode
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+
+import kodi_stubs  # noqa: E402
+from fixtures import make_addon_dir, synthetic_m3u  # noqa: E402
+from provider_server import ProviderServer  # noqa: E402
+
+HEAVY_MODULES = ("requests", "Cryptodome", "lib.crypto_utils", "lib.remote_config", "lib.req")
+EAGER_IMPORTS = "import lib.crypto_utils, lib.remote_config, lib.req"
+MARKER = "-- cricfy plugin --"
+
+CHILD = """
+import sys, time
+sys.path.insert(0, {bench_dir!r})
+import kodi_stubs
+kodi_stubs.install({addon_dir!r}, {profile_dir!r}, store_path={store_path!r})
+sys.argv = ["plugin://plugin.video.cricfy/", "1", {query!r}]
+sys.stderr.write({marker!r} + "\\n")
+started = time.perf_counter()
+{eager}
+import runpy
+runpy.run_path({main_path!r}, run_name="__main__")
+elapsed = time.perf_counter() - started
+heavy = [m for m in {heavy!r} if m in sys.modules]
+sys.stdout.write(repr((elapsed, heavy)))
+"""
+
+
+def seed_cache(root: Path, addon_dir: Path, channels: int) -> tuple[Path, str]:
+  """
+  Fills the stub StorageServer the way a previous invocation would have.
+  :return: Tuple (store file, provider playlist URL)
+  """
+  kodi_stubs.install(addon_dir, root / "profile")
+  from lib.config import cache
+  from lib.providers import PROVIDERS_CACHE_KEY, refresh_channels
+
+  with ProviderServer() as server:
+    playlist_url = server.add("/playlist.m3u", synthetic_m3u(channels))
+    cache.set(PROVIDERS_CACHE_KEY, json.dumps([
+      {"title": "Benchmark", "image": "", "catLink": playlist_url},
+    ]))
+    refresh_channels(playlist_url)
+
+  store_path = root / "store.json"
+  kodi_stubs.MemoryStorageServer.save(store_path)
+  return store_path, playlist_url
+
+
+def run_mode(query: str, eager: bool, paths: dict) -> tuple[float, float, list]:
+  """
+  :return: Tuple (import time in ms, wall time in ms, heavy modules loaded)
+  """
+  code = CHILD.format(
+    bench_dir=str(BENCH_DIR),
+    addon_dir=str(paths["addon"]),
+    profile_dir=str(paths["profile"]),
+    store_path=str(paths["store"]),
+    query=query,
+    marker=MARKER,
+    eager=EAGER_IMPORTS if eager else "",
+    main_path=str(kodi_stubs.PLUGIN_DIR / "main.py"),
+    heavy=HEAVY_MODULES,
+  )
+  result = subprocess.run(
+    [sys.executable, "-X", "importtime", "-c", code],
+    capture_output=True, text=True, check=True,
+    env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+  )
+
+  import_us = 0
+  after_marker = False
+  for line in result.stderr.splitlines():
+    if line == MARKER:
+      after_marker = True
+      continue
+    if not after_marker or not line.startswith("import time:"):
+      continue
+    _, cumulative, name = line[len("import time:"):].split("|")
+    # Only top level imports, nested ones are part of their cumulative time
+    if cumulative.strip().isdigit() and not name.startswith("  "):
+      import_us += int(cumulative)
+
+  elapsed, heavy = ast.literal_eval(result.stdout)
+  return import_us / 1000, elapsed * 1000, heavy
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--runs", type=int, default=5)
+  parser.add_argument("--channels", type=int, default=1000)
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as tmp:
+    root = Path(tmp)
+    addon_dir = make_addon_dir(root)
+    store_path, playlist_url = seed_cache(root, addon_dir, args.channels)
+    paths = {"addon": addon_dir, "profile": root / "profile", "store": store_path}
+    modes = {
+      "list_providers": "",
+      "list_channels": "?" + urlencode({"mode": "list_channels", "url": playlist_url}),
+      "play": "?" + urlencode({
+        "mode": "play", "provider_url": playlist_url, "channel_title": "Channel 1"}),
+    }
+
+    print(f"{'mode':<16}{'imports (ms)':>14}{'eager (ms)':>14}{'wall (ms)':>12}  heavy modules")
+    for mode, query in modes.items():
+      lazy_runs = [run_mode(query, False, paths) for _ in range(args.runs)]
+      eager_runs = [run_mode(query, True, paths) for _ in range(args.runs)]
+      print(
+        f"{mode:<16}"
+        f"{statistics.median(r[0] for r in lazy_runs):>14.1f}"
+        f"{statistics.median(r[0] for r in eager_runs):>14.1f}"
+        f"{statistics.median(r[1] for r in lazy_runs):>12.1f}"
+        f"  {', '.join(lazy_runs[-1][2]) or '-'}"
+      )
+
+
+if __name__ == "__main__":
+  main()
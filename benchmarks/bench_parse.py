@@ -0,0 +1,162 @@
+"""
+  Throughput of the M3U parsers.
+
+  Parses synthetic playlists, with and without DRM directives, with the line
+  parser (iter_m3u) and the batch parser (iter_m3u_batch), both from the
+  whole text and from 64KiB UTF-8 chunks as a streamed download delivers
+  them. Reports MB/s of each (best of --repeat runs) and checks that both
+  parsers give the same channels, on these playlists and on malformed
+  entries built to make regexes backtrack, each parsed within
+  MALFORMED_TIME_LIMIT.
+
+  Then checks every parser against the original parse_m3u (kept in
+  baseline_m3u_parser.py) on golden/corpus.m3u and on --random playlists
+  made of its lines, comparing the fields the original had.
+
+  Usage:
+    python benchmarks/bench_parse.py [--channels 100000] [--repeat 3] [--random 2000]
+"""
+import sys
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+
+import kodi_stubs  # noqa: E402
+import fixtures  # noqa: E402
+import baseline_m3u_parser  # noqa: E402
+
+CORPUS_PATH = BENCH_DIR / "golden" / "corpus.m3u"
+BASELINE_FIELDS = tuple(baseline_m3u_parser.PlaylistItem().__dict__)
+CHUNK_SIZE = 64 * 1024
+MALFORMED_TIME_LIMIT = 0.5  # Seconds, linear parsing takes milliseconds
+# Entries a provider could serve by mistake, long enough for any regex
+# backtracking more than linearly to show
+MALFORMED_CASES = {
+  "attributes without title": "#EXTINF:-1" + ' tvg-logo="x"' * 24 + "\nhttp://u\n",
+  "many attributes without title": "#EXTINF:-1" + ' group-title="g" tvg-logo="x" a="b"' * 2000
+                                   + "\nhttp://u\n",
+  "whitespace without title": "#EXTINF:-1" + " " * 10000 + 'a="b"\nhttp://u\n',
+  "spaced attributes": "#EXTINF:-1" + '  a="b"  ' * 2000 + "\nhttp://u\n",
+  "long attribute name": "#EXTINF:-1 " + "a" * 20000 + "\nhttp://u\n",
+  "equal signs in title": "#EXTINF:-1," + "a=" * 10000 + "\nhttp://u\n",
+  "unterminated quote": "#EXTINF:-1" + ' a="b' * 2000 + ",T\nhttp://u\n",
+  "comments only": "#comment\n" * 20000 + "#EXTINF:-1,T\n",
+  "repeated #EXTINF": '#EXTINF:-1 tvg-logo="x",T\n' * 5000 + "http://u\n",
+}
+
+
+def _best_time(run, repeat: int) -> tuple[list, float]:
+  """
+  :return: Tuple (channels as lists, best wall time in seconds)
+  """
+  best = float("inf")
+  for _ in range(repeat):
+    started = time.perf_counter()
+    items = list(run())
+    best = min(best, time.perf_counter() - started)
+  return [item.to_list() for item in items], best
+
+
+def _baseline_fields(items) -> list[tuple]:
+  return [tuple(getattr(item, field) for field in BASELINE_FIELDS) for item in items]
+
+
+def check_baseline(parsers: dict, content: str, rnd: random.Random) -> list[str]:
+  """
+  Names of the parsers giving other channels than the original parse_m3u,
+  the batch ones fed chunks of random size.
+  """
+  expected = _baseline_fields(baseline_m3u_parser.parse_m3u(content))
+  data = content.encode("utf-8")
+  size = rnd.randint(1, max(1, len(data)))
+  chunks = [data[i:i + size] for i in range(0, len(data), size)]
+  return [name for name, parse in parsers.items()
+          if _baseline_fields(parse(content, chunks)) != expected]
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--channels", type=int, default=100000)
+  parser.add_argument("--repeat", type=int, default=3)
+  parser.add_argument("--random", type=int, default=2000, help="Random playlists checked")
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as tmp:
+    root = Path(tmp)
+    kodi_stubs.install(fixtures.make_addon_dir(root), root / "profile")
+    from lib.m3u_parser import iter_m3u, iter_m3u_batch, parse_m3u
+
+    failures = []
+    for drm in (False, True):
+      content = fixtures.synthetic_m3u(args.channels, drm=drm)
+      data = content.encode("utf-8")
+      chunks = [data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+      size_mb = len(data) / (1024 * 1024)
+      label = "with DRM" if drm else "plain"
+      print(f"{args.channels} channels {label} ({size_mb:.1f}MB)")
+
+      results = {}
+      for name, run in (
+        ("line, text", lambda: iter_m3u(content)),
+        ("line, chunks", lambda: iter_m3u(chunks)),
+        ("batch, text", lambda: iter_m3u_batch(content)),
+        ("batch, chunks", lambda: iter_m3u_batch(chunks)),
+      ):
+        results[name], elapsed = _best_time(run, args.repeat)
+        print(f"  {name:>14}: {elapsed * 1000:8.1f}ms {size_mb / elapsed:7.1f}MB/s")
+
+      expected = results["line, text"]
+      if len(expected) != args.channels:
+        failures.append(f"{label}: {len(expected)} channels parsed, expected {args.channels}")
+      for name, channels in results.items():
+        if channels != expected:
+          failures.append(f"{label}: {name} differs from the line parser")
+
+    for name, content in MALFORMED_CASES.items():
+      expected = [item.to_list() for item in iter_m3u(content)]
+      started = time.perf_counter()
+      channels = [item.to_list() for item in iter_m3u_batch(content)]
+      elapsed = time.perf_counter() - started
+      if channels != expected:
+        failures.append(f"Malformed entry, {name}: batch parser differs from the line parser")
+      if elapsed > MALFORMED_TIME_LIMIT:
+        failures.append(f"Malformed entry, {name}: parsed in {elapsed:.2f}s")
+    print(f"{len(MALFORMED_CASES)} malformed entries checked")
+
+    parsers = {
+      "parse_m3u": lambda content, chunks: parse_m3u(content),
+      "line": lambda content, chunks: iter_m3u(content),
+      "batch, chunks": lambda content, chunks: iter_m3u_batch(chunks),
+    }
+    rnd = random.Random(0)
+    corpus = CORPUS_PATH.read_text(encoding="utf-8")
+    for line_break in ("\n", "\r\n"):
+      content = corpus.replace("\n", line_break)
+      for name in check_baseline(parsers, content, rnd):
+        failures.append(f"Corpus ({line_break!r}): {name} differs from the original parser")
+    lines = corpus.splitlines()
+    mismatches = 0
+    for _ in range(args.random):
+      line_break = rnd.choice(("\n", "\r\n"))
+      content = line_break.join(rnd.choices(lines, k=rnd.randint(0, 40)))
+      content += rnd.choice(("", line_break))
+      if check_baseline(parsers, content, rnd):
+        mismatches += 1
+        if mismatches == 1:
+          failures.append(f"Random playlist differs from the original parser: {content!r}")
+    if mismatches:
+      failures.append(f"{mismatches}/{args.random} random playlists differ from the original parser")
+    print(f"Corpus and {args.random} random playlists checked against the original parser")
+
+  for failure in failures:
+    print(f"FAIL: {failure}")
+  sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+  main()
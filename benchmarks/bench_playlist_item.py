@@ -0,0 +1,110 @@
+"""
+  Memory and serialization of channels, dict-based against positional.
+
+  Parses a synthetic playlist into the original dict-based PlaylistItem
+  (baseline_m3u_parser.py) and into the current slotted one, and reports the
+  memory the channels keep, then the time to serialize and deserialize them
+  in the cache format of each: JSON objects through to_dict/from_dict for
+  the original, JSON lists through to_list/from_list and the channel file
+  for the current one (best of --repeat runs). Checks that every round trip
+  gives the channels back.
+
+  Usage:
+    python benchmarks/bench_playlist_item.py [--channels 100000] [--repeat 3]
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+
+import kodi_stubs  # noqa: E402
+import fixtures  # noqa: E402
+import baseline_m3u_parser  # noqa: E402
+
+
+def retained_memory(parse, content: str) -> tuple[list, int]:
+  """
+  :return: Tuple (channels, bytes allocated by parsing still in use)
+  """
+  tracemalloc.start()
+  channels = parse(content)
+  retained, _ = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return channels, retained
+
+
+def best_time(run, repeat: int) -> tuple[object, float]:
+  """
+  :return: Tuple (result of the last run, best wall time in seconds)
+  """
+  best = float("inf")
+  for _ in range(repeat):
+    started = time.perf_counter()
+    result = run()
+    best = min(best, time.perf_counter() - started)
+  return result, best
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--channels", type=int, default=100000)
+  parser.add_argument("--repeat", type=int, default=3)
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as tmp:
+    root = Path(tmp)
+    kodi_stubs.install(fixtures.make_addon_dir(root), root / "profile")
+    from lib.m3u_parser import PlaylistItem, parse_m3u
+    from lib.channel_store import ChannelFile, write_channel_file
+
+    content = fixtures.synthetic_m3u(args.channels)
+    old_channels, old_memory = retained_memory(baseline_m3u_parser.parse_m3u, content)
+    new_channels, new_memory = retained_memory(parse_m3u, content)
+    print(f"{args.channels} channels kept in memory")
+    for name, memory in (("dict-based", old_memory), ("positional", new_memory)):
+      print(f"  {name:>10}: {memory / (1024 * 1024):7.1f}MB {memory / args.channels:6.0f} bytes per channel")
+
+    failures = []
+    file_path = root / "channels.bin"
+
+    def load_channel_file():
+      with ChannelFile(file_path) as channel_file:
+        return [PlaylistItem.from_list(values) for values in channel_file.records()]
+
+    formats = (
+      ("dict JSON",
+       lambda: json.dumps(old_channels, default=lambda o: o.to_dict()),
+       lambda data: [baseline_m3u_parser.PlaylistItem.from_dict(item) for item in json.loads(data)],
+       lambda channels: [ch.to_dict() for ch in channels] == [ch.to_dict() for ch in old_channels]),
+      ("list JSON",
+       lambda: json.dumps([ch.to_list() for ch in new_channels], separators=(',', ':')),
+       lambda data: [PlaylistItem.from_list(values) for values in json.loads(data)],
+       lambda channels: [ch.to_list() for ch in channels] == [ch.to_list() for ch in new_channels]),
+      ("channel file",
+       lambda: write_channel_file(file_path, [ch.to_list() for ch in new_channels]),
+       lambda size: load_channel_file(),
+       lambda channels: [ch.to_list() for ch in channels] == [ch.to_list() for ch in new_channels]),
+    )
+    print(f"{'format':>14} {'size (MB)':>10} {'serialize':>10} {'deserialize':>12}")
+    for name, serialize, deserialize, same in formats:
+      data, serialize_time = best_time(serialize, args.repeat)
+      size = data if isinstance(data, int) else len(data.encode("utf-8"))
+      channels, deserialize_time = best_time(lambda: deserialize(data), args.repeat)
+      print(f"{name:>14} {size / (1024 * 1024):10.1f} {serialize_time * 1000:8.1f}ms "
+            f"{deserialize_time * 1000:10.1f}ms")
+      if not same(channels):
+        failures.append(f"{name}: channels differ after a round trip")
+
+  for failure in failures:
+    print(f"FAIL: {failure}")
+  sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+  main()
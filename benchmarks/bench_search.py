@@ -0,0 +1,114 @@
+"""
+  Channel search across many providers' indexes.
+
+  Indexes --providers playlists of --channels channels each, titled with
+  words drawn from a shared vocabulary, then times search_channels the way
+  the plugin runs it: once per invocation, every index opened anew. Checks
+  the results of every query against a scan of all the channels, and the
+  median query time against SEARCH_TIME_LIMIT.
+
+  Usage:
+    python benchmarks/bench_search.py [--providers 50] [--channels 5000]
+"""
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+
+import kodi_stubs  # noqa: E402
+import fixtures  # noqa: E402
+
+SEARCH_TIME_LIMIT = 0.05  # Seconds, median of the queries
+WORDS = 2000  # Shared by the titles of all providers
+QUERIES = ("sports", "news hd", "s", "ch 12", "zz", "movies 4k", "a b", "cricket live")
+
+
+def synthetic_channel_lists(rnd: random.Random, words: list[str], channels: int) -> list[list]:
+  """
+  Channels in their positional form, titles of 1 to 3 words and a number.
+  """
+  return [[f"{' '.join(rnd.choices(words, k=rnd.randint(1, 3)))} {rnd.randint(1, 99)}",
+           f"https://cdn.example.com/{i}.m3u8",
+           f"https://logo.example.com/{i % 200}.png",
+           f"{rnd.choice(words).title()} {i % 25}"]
+          for i in range(channels)]
+
+
+def scan(tokenize, providers: list[tuple[str, list[list]]], query: str) -> list[tuple]:
+  """
+  Reference results, matching every channel's words in turn.
+  """
+  query_tokens = tokenize(query)
+  query_prefix = query.strip().casefold()
+  results = []
+  for url, channel_lists in providers:
+    for title, _, logo, group_title in channel_lists:
+      words = tokenize(title) + tokenize(group_title)
+      if all(any(word.startswith(token) for word in words) for token in query_tokens):
+        results.append((url, title, logo, group_title))
+  results.sort(key=lambda result: not result[1].casefold().startswith(query_prefix))
+  return results
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--providers", type=int, default=50)
+  parser.add_argument("--channels", type=int, default=5000)
+  parser.add_argument("--repeat", type=int, default=5)
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as tmp:
+    root = Path(tmp)
+    kodi_stubs.install(fixtures.make_addon_dir(root), root / "profile")
+    from lib.search import (
+      SEARCH_INDEX_DIR, SEARCH_MAX_RESULTS, search_channels, tokenize, update_search_index)
+
+    rnd = random.Random(0)
+    words = sorted({"sports", "news", "hd", "movies", "4k", "cricket", "live", "ch"}
+                   | {"".join(rnd.choices("abcdefghijklmnopqrstuvwxyz", k=rnd.randint(3, 9)))
+                      for _ in range(WORDS)})
+    providers = []
+    started = time.perf_counter()
+    for p in range(args.providers):
+      url = f"https://provider{p}.example.com/playlist.m3u"
+      channel_lists = synthetic_channel_lists(rnd, words, args.channels)
+      update_search_index(f"{p:016x}", url, channel_lists)
+      providers.append((url, channel_lists))
+    size_mb = sum(path.stat().st_size for path in SEARCH_INDEX_DIR.iterdir()) / (1024 * 1024)
+    print(f"{args.providers} providers x {args.channels} channels indexed in "
+          f"{time.perf_counter() - started:.1f}s ({size_mb:.1f}MB)")
+
+    failures = []
+    medians = []
+    for query in QUERIES:
+      timings = []
+      for _ in range(args.repeat):
+        started = time.perf_counter()
+        results = search_channels(query)
+        timings.append(time.perf_counter() - started)
+      median = statistics.median(timings)
+      medians.append(median)
+      found = [(url, ch.title, ch.tvg_logo, ch.group_title) for url, ch in results]
+      expected = scan(tokenize, providers, query)
+      print(f"  {query!r:>16}: {median * 1000:7.1f}ms {len(expected):6d} matches")
+      if found != expected[:SEARCH_MAX_RESULTS]:
+        failures.append(f"{query!r}: results differ from a scan of the channels")
+
+    overall = statistics.median(medians)
+    print(f"Median query: {overall * 1000:.1f}ms")
+    if overall > SEARCH_TIME_LIMIT:
+      failures.append(f"Median query took {overall * 1000:.1f}ms")
+
+  for failure in failures:
+    print(f"FAIL: {failure}")
+  sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,91 @@
+"""
+  Peak memory of downloading and decrypting a provider playlist.
+
+  Serves encrypted playlists of growing sizes from a local server and reads
+  each one to its last line twice: buffered (response text, then
+  decrypt_content) and streamed (fetch_url_streamed, then
+  iter_content_chunks). Reports the peak Python allocations of both, which
+  grow with the playlist for the first and stay flat for the second, and
+  checks that both give the same lines.
+
+  Usage:
+    python benchmarks/bench_streaming.py [--sizes 1000,10000,100000]
+"""
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+
+import kodi_stubs  # noqa: E402
+import fixtures  # noqa: E402
+from provider_server import ProviderServer  # noqa: E402
+
+
+def _measure(run) -> tuple[object, float, float]:
+  """
+  :return: Tuple (result, wall time in ms, peak allocations in MB)
+  """
+  tracemalloc.start()
+  started = time.perf_counter()
+  result = run()
+  elapsed = (time.perf_counter() - started) * 1000
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return result, elapsed, peak / (1024 * 1024)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--sizes", default="1000,10000,100000", help="Channels per playlist")
+  args = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as tmp, ProviderServer() as server:
+    root = Path(tmp)
+    kodi_stubs.install(fixtures.make_addon_dir(root), root / "profile")
+    from lib.req import fetch_url, fetch_url_streamed
+    from lib.crypto_utils import decrypt_content, iter_content_chunks
+    from lib.m3u_parser import _iter_lines
+
+    def buffered(url):
+      digest = 0
+      for line in decrypt_content(fetch_url(url)).splitlines():
+        digest = hash((digest, line))
+      return digest
+
+    def streamed(url):
+      digest = 0
+      response = fetch_url_streamed(url)
+      with response.body:
+        for line in _iter_lines(iter_content_chunks(response.body)):
+          digest = hash((digest, line))
+      return digest
+
+    failures = []
+    print(f"{'channels':>9} {'payload (MB)':>13} {'buffered (ms)':>14} {'peak (MB)':>10} "
+          f"{'streamed (ms)':>14} {'peak (MB)':>10}")
+    for size in (int(s) for s in args.sizes.split(",")):
+      payload = fixtures.encrypt_content(fixtures.synthetic_m3u(size), seed=size)
+      url = server.add(f"/provider-{size}.m3u", payload)
+      # Warms the connection and imports
+      streamed(url)
+
+      expected, buffered_ms, buffered_peak = _measure(lambda: buffered(url))
+      result, streamed_ms, streamed_peak = _measure(lambda: streamed(url))
+      if result != expected:
+        failures.append(f"{size} channels: streamed lines differ from buffered ones")
+      print(f"{size:>9} {len(payload) / (1024 * 1024):>13.2f} {buffered_ms:>14.1f} "
+            f"{buffered_peak:>10.2f} {streamed_ms:>14.1f} {streamed_peak:>10.2f}")
+      del payload
+
+  for failure in failures:
+    print(f"FAIL: {failure}")
+  sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+  main()
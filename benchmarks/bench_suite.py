@@ -0,0 +1,378 @@
+"""
+  Offline benchmark suite of the plugin's hot paths.
+
+  Every (stage, size) pair runs in its own interpreter against stub Kodi
+  modules, an in-memory StorageServer and a local HTTP stand-in serving
+  synthetic encrypted cats.txt and M3U payloads. For each it reports the
+  median wall time (also per item of the payload), the peak of traced Python
+  allocations and the peak RSS of the process.
+
+  Usage:
+    python benchmarks/bench_suite.py [--sizes 100,1000,...] [--stages a,b]
+    python benchmarks/bench_suite.py --backend sqlite
+    python benchmarks/bench_suite.py --save baseline.json
+    python benchmarks/bench_suite.py --compare baseline.json
+"""
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import threading
+import tracemalloc
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+
+import kodi_stubs  # noqa: E402
+import fixtures  # noqa: E402
+from provider_server import ProviderServer  # noqa: E402
+
+try:
+  import resource
+except ImportError:  # Windows
+  resource = None
+
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+DEFAULT_REPEATS = 5
+REGRESSION_THRESHOLD = 1.2  # Wall time ratio against the baseline
+REGRESSION_MIN_MS = 1.0  # Smaller slowdowns are timer noise
+
+
+class Context:
+  """
+  Plugin and payloads of a single stage run.
+  """
+
+  def __init__(self, root: Path, size: int, server: ProviderServer, backend: str):
+    self.size = size
+    self.server = server
+    self.addon_dir = fixtures.make_addon_dir(root)
+    self.profile_dir = root / "profile"
+    kodi_stubs.install(self.addon_dir, self.profile_dir,
+                       storage_server=backend == "memory")
+    sys.argv = ["plugin://plugin.video.cricfy/", "1", ""]
+
+    self.m3u = fixtures.synthetic_m3u(size)
+    self.encrypted_m3u = fixtures.encrypt_content(self.m3u)
+    self.provider_url = server.add("/provider.m3u", self.encrypted_m3u)
+    self.cats = fixtures.encrypt_data(
+      json.dumps(fixtures.synthetic_providers(size, server.base_url)))
+    # Probed by playback, in the middle of the playlist
+    self.channel_title = f"Channel {size // 2}"
+    self._main = None
+
+  @property
+  def main(self) -> dict:
+    """
+    Globals of the plugin's main.py, loaded like Kodi would.
+    """
+    if self._main is None:
+      import runpy
+      self._main = runpy.run_path(str(kodi_stubs.PLUGIN_DIR / "main.py"))
+    return self._main
+
+  def clear_cache(self):
+    from lib.config import cache
+    cache.delete("%")
+
+
+def _stage_parse_m3u(ctx):
+  from lib.m3u_parser import parse_m3u
+  return None, lambda: parse_m3u(ctx.m3u)
+
+
+def _stage_decrypt_content(ctx):
+  from lib.crypto_utils import decrypt_content
+  return None, lambda: decrypt_content(ctx.encrypted_m3u)
+
+
+def _stage_decrypt_data(ctx):
+  from lib.crypto_utils import decrypt_data
+  return None, lambda: decrypt_data(ctx.cats)
+
+
+def _seed_providers(ctx):
+  """
+  Serves cats.txt and points the cached remote config at it.
+  """
+  ctx.server.add("/cats.txt", ctx.cats)
+  ctx.profile_dir.mkdir(parents=True, exist_ok=True)
+  (ctx.profile_dir / "remote_config.json").write_text(json.dumps({
+    "entries": {"cric_api2": ctx.server.base_url},
+    "fetch_time": time.time(),
+  }), encoding="utf-8")
+
+
+def _stage_get_providers_cold(ctx):
+  from lib.providers import get_providers, PROVIDERS_MEMO_FILE_PATH
+  _seed_providers(ctx)
+
+  def before():
+    ctx.clear_cache()
+    PROVIDERS_MEMO_FILE_PATH.unlink(missing_ok=True)
+  return before, get_providers
+
+
+def _stage_get_providers_memo(ctx):
+  from lib.providers import get_providers
+  _seed_providers(ctx)
+  get_providers()
+  return ctx.clear_cache, get_providers
+
+
+def _stage_serialize_channels(ctx):
+  from lib.m3u_parser import parse_m3u
+  from lib.channel_store import build_channel_file
+  channels = parse_m3u(ctx.m3u)
+  return None, lambda: build_channel_file([ch.to_list() for ch in channels])
+
+
+def _channel_file(ctx):
+  from lib.m3u_parser import parse_m3u
+  from lib.channel_store import write_channel_file
+  path = ctx.profile_dir / "bench.bin"
+  write_channel_file(path, [ch.to_list() for ch in parse_m3u(ctx.m3u)])
+  return path
+
+
+def _stage_load_channels(ctx):
+  from lib.m3u_parser import PlaylistItem
+  from lib.channel_store import ChannelFile
+  path = _channel_file(ctx)
+
+  def run():
+    with ChannelFile(path) as channel_file:
+      return [PlaylistItem.from_list(values) for values in channel_file.records()]
+  return None, run
+
+
+def _stage_load_summaries(ctx):
+  from lib.channel_store import ChannelFile
+  path = _channel_file(ctx)
+
+  def run():
+    with ChannelFile(path) as channel_file:
+      return channel_file.summaries()
+  return None, run
+
+
+def _stage_load_group(ctx):
+  from lib.channel_store import ChannelFile
+  path = _channel_file(ctx)
+  with ChannelFile(path) as channel_file:
+    group_title = channel_file.groups()[0][0]
+
+  def run():
+    with ChannelFile(path) as channel_file:
+      return channel_file.summaries(group_title)
+  return None, run
+
+
+def _stage_find_channel(ctx):
+  from lib.channel_store import ChannelFile
+  path = _channel_file(ctx)
+
+  def run():
+    with ChannelFile(path) as channel_file:
+      return channel_file.find(ctx.channel_title)
+  return None, run
+
+
+def _stage_get_channels_cold(ctx):
+  from lib.providers import get_channels
+  return ctx.clear_cache, lambda: get_channels(ctx.provider_url)
+
+
+def _stage_get_channels_warm(ctx):
+  from lib.providers import get_channels
+  get_channels(ctx.provider_url)
+  return None, lambda: get_channels(ctx.provider_url)
+
+
+def _stage_list_channels(ctx):
+  import xbmcplugin
+  from lib.providers import get_channels
+  get_channels(ctx.provider_url)
+  list_channels = ctx.main["list_channels"]
+  return xbmcplugin.directory["items"].clear, lambda: list_channels(ctx.provider_url)
+
+
+def _stage_render_channels(ctx):
+  from lib.providers import get_channels
+  channels = get_channels(ctx.provider_url)
+  channel_items = ctx.main["channel_items"]
+  return None, lambda: channel_items(ctx.provider_url, channels)
+
+
+def _stage_search_channels(ctx):
+  from lib.providers import get_channels
+  from lib.search import search_channels
+  get_channels(ctx.provider_url)
+  # The index is written in background once the channels are stored
+  for thread in threading.enumerate():
+    if thread.name == "cricfy-search-index":
+      thread.join()
+  return None, lambda: search_channels("channel 12")
+
+
+def _stage_play_video(ctx):
+  from lib.providers import get_channels
+  get_channels(ctx.provider_url)
+  play_video = ctx.main["play_video"]
+  return None, lambda: play_video(ctx.provider_url, ctx.channel_title)
+
+
+# name: setup(ctx) -> (before each run or None, run)
+STAGES = {
+  "parse_m3u": _stage_parse_m3u,
+  "decrypt_content": _stage_decrypt_content,
+  "decrypt_data": _stage_decrypt_data,
+  "get_providers_cold": _stage_get_providers_cold,
+  "get_providers_memo": _stage_get_providers_memo,
+  "serialize_channels": _stage_serialize_channels,
+  "load_channels": _stage_load_channels,
+  "load_summaries": _stage_load_summaries,
+  "load_group": _stage_load_group,
+  "find_channel": _stage_find_channel,
+  "get_channels_cold": _stage_get_channels_cold,
+  "get_channels_warm": _stage_get_channels_warm,
+  "list_channels": _stage_list_channels,
+  "render_channels": _stage_render_channels,
+  "search_channels": _stage_search_channels,
+  "play_video": _stage_play_video,
+}
+
+
+def _peak_rss_mb() -> float:
+  if resource is None:
+    return 0.0
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Kilobytes on Linux, bytes on macOS
+  return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_stage(stage: str, size: int, repeats: int, backend: str) -> dict:
+  """
+  Runs one stage in this process.
+  """
+  with tempfile.TemporaryDirectory() as tmp, ProviderServer() as server:
+    ctx = Context(Path(tmp), size, server, backend)
+    before, run = STAGES[stage](ctx)
+    rss_before = _peak_rss_mb()
+
+    timings = []
+    for _ in range(repeats):
+      if before:
+        before()
+      started = time.perf_counter()
+      run()
+      timings.append(time.perf_counter() - started)
+
+    # Separate run, tracing allocations slows everything down
+    if before:
+      before()
+    tracemalloc.start()
+    run()
+    _, alloc_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+      "stage": stage,
+      "size": size,
+      "wall_ms": statistics.median(timings) * 1000,
+      "alloc_peak_mb": alloc_peak / (1024 * 1024),
+      "rss_peak_mb": _peak_rss_mb(),
+      "rss_before_mb": rss_before,
+    }
+
+
+def run_isolated(stage: str, size: int, repeats: int, backend: str) -> dict:
+  """
+  Runs one stage in a fresh interpreter, so RSS peaks don't add up.
+  """
+  result = subprocess.run(
+    [sys.executable, __file__, "--child", stage, str(size), str(repeats), backend],
+    capture_output=True, text=True,
+  )
+  if result.returncode != 0:
+    raise RuntimeError(f"{stage}/{size} failed:\n{result.stderr}")
+  return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def compare(results: list[dict], baseline: dict, threshold: float) -> list[str]:
+  previous = {(r["stage"], r["size"]): r for r in baseline["results"]}
+  regressions = []
+  print(f"\nAgainst baseline of {baseline.get('created', '?')}:")
+  for r in results:
+    old = previous.get((r["stage"], r["size"]))
+    if not old or not old["wall_ms"]:
+      continue
+    ratio = r["wall_ms"] / old["wall_ms"]
+    flag = ""
+    if ratio > threshold and r["wall_ms"] - old["wall_ms"] > REGRESSION_MIN_MS:
+      flag = "  REGRESSION"
+      regressions.append(f"{r['stage']}/{r['size']}")
+    print(f"{r['stage']:<20}{r['size']:>8}{old['wall_ms']:>12.2f} -> {r['wall_ms']:>10.2f} ms"
+          f"  x{ratio:.2f}{flag}")
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+  parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)))
+  parser.add_argument("--stages", default=",".join(STAGES))
+  parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+  parser.add_argument("--save", metavar="JSON", help="Write the results as a baseline")
+  parser.add_argument("--compare", metavar="JSON", help="Compare against a saved baseline")
+  parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+  parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory",
+                      help="Cache backend: stub StorageServer or the built-in SQLite cache")
+  parser.add_argument("--child", nargs=4, metavar=("STAGE", "SIZE", "REPEATS", "BACKEND"),
+                      help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.child:
+    stage, size, repeats, backend = args.child
+    print(json.dumps(run_stage(stage, int(size), int(repeats), backend)))
+    return
+
+  sizes = [int(size) for size in args.sizes.split(",")]
+  stages = args.stages.split(",")
+  unknown = set(stages) - set(STAGES)
+  if unknown:
+    parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+  results = []
+  print(f"{'stage':<20}{'size':>8}{'wall (ms)':>12}{'per item (us)':>15}"
+        f"{'alloc (MB)':>12}{'rss (MB)':>10}")
+  for stage in stages:
+    for size in sizes:
+      r = run_isolated(stage, size, args.repeats, args.backend)
+      results.append(r)
+      print(f"{stage:<20}{size:>8}{r['wall_ms']:>12.2f}{r['wall_ms'] * 1000 / size:>15.2f}"
+            f"{r['alloc_peak_mb']:>12.2f}{r['rss_peak_mb']:>10.1f}")
+
+  if args.save:
+    Path(args.save).write_text(json.dumps({
+      "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+      "python": platform.python_version(),
+      "platform": platform.platform(),
+      "results": results,
+    }, indent=2), encoding="utf-8")
+    print(f"\nBaseline saved to {args.save}")
+
+  if args.compare:
+    baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+      print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+      sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,99 @@
+"""
+  Synthetic addon resources and provider payloads for the benchmarks.
+"""
+import json
+import base64
+import random
+from pathlib import Path
+from Cryptodome.Cipher import AES
+from Cryptodome.Util.Padding import pad
+
+# The provider list is encrypted with the second key, so decrypt_data also
+# pays for rejecting the first one
+SECRET1 = "00112233445566778899aabbccddeeff:0102030405060708090a0b0c0d0e0f10"
+SECRET2 = "ffeeddccbbaa99887766554433221100:100f0e0d0c0b0a090807060504030201"
+
+
+def make_addon_dir(root: Path) -> Path:
+  """
+  Addon directory with the resources the plugin reads.
+  """
+  resources = root / "addon" / "resources"
+  resources.mkdir(parents=True, exist_ok=True)
+  (resources / "secret1.txt").write_text(SECRET1, encoding="utf-8")
+  (resources / "secret2.txt").write_text(SECRET2, encoding="utf-8")
+  (resources / "cricfy_properties.json").write_text(json.dumps({
+    "cricfy_firebase_api_key": "benchmark",
+    "cricfy_firebase_app_id": "1:000000000000:android:benchmark",
+    "cricfy_package_name": "benchmark",
+  }), encoding="utf-8")
+  return root / "addon"
+
+
+def synthetic_m3u(channels: int, seed: int = 0, drm: bool = True) -> str:
+  """
+  Playlist shaped like the providers' ones: shared groups, logos and user
+  agents, and (with drm) a share of entries with #KODIPROP, #EXTVLCOPT,
+  #EXTHTTP directives and pipe separated headers.
+  """
+  rnd = random.Random(seed)
+  lines = ["#EXTM3U"]
+  for i in range(channels):
+    if drm:
+      if i % 7 == 0:
+        lines.append("#KODIPROP:inputstream.adaptive.license_type=clearkey")
+        lines.append(
+          "#KODIPROP:inputstream.adaptive.license_key="
+          f"{rnd.getrandbits(128):032x}:{rnd.getrandbits(128):032x}")
+      if i % 5 == 0:
+        lines.append(f"#EXTVLCOPT:http-user-agent=Mozilla/5.0 Player/{i % 3}")
+        lines.append(f"#EXTVLCOPT:http-referrer=https://ref{i % 4}.example.com/")
+      if i % 11 == 0:
+        lines.append(f'#EXTHTTP:{{"cookie":"session={rnd.getrandbits(64):x}"}}')
+    lines.append(
+      f'#EXTINF:-1 tvg-id="ch{i}" tvg-logo="https://logo.example.com/{i % 200}.png" '
+      f'group-title="Group {i % 25}",Channel {i}')
+    extension = "mpd" if i % 3 == 0 else "m3u8"
+    url = f"https://cdn{i % 9}.example.com/live/{i}/index.{extension}"
+    if drm and i % 4 == 0:
+      url += f"|User-Agent=Player/{i % 2}&Referer=https://r.example.com/&X-Token={i}"
+    lines.append(url)
+  return "\n".join(lines) + "\n"
+
+
+def synthetic_providers(providers: int, base_url: str) -> list[dict]:
+  return [
+    {
+      "title": f"Provider {i}",
+      "image": f"https://img.example.com/{i}.png",
+      "catLink": f"{base_url}/provider{i}.m3u",
+    }
+    for i in range(providers)
+  ]
+
+
+def _encrypt(data: bytes, key: bytes, iv: bytes) -> str:
+  return base64.b64encode(
+    AES.new(key, AES.MODE_CBC, iv).encrypt(pad(data, AES.block_size))).decode()
+
+
+def encrypt_data(text: str, secret: str = SECRET2) -> str:
+  """
+  Encrypts like cats.txt, for lib.crypto_utils.decrypt_data.
+  """
+  key_hex, iv_hex = secret.split(":")
+  return _encrypt(text.encode(), bytes.fromhex(key_hex), bytes.fromhex(iv_hex))
+
+
+def encrypt_content(text: str, seed: int = 0) -> str:
+  """
+  Encrypts like the providers' playlists, for lib.crypto_utils.decrypt_content:
+  the base64 IV and key are embedded in the base64 ciphertext.
+  """
+  rnd = random.Random(seed)
+  key = rnd.randbytes(32)
+  iv = rnd.randbytes(16)
+  encrypted = _encrypt(text.encode(), key, iv)
+  iv_base64 = base64.b64encode(iv).decode()
+  key_base64 = base64.b64encode(key).decode()
+  return encrypted[:10] + iv_base64 + encrypted[10:-10] + key_base64 + encrypted[-10:]
@@ -0,0 +1,230 @@
+"""
+  Stand-ins for the Kodi Python API (xbmc, xbmcaddon, xbmcgui, xbmcplugin,
+  xbmcvfs) and for script.common.plugin.cache's StorageServer, so that the
+  plugin can be imported and driven outside of Kodi.
+
+  install() must run before anything from the plugin is imported.
+"""
+import os
+import sys
+import json
+import types
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+PLUGIN_DIR = REPO_DIR / "plugin.video.cricfy"
+
+
+class MemoryStorageServer:
+  """
+  In-memory StorageServer. Entries can be loaded from / saved to a JSON file
+  to share a warm cache with child processes.
+  """
+  store: dict = {}
+
+  def __init__(self, table, timeout=24):
+    pass
+
+  def set(self, name, data):
+    MemoryStorageServer.store[name] = data
+
+  def get(self, name):
+    return MemoryStorageServer.store.get(name, "")
+
+  def delete(self, name):
+    if name == "%":
+      MemoryStorageServer.store.clear()
+    else:
+      MemoryStorageServer.store.pop(name, None)
+
+  def lock(self, name):
+    return False
+
+  def unlock(self, name):
+    return False
+
+  @staticmethod
+  def load(path):
+    MemoryStorageServer.store = json.loads(Path(path).read_text(encoding="utf-8"))
+
+  @staticmethod
+  def save(path):
+    Path(path).write_text(json.dumps(MemoryStorageServer.store), encoding="utf-8")
+
+
+class InfoTagVideo:
+  """
+  Kodi 19 InfoTagVideo: getters only, labels are set through setInfo.
+  """
+
+  def __init__(self, info):
+    self.info = info
+
+  def getTitle(self):
+    return self.info.get("title", "")
+
+
+class InfoTagVideoSetters(InfoTagVideo):
+  """
+  InfoTagVideo from Kodi 20, with setters.
+  """
+
+  def setTitle(self, title):
+    self.info["title"] = title
+
+  def setGenres(self, genres):
+    self.info["genre"] = genres
+
+  def setPlot(self, plot):
+    self.info["plot"] = plot
+
+
+class ListItem:
+  def __init__(self, label="", label2="", path="", offscreen=False):
+    self.label = label
+    self.path = path
+    self.art = {}
+    self.info = {}
+    self.properties = {}
+    self._info_tag = None
+
+  def getVideoInfoTag(self):
+    if self._info_tag is None:
+      # The InfoTagVideo of the installed API version
+      self._info_tag = sys.modules["xbmc"].InfoTagVideo(self.info)
+    return self._info_tag
+
+  def setArt(self, art):
+    self.art.update(art)
+
+  def setInfo(self, type, infoLabels):
+    self.info.update(infoLabels)
+
+  def setProperty(self, key, value):
+    self.properties[key] = value
+
+  def setPath(self, path):
+    self.path = path
+
+
+class Dialog:
+  def notification(self, heading, message, icon="", time=5000, sound=True):
+    pass
+
+  def input(self, heading, defaultt="", type=0, option=0, autoclose=0):
+    return ""
+
+
+class Monitor:
+  def abortRequested(self):
+    return False
+
+  def waitForAbort(self, timeout=-1):
+    return False
+
+
+class Player:
+  def isPlaying(self):
+    return False
+
+  def isPlayingVideo(self):
+    return False
+
+
+def _module(name, **attrs):
+  module = types.ModuleType(name)
+  module.__dict__.update(attrs)
+  sys.modules[name] = module
+  return module
+
+
+def install(addon_path, profile_path, settings=None, store_path=None, storage_server=True,
+            kodi_version=20):
+  """
+  Registers the stub modules and puts the plugin on sys.path.
+  :param addon_path: Directory holding resources/ (secrets, properties).
+  :param profile_path: Directory used as the addon profile.
+  :param settings: Addon settings by id.
+  :param store_path: JSON file to preload the StorageServer with.
+  :param storage_server: Whether to stub StorageServer, without it the
+    plugin uses its built-in SQLite cache in the profile.
+  :param kodi_version: Major version of the API, InfoTagVideo has no
+    setters before 20.
+  """
+  settings = settings or {}
+  addon_info = {
+    "path": str(addon_path),
+    "profile": str(profile_path),
+    "id": "plugin.video.cricfy",
+  }
+
+  class Addon:
+    def __init__(self, id=None):
+      pass
+
+    def getAddonInfo(self, key):
+      return addon_info.get(key, "")
+
+    def getSetting(self, key):
+      return str(settings.get(key, ""))
+
+    def getSettingBool(self, key):
+      return bool(settings.get(key, False))
+
+    def getSettingInt(self, key):
+      return int(settings.get(key, 0))
+
+  # Collected by the xbmcplugin stub, for the benchmarks to inspect
+  directory = {"items": [], "resolved": None}
+
+  def addDirectoryItem(handle, url, listitem, isFolder=False, totalItems=0):
+    directory["items"].append((url, listitem, isFolder))
+    return True
+
+  def addDirectoryItems(handle, items, totalItems=0):
+    directory["items"].extend(items)
+    return True
+
+  def setResolvedUrl(handle, succeeded, listitem):
+    directory["resolved"] = listitem
+
+  _module(
+    "xbmc",
+    LOGDEBUG=0, LOGINFO=1, LOGWARNING=2, LOGERROR=3,
+    log=lambda msg, level=0: None,
+    InfoTagVideo=InfoTagVideoSetters if kodi_version >= 20 else InfoTagVideo,
+    Monitor=Monitor,
+    Player=Player,
+  )
+  _module("xbmcaddon", Addon=Addon)
+  _module(
+    "xbmcvfs",
+    translatePath=lambda path: path,
+    exists=os.path.exists,
+    mkdirs=lambda path: os.makedirs(path, exist_ok=True) or True,
+  )
+  _module(
+    "xbmcgui",
+    ListItem=ListItem,
+    Dialog=Dialog,
+    NOTIFICATION_INFO="info",
+    NOTIFICATION_WARNING="warning",
+    NOTIFICATION_ERROR="error",
+  )
+  _module(
+    "xbmcplugin",
+    directory=directory,
+    addDirectoryItem=addDirectoryItem,
+    addDirectoryItems=addDirectoryItems,
+    endOfDirectory=lambda handle, succeeded=True, updateListing=False, cacheToDisc=True: None,
+    setResolvedUrl=setResolvedUrl,
+  )
+  if storage_server:
+    _module("StorageServer", StorageServer=MemoryStorageServer)
+  else:
+    sys.modules.pop("StorageServer", None)
+  if store_path:
+    MemoryStorageServer.load(store_path)
+
+  if str(PLUGIN_DIR) not in sys.path:
+    sys.path.insert(0, str(PLUGIN_DIR))
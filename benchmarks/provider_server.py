@@ -0,0 +1,99 @@
+"""
+  Local HTTP stand-in for the provider hosts (cats.txt, M3U playlists).
+"""
+import time
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ProviderServer:
+  """
+  Serves fixed payloads from 127.0.0.1 with keep-alive and ETag support,
+  counting connections, requests and the statuses answered by path. Routes can answer after a delay, and
+  the peak of requests in flight is tracked.
+  """
+
+  def __init__(self):
+    self.routes = {}
+    self.delays = {}
+    self.request_headers = {}
+    self.hits = {}
+    self.statuses = {}
+    self.connections = 0
+    self.requests = 0
+    self.in_flight = 0
+    self.max_in_flight = 0
+    self._lock = threading.Lock()
+    server = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = "HTTP/1.1"
+
+      def setup(self):
+        server.connections += 1
+        super().setup()
+
+      def log_message(self, format, *args):
+        pass
+
+      def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        with server._lock:
+          server.requests += 1
+          server.in_flight += 1
+          server.max_in_flight = max(server.max_in_flight, server.in_flight)
+          server.request_headers[path] = dict(self.headers)
+          server.hits[path] = server.hits.get(path, 0) + 1
+        try:
+          if path in server.delays:
+            time.sleep(server.delays[path])
+          body = server.routes.get(path)
+          if body is None:
+            self._reply(404)
+            return
+          etag = f'"{hashlib.md5(body).hexdigest()}"'
+          if self.headers.get("If-None-Match") == etag:
+            self._reply(304, etag=etag)
+            return
+          self._reply(200, body, etag)
+        finally:
+          with server._lock:
+            server.in_flight -= 1
+
+      def _reply(self, status, body=b"", etag=""):
+        with server._lock:
+          server.statuses.setdefault(self.path.split("?", 1)[0], []).append(status)
+        self.send_response(status)
+        if etag:
+          self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+          self.wfile.write(body)
+
+    self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    self._httpd.daemon_threads = True
+    self.base_url = f"http://127.0.0.1:{self._httpd.server_address[1]}"
+    self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+    self._thread.start()
+
+  def add(self, path: str, body, delay: float = 0) -> str:
+    """
+    Serves body (str or bytes) at path, after delay seconds.
+    :return: The full URL of the payload.
+    """
+    self.routes[path] = body.encode() if isinstance(body, str) else body
+    if delay:
+      self.delays[path] = delay
+    return self.base_url + path
+
+  def close(self):
+    self._httpd.shutdown()
+    self._httpd.server_close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
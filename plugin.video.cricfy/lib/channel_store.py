@@ -0,0 +1,420 @@
+import sys
+import json
+import mmap
+import zlib
+import struct
+from json.encoder import encode_basestring_ascii as _encode_string
+from array import array
+from collections import Counter
+from itertools import accumulate, zip_longest
+from bisect import bisect_left
+from pathlib import Path
+from typing import Iterable, Optional, Union
+from lib.m3u_parser import PlaylistItem
+from lib.files import write_atomic
+
+"""
+  Binary channel file
+  Cached playlists are kept in a columnar file read through mmap, so that
+  a listing only decodes titles, logos and groups, a group folder only
+  those of its channels and playback a single record, without parsing the
+  whole playlist.
+
+  Layout (native byte order, every section 4-byte aligned):
+  - header: magic, version, byte order mark, channel count, string counts
+    and the positions of the sections below
+  - string table: offsets (u32, one more than strings) into UTF-8 data.
+    Every string is followed by a NUL, so bulk reads split it at once.
+    Strings are deduplicated, string 0 is "". Titles, logos and groups come
+    first, so listings decode that prefix only
+  - records: one fixed-width row per channel, a u32 per PlaylistItem field
+    (string ids, is_drm as 0/1, headers and kodi_properties as the id of
+    their JSON) followed by the ids of the path and of the properties JSON
+    of the channel's playback descriptor (lib.playback), path "" when it
+    was stored without one
+  - title lookup: CRC32 of the titles (sorted) and their record numbers
+  - groups: group count, offsets (u32, one more than groups) into the
+    members, group title string ids (in playlist order), then the record
+    numbers of the members of every group in turn
+"""
+
+CHANNEL_FILE_MAGIC = b"CFCH"
+CHANNEL_FILE_VERSION = 6  # Bumped whenever the layout changes, older files are rejected
+BYTE_ORDER_MARK = 0xFEFF  # Reads as 0xFFFE on a machine of the other byte order
+HEADER = struct.Struct("=4sHHIIIIIII")
+
+FIELD_COUNT = len(PlaylistItem.FIELDS)
+PLAYBACK_PATH_COLUMN = FIELD_COUNT  # After the fields
+PLAYBACK_PROPERTIES_COLUMN = FIELD_COUNT + 1
+RECORD_WIDTH = FIELD_COUNT + 2
+TITLE_FIELD = PlaylistItem.FIELDS.index("title")
+TVG_LOGO_FIELD = PlaylistItem.FIELDS.index("tvg_logo")
+GROUP_TITLE_FIELD = PlaylistItem.FIELDS.index("group_title")
+HEADERS_FIELD = PlaylistItem.FIELDS.index("headers")
+IS_DRM_FIELD = PlaylistItem.FIELDS.index("is_drm")
+KODI_PROPERTIES_FIELD = PlaylistItem.FIELDS.index("kodi_properties")
+JSON_FIELDS = (HEADERS_FIELD, KODI_PROPERTIES_FIELD)  # Dictionaries, stored as JSON
+SUMMARY_FIELDS = (TITLE_FIELD, TVG_LOGO_FIELD, GROUP_TITLE_FIELD)  # Read by listings
+# Values of the fields left out of a record (to_list() drops trailing empty
+# ones), the PlaylistItem constructor's own defaults in FIELDS order
+DEFAULTS = PlaylistItem.__init__.__defaults__
+assert len(DEFAULTS) == FIELD_COUNT, "every PlaylistItem field needs a default"
+STRING_SEPARATOR = "\0"
+
+
+def clean_string(value: Optional[str]) -> str:
+  # The separator can't be part of a string, M3U lines never hold it
+  return (value or "").replace(STRING_SEPARATOR, "")
+
+
+def _title_hash(title: str) -> int:
+  return zlib.crc32(title.encode())
+
+
+def _align(data: Union[bytes, bytearray]) -> bytes:
+  return bytes(data) + b"\0" * (-len(data) % 4)
+
+
+def _clean_column(column: Iterable[Optional[str]]) -> list[str]:
+  """
+  clean_string() over a column, the separator only searched once.
+  """
+  column = [value or "" for value in column]
+  if STRING_SEPARATOR in "".join(column):
+    column = [value.replace(STRING_SEPARATOR, "") for value in column]
+  return column
+
+
+def _encode_json(value: dict) -> str:
+  # Compact JSON of a dictionary of strings, without json.dumps' setup per call
+  items = [f"{_encode_string(k)}:{_encode_string(v)}" for k, v in value.items()]
+  return "{" + ",".join(items) + "}"
+
+
+def _json_column(column: Iterable[Optional[dict]]) -> list[str]:
+  """
+  JSON of a column of flat dictionaries of strings, "" for empty ones.
+  Channels share a few of them, each is encoded once.
+  """
+  encoded = {"": ""}
+  strings = []
+  for value in column:
+    key = tuple(value.items()) if value else ""
+    string = encoded.get(key)
+    if string is None:
+      string = encoded[key] = _encode_json(value)
+    strings.append(string)
+  return strings
+
+
+def encode_strings(strings: list[str]) -> tuple[array, bytes]:
+  """
+  String table of the given strings, as read by MappedFile: their offsets
+  (one more than strings) and their UTF-8 data, 4-byte aligned.
+  """
+  text = STRING_SEPARATOR.join(strings) + STRING_SEPARATOR
+  data = text.encode()
+  # Offsets are in bytes, characters are single bytes in ASCII text
+  lengths = map(len, strings if len(data) == len(text) else map(str.encode, strings))
+  offsets = array("I", accumulate((length + 1 for length in lengths), initial=0))
+  return offsets, _align(data)
+
+
+def build_channel_file(channel_lists: Iterable[list],
+                       playbacks: Optional[Iterable[dict]] = None) -> bytes:
+  """
+  Encodes channels in their positional (PlaylistItem.to_list) form, along
+  with their playback descriptors when given (same order).
+  Works column by column, the string table and the ids of a column are
+  built in one go.
+  """
+  channel_lists = list(channel_lists)
+  count = len(channel_lists)
+  # Trailing empty values are left out of the records, missing columns are
+  # all defaults
+  columns = list(zip_longest(*channel_lists))
+  columns += [[DEFAULTS[field]] * count for field in range(len(columns), FIELD_COUNT)]
+
+  string_columns = {}
+  for field in range(FIELD_COUNT):
+    if field in JSON_FIELDS:
+      string_columns[field] = _json_column(columns[field])
+    elif field != IS_DRM_FIELD:
+      string_columns[field] = _clean_column(columns[field])
+  if playbacks is not None:
+    playbacks = list(playbacks)
+    string_columns[PLAYBACK_PATH_COLUMN] = _clean_column(
+      playback["path"] for playback in playbacks)
+    string_columns[PLAYBACK_PROPERTIES_COLUMN] = _json_column(
+      playback["properties"] for playback in playbacks)
+
+  # Deduplicated in order of first use, string 0 is "". Records are filled
+  # column by column, through strided slices
+  string_ids = {"": 0}
+  records = array("I", bytes(count * RECORD_WIDTH * 4))
+
+  def store_column(field: int) -> None:
+    column = string_columns[field]
+    if not any(column):
+      return  # Records are all zeros, the id of ""
+    distinct = dict.fromkeys(column)
+    new = [value for value in distinct if value not in string_ids]
+    new_ids = range(len(string_ids), len(string_ids) + len(new))
+    string_ids.update(zip(new, new_ids))
+    if len(new) == len(column):
+      # Every value distinct and new (e.g. URLs), ids in a row
+      records[field::RECORD_WIDTH] = array("I", new_ids)
+      return
+    # Ids of the column's distinct values, few for most columns
+    column_ids = dict(zip(distinct, map(string_ids.__getitem__, distinct)))
+    records[field::RECORD_WIDTH] = array("I", map(column_ids.__getitem__, column))
+
+  # Strings of the listings first, they make the prefix summaries() decodes
+  for field in SUMMARY_FIELDS:
+    store_column(field)
+  summary_string_count = len(string_ids)
+  for field in string_columns:
+    if field not in SUMMARY_FIELDS:
+      store_column(field)
+  records[IS_DRM_FIELD::RECORD_WIDTH] = array("I", map(bool, columns[IS_DRM_FIELD]))
+  strings = list(string_ids)
+
+  offsets, data = encode_strings(strings)
+
+  titles = string_columns[TITLE_FIELD]
+  title_hashes = {title: _title_hash(title) for title in dict.fromkeys(titles)}
+  record_hashes = list(map(title_hashes.__getitem__, titles))
+  # Stable, records with the same hash stay in playlist order
+  record_ids = array("I", sorted(range(count), key=record_hashes.__getitem__))
+  hashes = array("I", sorted(record_hashes))
+
+  groups = string_columns[GROUP_TITLE_FIELD]
+  group_ranks = {group: rank for rank, group in enumerate(dict.fromkeys(groups))}
+  record_ranks = list(map(group_ranks.__getitem__, groups))
+  # Stable, members of a group stay in playlist order
+  members = array("I", sorted(range(count), key=record_ranks.__getitem__))
+  group_sizes = Counter(record_ranks)
+  group_section = array("I", [len(group_ranks)])
+  group_section.extend(accumulate(map(group_sizes.__getitem__, range(len(group_ranks))), initial=0))
+  group_section.extend(map(string_ids.__getitem__, group_ranks))
+
+  offsets_pos = HEADER.size
+  data_pos = offsets_pos + len(offsets) * 4
+  records_pos = data_pos + len(data)
+  lookup_pos = records_pos + len(records) * 4
+  # Groups follow the lookup, they need no position in the header
+  header = HEADER.pack(
+    CHANNEL_FILE_MAGIC, CHANNEL_FILE_VERSION, BYTE_ORDER_MARK, count,
+    len(strings), summary_string_count, offsets_pos, data_pos, records_pos, lookup_pos)
+  return b"".join((
+    header, offsets.tobytes(), data, records.tobytes(),
+    hashes.tobytes(), record_ids.tobytes(), group_section.tobytes(), members.tobytes()))
+
+
+def write_channel_file(path: Path, channel_lists: Iterable[list],
+                       playbacks: Optional[Iterable[dict]] = None) -> int:
+  """
+  Writes a channel file atomically.
+  :return: Size of the file.
+  """
+  content = build_channel_file(channel_lists, playbacks)
+  write_atomic(path, content)
+  return len(content)
+
+
+class MappedFile:
+  """
+  Read-only file with a string table (encode_strings), mapped rather than
+  read. Strings are decoded on first use, once each. Close it (or use it as
+  a context manager) before the file is deleted.
+  """
+
+  def __init__(self, path: Path):
+    with open(path, "rb") as f:
+      self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    self._views = []
+    self._strings = {}
+    # Set by subclasses to their string table
+    self._offsets: Optional[memoryview] = None
+    self._data: Optional[memoryview] = None
+
+  def _view(self, view: memoryview) -> memoryview:
+    self._views.append(view)
+    return view
+
+  def close(self) -> None:
+    # Views have to be released before the mapping can be closed
+    for view in reversed(self._views):
+      view.release()
+    self._views = []
+    self._mmap.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+    return False
+
+  def _string(self, sid: int) -> str:
+    value = self._strings.get(sid)
+    if value is None:
+      value = self._strings[sid] = sys.intern(
+        str(self._data[self._offsets[sid]:self._offsets[sid + 1] - 1], "utf-8"))
+    return value
+
+
+class ChannelFile(MappedFile):
+  """
+  Read-only view of a channel file.
+  """
+
+  def __init__(self, path: Path):
+    super().__init__(path)
+    try:
+      view = self._view(memoryview(self._mmap))
+      if len(view) < HEADER.size or len(view) % 4:
+        raise ValueError("Truncated channel file")
+      (magic, version, byte_order_mark, count, string_count, summary_string_count,
+       offsets_pos, data_pos, records_pos, lookup_pos) = HEADER.unpack_from(view)
+      if magic != CHANNEL_FILE_MAGIC or version != CHANNEL_FILE_VERSION:
+        raise ValueError(f"Unsupported channel file version {version}")
+      if byte_order_mark != BYTE_ORDER_MARK:
+        raise ValueError("Channel file of another byte order")
+      groups_pos = lookup_pos + count * 8
+      if records_pos + count * RECORD_WIDTH * 4 != lookup_pos or groups_pos + 4 > len(view):
+        raise ValueError("Truncated channel file")
+      words = self._view(view.cast("I"))
+      group_count = words[groups_pos // 4]
+      group_sids_pos = groups_pos // 4 + 1 + group_count + 1
+      members_pos = group_sids_pos + group_count
+      if (members_pos + count) * 4 != len(view):
+        raise ValueError("Truncated channel file")
+
+      self.count = count
+      self._summary_string_count = summary_string_count
+      self._offsets = self._view(words[offsets_pos // 4:offsets_pos // 4 + string_count + 1])
+      self._data = self._view(view[data_pos:records_pos])
+      self._records = self._view(words[records_pos // 4:lookup_pos // 4])
+      self._hashes = self._view(words[lookup_pos // 4:lookup_pos // 4 + count])
+      self._record_ids = self._view(words[lookup_pos // 4 + count:groups_pos // 4])
+      self._member_offsets = self._view(words[groups_pos // 4 + 1:group_sids_pos])
+      self._group_sids = self._view(words[group_sids_pos:members_pos])
+      self._members = self._view(words[members_pos:])
+    except BaseException:
+      self.close()
+      raise
+
+  def _all_strings(self, count: Optional[int] = None) -> list[str]:
+    """
+    The whole string table, or its first count strings, for reads touching
+    most channels.
+    """
+    end = self._offsets[len(self._offsets) - 1 if count is None else count] - 1
+    return str(self._data[:end], "utf-8").split(STRING_SEPARATOR)
+
+  def _column(self, field: int) -> list[int]:
+    # Strided view over the records, copied out in one go
+    return self._records[field::RECORD_WIDTH].tolist()
+
+  def record(self, index: int) -> list:
+    """
+    Positional (PlaylistItem.from_list) form of a channel.
+    """
+    # Copied out, a slice left alive would keep the mapping from closing
+    row = self._records[index * RECORD_WIDTH:index * RECORD_WIDTH + FIELD_COUNT].tolist()
+    values = [self._string(sid) for sid in row]
+    for field in JSON_FIELDS:
+      values[field] = json.loads(values[field]) if values[field] else None
+    values[IS_DRM_FIELD] = bool(row[IS_DRM_FIELD])
+    return values
+
+  def records(self) -> list[tuple]:
+    """
+    Positional (PlaylistItem.from_list) form of every channel.
+    """
+    if not self.count:
+      return []
+    strings = self._all_strings()
+    columns = []
+    for field in range(FIELD_COUNT):
+      column = self._column(field)
+      if field == IS_DRM_FIELD:
+        columns.append(map(bool, column))
+      elif field in JSON_FIELDS:
+        columns.append([json.loads(strings[sid]) if sid else None for sid in column])
+      else:
+        columns.append(map(strings.__getitem__, column))
+    return list(zip(*columns))
+
+  def _find_index(self, title: str) -> Optional[int]:
+    title_hash = _title_hash(title)
+    position = bisect_left(self._hashes, title_hash)
+    matches = []
+    while position < self.count and self._hashes[position] == title_hash:
+      matches.append(self._record_ids[position])
+      position += 1
+    for index in sorted(matches):
+      if self._string(self._records[index * RECORD_WIDTH + TITLE_FIELD]) == title:
+        return index
+    return None
+
+  def find(self, title: str) -> Optional[list]:
+    """
+    Record of the first channel with this title, reading only its row.
+    """
+    index = self._find_index(title)
+    return self.record(index) if index is not None else None
+
+  def find_playback(self, title: str) -> Optional[dict]:
+    """
+    Playback descriptor of the first channel with this title, None when
+    the channel is missing or was stored without one.
+    """
+    index = self._find_index(title)
+    if index is None:
+      return None
+    row = index * RECORD_WIDTH
+    path_sid, properties_sid = (
+      self._records[row + PLAYBACK_PATH_COLUMN:row + RECORD_WIDTH].tolist())
+    if not path_sid:
+      return None
+    properties = json.loads(self._string(properties_sid)) if properties_sid else {}
+    return {"path": self._string(path_sid), "properties": properties}
+
+  def summaries(self, group_title: Optional[str] = None) -> list[PlaylistItem]:
+    """
+    Channels with only their title, logo and group, all of them or those of
+    a single group. Only the strings of these columns are decoded, those of
+    the group's channels only for a group.
+    """
+    if not self.count:
+      return []
+    if group_title is not None:
+      return self._group_summaries(group_title)
+    strings = self._all_strings(self._summary_string_count)
+    rows = zip(self._column(TITLE_FIELD), self._column(TVG_LOGO_FIELD),
+               self._column(GROUP_TITLE_FIELD))
+    return [PlaylistItem(strings[title], tvg_logo=strings[logo], group_title=strings[group])
+            for title, logo, group in rows]
+
+  def _group_summaries(self, group_title: str) -> list[PlaylistItem]:
+    # Groups are few, their titles are compared one by one
+    group = next((i for i, sid in enumerate(self._group_sids)
+                  if self._string(sid) == group_title), None)
+    if group is None:
+      return []
+    members = self._members[self._member_offsets[group]:self._member_offsets[group + 1]].tolist()
+    records, string = self._records, self._string
+    return [PlaylistItem(string(records[index * RECORD_WIDTH + TITLE_FIELD]),
+                         tvg_logo=string(records[index * RECORD_WIDTH + TVG_LOGO_FIELD]),
+                         group_title=group_title)
+            for index in members]
+
+  def groups(self) -> list[tuple[str, int]]:
+    """
+    Group titles with their channel count, in playlist order.
+    """
+    offsets = self._member_offsets.tolist()
+    return [(self._string(sid), offsets[group + 1] - offsets[group])
+            for group, sid in enumerate(self._group_sids)]
@@ -1,10 +1,16 @@
 from pathlib import Path
 from xbmcaddon import Addon
 from xbmcvfs import translatePath
+
+ADDON = Addon()
+ADDON_PATH = Path(translatePath(ADDON.getAddonInfo('path')))
+PROFILE_PATH = Path(translatePath(ADDON.getAddonInfo('profile')))
+CACHE_MAX_BYTES = 64 * 1024 * 1024  # Budget of the built-in cache, least recently used entries go first
+
 try:
   import StorageServer  # pyright: ignore[reportMissingImports]
-except:
-  import lib.storageserverdummy as StorageServer
-
-ADDON_PATH = Path(translatePath(Addon().getAddonInfo('path')))
-cache = StorageServer.StorageServer("cricfy_plugin", 24)
+  cache = StorageServer.StorageServer("cricfy_plugin", 24)
+except ImportError:
+  # script.common.plugin.cache isn't installed, use the built-in backend
+  from lib.sqlitecache import SQLiteCache
+  cache = SQLiteCache(PROFILE_PATH / "cache.db", 24, max_bytes=CACHE_MAX_BYTES)
@@ -1,15 +1,30 @@
+import io
+import os
 import base64
+import codecs
+import binascii
+import itertools
 from dataclasses import dataclass
-from typing import Optional
+from functools import lru_cache
+from typing import BinaryIO, Iterable, Iterator, Optional
 from lib.logger import log_error
-from lib.config import ADDON_PATH
+from lib.config import ADDON_PATH, PROFILE_PATH
+from lib.files import write_atomic
+from lib.perf import timed
 from Cryptodome.Cipher import AES
 from Cryptodome.Util.Padding import unpad
 
 SECRET1_FILE_PATH = ADDON_PATH / "resources" / "secret1.txt"
 SECRET2_FILE_PATH = ADDON_PATH / "resources" / "secret2.txt"
-SECRET1 = SECRET1_FILE_PATH.read_text(encoding="utf-8").strip()
-SECRET2 = SECRET2_FILE_PATH.read_text(encoding="utf-8").strip()
+# Name of the key that last decrypted data successfully, tried first next
+# time. Kept in the profile as every plugin invocation is a new process
+LAST_KEY_FILE_PATH = PROFILE_PATH / "last_key.txt"
+CONTENT_CHUNK_SIZE = 64 * 1024  # Bytes of a payload read at once by the streaming decryption
+M3U_MARKERS = (b"#EXTM3U", b"#EXTINF", b"#KODIPROP")  # Starts of a payload served unencrypted
+MIN_ENCRYPTED_LENGTH = 79  # Shorter payloads can't hold the IV, key and ciphertext
+# Bytes base64.b64decode() skips over, all but the alphabet and padding
+NON_BASE64_BYTES = bytes(set(range(256)) - set(
+  b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/="))
 
 
 @dataclass
@@ -30,15 +45,46 @@ def parse_key_info(secret: str) -> KeyInfo:
   )
 
 
+@lru_cache(maxsize=None)
 def keys():
+  """
+  Parsed decryption keys by name, read and parsed once per process on
+  first use (not at import time).
+  """
+  secret1 = SECRET1_FILE_PATH.read_text(encoding="utf-8").strip()
+  secret2 = SECRET2_FILE_PATH.read_text(encoding="utf-8").strip()
   keys = {}
-  if SECRET1:
-    keys["key1"] = parse_key_info(SECRET1)
-  if SECRET2:
-    keys["key2"] = parse_key_info(SECRET2)
+  if secret1:
+    keys["key1"] = parse_key_info(secret1)
+  if secret2:
+    keys["key2"] = parse_key_info(secret2)
   return keys
 
 
+def _read_last_key_name() -> Optional[str]:
+  try:
+    return LAST_KEY_FILE_PATH.read_text(encoding="utf-8").strip() or None
+  except FileNotFoundError:
+    return None
+  except Exception as e:
+    log_error("crypto_utils", f"Ignoring unreadable last key name: {e}")
+    return None
+
+
+def _write_last_key_name(key_name: str) -> None:
+  try:
+    write_atomic(LAST_KEY_FILE_PATH, key_name)
+  except Exception as e:
+    log_error("crypto_utils", f"Failed to write last key name: {e}")
+
+
+def _keys_by_preference(last_key_name: Optional[str]) -> list[tuple[str, KeyInfo]]:
+  key_items = list(keys().items())
+  key_items.sort(key=lambda item: item[0] != last_key_name)
+  return key_items
+
+
+@timed("decrypt")
 def decrypt_data(encrypted_base64: str) -> Optional[str]:
   try:
     clean_base64 = (
@@ -51,9 +97,18 @@ def decrypt_data(encrypted_base64: str) -> Optional[str]:
 
     ciphertext = base64.b64decode(clean_base64)
 
-    for key_info in keys().values():
-      result = try_decrypt(ciphertext, key_info)
+    # All keys are screened against two blocks of the ciphertext first, the
+    # whole payload is only decrypted with keys passing the check, stopping
+    # at the first valid result. A rotated key costs two AES blocks, not a
+    # full failed decryption.
+    last_key_name = _read_last_key_name()
+    candidates = [(key_name, key_info) for key_name, key_info in _keys_by_preference(last_key_name)
+                  if _is_plausible_key(ciphertext, key_info)]
+    for key_name, key_info in candidates:
+      result = _decrypt(ciphertext, key_info)
       if result is not None:
+        if key_name != last_key_name:
+          _write_last_key_name(key_name)
         return result
 
     log_error("crypto_utils", "Decryption failed with all keys.")
@@ -63,7 +118,37 @@ def decrypt_data(encrypted_base64: str) -> Optional[str]:
     return None
 
 
-def try_decrypt(ciphertext: bytes, key_info: KeyInfo) -> Optional[str]:
+def _is_plausible_key(ciphertext: bytes, key_info: KeyInfo) -> bool:
+  """
+  Cheap check of a key against the ciphertext, decrypting only its last and
+  first blocks: a wrong key almost never yields valid PKCS5/7 padding and
+  a UTF-8 decodable start.
+  """
+  block_size = AES.block_size
+  if not ciphertext or len(ciphertext) % block_size:
+    return False
+
+  # In CBC mode a block only depends on itself and the previous ciphertext block
+  last_iv = ciphertext[-2 * block_size:-block_size] or key_info.iv
+  last_block = AES.new(key_info.key, AES.MODE_CBC, last_iv).decrypt(
+    ciphertext[-block_size:])
+  pad_len = last_block[-1]
+  if not 1 <= pad_len <= block_size or last_block[-pad_len:] != bytes((pad_len,)) * pad_len:
+    return False
+
+  first_block = AES.new(key_info.key, AES.MODE_CBC, key_info.iv).decrypt(
+    ciphertext[:block_size])
+  if len(ciphertext) == block_size:
+    first_block = first_block[:-pad_len]
+  try:
+    # Not final, the block may end in the middle of a multi-byte character
+    codecs.getincrementaldecoder("utf-8")().decode(first_block, final=False)
+  except UnicodeDecodeError:
+    return False
+  return True
+
+
+def _decrypt(ciphertext: bytes, key_info: KeyInfo) -> Optional[str]:
   try:
     cipher = AES.new(key_info.key, AES.MODE_CBC, key_info.iv)
     decrypted = cipher.decrypt(ciphertext)
@@ -85,44 +170,116 @@ def try_decrypt(ciphertext: bytes, key_info: KeyInfo) -> Optional[str]:
     return None
 
 
-def decrypt_content(content: str) -> str:
-  content = content.strip()
-  try:
-    # Check if content is already valid M3U
-    if (content.startswith("#EXTM3U") or
-        content.startswith("#EXTINF") or
-            content.startswith("#KODIPROP")):
-      return content
+def _payload_span(payload: BinaryIO, chunk_size: int) -> tuple[int, int]:
+  """
+  Offsets of the payload once stripped of surrounding whitespace, found
+  without reading it whole.
+  """
+  size = payload.seek(0, os.SEEK_END)
+  start = size
+  position = payload.seek(0)
+  while position < size:
+    chunk = payload.read(chunk_size)
+    stripped = chunk.lstrip()
+    if stripped:
+      start = position + len(chunk) - len(stripped)
+      break
+    position += len(chunk)
+
+  end = start
+  position = size
+  while position > start:
+    length = min(chunk_size, position - start)
+    payload.seek(position - length)
+    stripped = payload.read(length).rstrip()
+    if stripped:
+      end = position - length + len(stripped)
+      break
+    position -= length
+  return start, end
 
-    trimmed_content = content.strip()
 
-    # Check length requirement
-    if len(trimmed_content) < 79:
-      return trimmed_content
+def _read_range(payload: BinaryIO, start: int, end: int, chunk_size: int) -> Iterator[bytes]:
+  position = start
+  while position < end:
+    payload.seek(position)
+    chunk = payload.read(min(chunk_size, end - position))
+    if not chunk:
+      raise ValueError("Payload truncated")
+    position += len(chunk)
+    yield chunk
 
-    # Extract parts for decryption (String slicing logic remains the same)
-    part1 = trimmed_content[0:10]
-    part2 = trimmed_content[34:-54]
-    part3 = trimmed_content[-10:]
-    encrypted_data_str = part1 + part2 + part3
 
-    iv_base64 = trimmed_content[10:34]
-    key_base64 = trimmed_content[-54:-10]
+def _decrypt_chunks(ciphertext_base64: Iterable[bytes], key: bytes, iv: bytes) -> Iterator[bytes]:
+  """
+  Base64 decodes and AES/CBC/PKCS5Padding decrypts a stream, the last
+  block being held back until it can be unpadded.
+  """
+  cipher = AES.new(key, AES.MODE_CBC, iv)
+  block_size = AES.block_size
+  pending_base64 = b""
+  pending_ciphertext = b""
+  for chunk in ciphertext_base64:
+    # Discarded like base64.b64decode() does
+    pending_base64 += chunk.translate(None, NON_BASE64_BYTES)
+    usable = len(pending_base64) - len(pending_base64) % 4
+    pending_ciphertext += binascii.a2b_base64(pending_base64[:usable])
+    pending_base64 = pending_base64[usable:]
+    # Whole blocks, but always one left for the unpadding
+    usable = max(0, (len(pending_ciphertext) - 1) // block_size * block_size)
+    if usable:
+      yield cipher.decrypt(pending_ciphertext[:usable])
+      pending_ciphertext = pending_ciphertext[usable:]
 
-    # Decode from Base64
-    iv = base64.b64decode(iv_base64)
-    key = base64.b64decode(key_base64)
-    encrypted_bytes = base64.b64decode(encrypted_data_str)
+  pending_ciphertext += binascii.a2b_base64(pending_base64) if pending_base64 else b""
+  if not pending_ciphertext or len(pending_ciphertext) % block_size:
+    raise ValueError("Ciphertext is not a multiple of the block size")
+  yield unpad(cipher.decrypt(pending_ciphertext), block_size)
 
-    # Decrypt using AES/CBC/PKCS5Padding
-    cipher = AES.new(key, AES.MODE_CBC, iv)
-    decrypted_padded = cipher.decrypt(encrypted_bytes)
 
-    # Unpad and decode to string
-    decrypted_data = unpad(decrypted_padded, AES.block_size)
+def iter_payload_chunks(payload: BinaryIO, chunk_size: int = CONTENT_CHUNK_SIZE) -> Iterator[bytes]:
+  """
+  The payload as is, stripped of surrounding whitespace, in chunks.
+  """
+  start, end = _payload_span(payload, chunk_size)
+  yield from _read_range(payload, start, end, chunk_size)
 
-    return decrypted_data.decode('utf-8')
 
+def iter_content_chunks(payload: BinaryIO, chunk_size: int = CONTENT_CHUNK_SIZE) -> Iterator[bytes]:
+  """
+  Streaming decrypt_content: yields the playlist held in payload (a seekable
+  binary file, e.g. a spooled HTTP response) as UTF-8 chunks, decrypted on
+  the fly when it is encrypted. Only a few chunks are in memory at once.
+  Raises ValueError when it can't be decrypted, possibly after part of it
+  was yielded.
+  """
+  start, end = _payload_span(payload, chunk_size)
+  payload.seek(start)
+  head = payload.read(max(map(len, M3U_MARKERS)))
+  # Already valid M3U, or too short to hold the IV and key
+  if head.startswith(M3U_MARKERS) or end - start < MIN_ENCRYPTED_LENGTH:
+    yield from _read_range(payload, start, end, chunk_size)
+    return
+
+  # The base64 IV follows the first 10 characters of the ciphertext, the
+  # base64 key precedes its last 10
+  payload.seek(start + 10)
+  iv = base64.b64decode(payload.read(24))
+  payload.seek(end - 54)
+  key = base64.b64decode(payload.read(44))
+  ciphertext_base64 = itertools.chain(
+    _read_range(payload, start, start + 10, chunk_size),
+    _read_range(payload, start + 34, end - 54, chunk_size),
+    _read_range(payload, end - 10, end, chunk_size),
+  )
+  yield from _decrypt_chunks(ciphertext_base64, key, iv)
+
+
+@timed("decrypt")
+def decrypt_content(content: str) -> str:
+  content = content.strip()
+  try:
+    return b"".join(iter_content_chunks(io.BytesIO(content.encode()))).decode("utf-8")
   except Exception as e:
     log_error("crypto_utils", f"Content decryption failed: {e}")
     return content  # Return original content if decryption fails
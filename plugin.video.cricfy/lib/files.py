@@ -0,0 +1,32 @@
+import os
+import threading
+from pathlib import Path
+from typing import Union
+
+"""
+  Files of the profile
+  Several processes of the add-on read and write them at once: writes go to
+  a temporary file of the writing thread, moved over the file in one step.
+"""
+
+
+def write_atomic(path: Path, content: Union[str, bytes]) -> None:
+  """
+  Writes content (text as UTF-8) to path atomically: concurrent readers see
+  either the old or the new file, never a partial one. The temporary file
+  is removed when the write fails.
+  """
+  path.parent.mkdir(parents=True, exist_ok=True)
+  tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+  try:
+    if isinstance(content, str):
+      tmp_path.write_text(content, encoding="utf-8")
+    else:
+      tmp_path.write_bytes(content)
+    os.replace(tmp_path, path)
+  except BaseException:
+    try:
+      tmp_path.unlink()
+    except OSError:
+      pass
+    raise
@@ -0,0 +1,138 @@
+import time
+import json
+from typing import Iterable, Optional
+from urllib.parse import urlparse
+import xbmc
+from lib.config import cache
+from lib.logger import log_info
+from lib.m3u_parser import PlaylistItem
+from lib.playback import stream_headers
+from lib.prefetch import run_bounded
+from lib.providers import get_channels, hash_key
+
+"""
+  Stream health
+  Probes the stream URLs of cached channels in background and keeps, per
+  provider, whether each channel answered and how fast, so that listings
+  can hide dead channels or put the fastest first.
+"""
+
+HEALTH_PROBE_TIMEOUT = 5  # Seconds to connect and receive the start of the manifest
+HEALTH_PROBE_BYTES = 4096  # Read of the manifest, enough to tell an error page from a stream
+HEALTH_RESULTS_TTL = 24 * 3600  # 1 day, older probe results are ignored
+
+
+def _health_key(provider_hash: str) -> str:
+  return f"channel_health_{provider_hash}"
+
+
+def probe_channel(channel: PlaylistItem, timeout: float = HEALTH_PROBE_TIMEOUT) -> Optional[float]:
+  """
+  Requests the start of a channel's stream (manifest), with its headers.
+  :return: Latency in milliseconds until the first bytes, None when the
+    stream is unreachable or answers with an error.
+  """
+  from lib.req import get_session
+
+  started = time.perf_counter()
+  try:
+    with get_session().get(channel.url, headers=stream_headers(channel), timeout=timeout,
+                           stream=True, allow_redirects=True) as response:
+      if response.status_code >= 400:
+        return None
+      next(response.iter_content(HEALTH_PROBE_BYTES), b"")
+      return (time.perf_counter() - started) * 1000
+  except Exception:
+    return None
+
+
+def probe_channels(
+  provider_urls: Iterable[str],
+  max_workers: int = 8,
+  max_per_host: int = 2,
+  rate: float = 10,
+  time_budget: float = 300,
+  monitor: Optional[xbmc.Monitor] = None,
+) -> int:
+  """
+  Probes the HTTP(S) streams of all channels of the given providers and
+  stores the results next to their channel cache. At most max_workers
+  probes run at once, max_per_host against the same server and rate are
+  started per second. Results of channels not probed in time are kept.
+  :return: Number of channels probed.
+  """
+  channels = {}
+  for provider_url in dict.fromkeys(provider_urls):
+    try:
+      provider_channels = get_channels(provider_url=provider_url)
+    except Exception:
+      continue  # Already logged
+    for index, channel in enumerate(provider_channels):
+      if channel.url.startswith(('http://', 'https://')):
+        channels[(provider_url, index)] = channel
+
+  latencies = run_bounded(
+    channels,
+    lambda item: probe_channel(channels[item]),
+    lambda item: urlparse(channels[item].url).netloc,
+    max_workers=max_workers,
+    max_per_host=max_per_host,
+    rate=rate,
+    time_budget=time_budget,
+    monitor=monitor,
+    component="health",
+  )
+
+  probed_at = time.time()
+  by_provider = {}
+  for (provider_url, index), latency in latencies.items():
+    results = by_provider.setdefault(provider_url, {})
+    results[channels[(provider_url, index)].title] = [
+      latency is not None, round(latency, 1) if latency is not None else None, probed_at]
+
+  for provider_url, results in by_provider.items():
+    previous = get_health_results(provider_url)
+    previous.update(results)
+    cache.set(_health_key(hash_key(provider_url)), json.dumps(previous))
+
+  alive = sum(1 for latency in latencies.values() if latency is not None)
+  log_info("health", f"Probed {len(latencies)}/{len(channels)} channels, {alive} alive")
+  return len(latencies)
+
+
+def get_health_results(provider_url: str) -> dict:
+  """
+  Latest probe results of a provider's channels, by title:
+  [alive, latency in milliseconds or None, probe time].
+  """
+  cached = cache.get(_health_key(hash_key(provider_url)))
+  if cached and isinstance(cached, str):
+    results = json.loads(cached)
+    if isinstance(results, dict):
+      return results
+  return {}
+
+
+def rank_channels(provider_url: str, channels: list[PlaylistItem],
+                  hide_dead: bool = False, sort_by_latency: bool = False) -> list[PlaylistItem]:
+  """
+  Applies the probe results to a listing: drops channels found dead and/or
+  orders them by latency. Channels without recent results are kept, after
+  the measured ones.
+  """
+  if not hide_dead and not sort_by_latency:
+    return channels
+  results = get_health_results(provider_url)
+  if not results:
+    return channels
+
+  oldest = time.time() - HEALTH_RESULTS_TTL
+  health = {title: (alive, latency) for title, (alive, latency, probed_at) in results.items()
+            if probed_at >= oldest}
+  if hide_dead:
+    channels = [ch for ch in channels if health.get(ch.title, (True, None))[0]]
+  if sort_by_latency:
+    unknown = float("inf")
+    # Stable, channels with the same latency keep the playlist order
+    channels = sorted(channels, key=lambda ch: health.get(ch.title, (True, None))[1] or unknown)
+  return channels
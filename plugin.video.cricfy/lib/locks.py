@@ -0,0 +1,97 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator
+from lib.config import PROFILE_PATH
+from lib.logger import log_info
+
+try:
+  import fcntl
+except ImportError:
+  # Windows
+  fcntl = None
+  import msvcrt  # pyright: ignore[reportMissingImports]
+
+"""
+  Locks shared by every process of the add-on
+  Kodi runs plugin invocations (and the service) side by side, each in its
+  own process. A lock is held on a file of the profile, the OS releases it
+  when its process ends, even abruptly, so it can never be left stale.
+"""
+
+LOCKS_DIR = PROFILE_PATH / "locks"
+LOCK_TIMEOUT = 30  # Seconds waited for another process before going ahead without the lock
+LOCK_POLL_INTERVAL = 0.05  # Seconds between attempts while waiting
+
+
+def _try_lock(fd: int) -> None:
+  # Raises OSError while another process (or thread) holds the lock
+  if fcntl:
+    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+  else:
+    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+
+
+def _unlock(fd: int) -> None:
+  if fcntl:
+    fcntl.flock(fd, fcntl.LOCK_UN)
+  else:
+    os.lseek(fd, 0, os.SEEK_SET)
+    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class ProfileLock:
+  """
+  Exclusive lock by name across processes. Threads of the same process
+  exclude each other as well, each acquire() uses its own file handle.
+  """
+
+  def __init__(self, name: str):
+    self.path = LOCKS_DIR / f"{name}.lock"
+    self._fd = None
+
+  def acquire(self, timeout: float = LOCK_TIMEOUT) -> bool:
+    """
+    Waits up to timeout seconds (0 to only try once) for the lock.
+    :return: Whether the lock was acquired.
+    """
+    LOCKS_DIR.mkdir(parents=True, exist_ok=True)
+    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+    deadline = time.monotonic() + timeout
+    while True:
+      try:
+        _try_lock(fd)
+        self._fd = fd
+        return True
+      except OSError:
+        if time.monotonic() >= deadline:
+          os.close(fd)
+          return False
+        time.sleep(LOCK_POLL_INTERVAL)
+
+  def release(self) -> None:
+    fd, self._fd = self._fd, None
+    if fd is not None:
+      try:
+        _unlock(fd)
+      finally:
+        os.close(fd)
+
+
+@contextmanager
+def single_flight(name: str, timeout: float = LOCK_TIMEOUT) -> Iterator[None]:
+  """
+  Runs the block in one process at a time for this name: the others wait
+  for it, up to timeout seconds, then run the block themselves. The block
+  should start by looking again for what it is about to produce, another
+  process may just have done it.
+  """
+  lock = ProfileLock(name)
+  acquired = lock.acquire(timeout)
+  if not acquired:
+    log_info("locks", f"Timed out waiting for {name}, going ahead without the lock")
+  try:
+    yield
+  finally:
+    if acquired:
+      lock.release()
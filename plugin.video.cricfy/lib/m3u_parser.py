@@ -1,145 +1,465 @@
 import re
+import sys
 import json
+import codecs
+import itertools
+from types import MappingProxyType
+from typing import Callable, Iterable, Iterator, Mapping, Optional, Union
+from lib.logger import log_error
+
+# Value of unset headers / kodi_properties: read-only, so that writing to it
+# fails rather than being lost. Assign a dictionary to set them
+EMPTY_MAPPING = MappingProxyType({})
+
+
+def _intern(value):
+  # M3U directives (e.g. #EXTHTTP JSON) may carry non-string values
+  return sys.intern(value) if type(value) is str else value
 
 
 class PlaylistItem:
-  def __init__(self):
-    self.title = ""
-    self.url = ""
-    self.tvg_logo = ""
-    self.group_title = ""
-    self.user_agent = ""
-    self.cookie = ""
-    self.referer = ""
-    self.license_string = ""
-    self.headers = {}
-    self.is_drm = False
+  # Field order of the positional (list) representation
+  FIELDS = (
+    "title", "url", "tvg_logo", "group_title", "user_agent",
+    "cookie", "referer", "license_string", "headers", "is_drm",
+    "kodi_properties",
+  )
+  __slots__ = (
+    "title", "url", "tvg_logo", "group_title", "user_agent",
+    "cookie", "referer", "license_string", "_headers", "is_drm",
+    "_kodi_properties",
+  )
+
+  def __init__(self, title="", url="", tvg_logo="", group_title="",
+               user_agent="", cookie="", referer="", license_string="",
+               headers=None, is_drm=False, kodi_properties=None):
+    self.title = title
+    self.url = url
+    # Values repeated across a playlist share a single string object
+    self.tvg_logo = _intern(tvg_logo)
+    self.group_title = _intern(group_title)
+    self.user_agent = _intern(user_agent)
+    self.cookie = cookie
+    self.referer = _intern(referer)
+    self.license_string = license_string
+    # Most channels have no extra headers, only allocate a dict when needed
+    self._headers = headers or None
+    self.is_drm = is_drm
+    # Inputstream properties declared by #KODIPROP (besides the license key)
+    self._kodi_properties = kodi_properties or None
+
+  @property
+  def headers(self) -> Mapping[str, str]:
+    return self._headers if self._headers is not None else EMPTY_MAPPING
+
+  @headers.setter
+  def headers(self, value: Optional[dict]):
+    self._headers = value or None
+
+  @property
+  def kodi_properties(self) -> Mapping[str, str]:
+    return self._kodi_properties if self._kodi_properties is not None else EMPTY_MAPPING
+
+  @kodi_properties.setter
+  def kodi_properties(self, value: Optional[dict]):
+    self._kodi_properties = value or None
 
   def to_json(self) -> str:
     """Returns the JSON string representation of this object"""
-    return json.dumps(self.__dict__)
+    return json.dumps(self.to_dict())
 
   def to_dict(self) -> dict:
     """Returns the dictionary representation of this object"""
-    return self.__dict__
+    values = {name: getattr(self, name) for name in PlaylistItem.FIELDS}
+    # Dictionaries of their own for unset fields, as before
+    values["headers"] = self._headers if self._headers is not None else {}
+    values["kodi_properties"] = self._kodi_properties if self._kodi_properties is not None else {}
+    return values
+
+  def to_list(self) -> list:
+    """
+    Returns the positional representation of this object (values in FIELDS
+    order, trailing empty values dropped)
+    """
+    values = [
+      self.title, self.url, self.tvg_logo, self.group_title, self.user_agent,
+      self.cookie, self.referer, self.license_string, self._headers, self.is_drm,
+      self._kodi_properties,
+    ]
+    while values and not values[-1]:
+      values.pop()
+    return values
 
   @staticmethod
   def from_dict(data):
     """Helper to create an object back from a dictionary"""
-    item = PlaylistItem()
-    # Update item with data, ignoring keys that don't exist in the class
-    item.__dict__.update(data)
-    return item
+    # Ignore keys that don't exist in the class
+    return PlaylistItem(**{k: v for k, v in data.items() if k in PlaylistItem.FIELDS})
+
+  @staticmethod
+  def from_list(values):
+    """Helper to create an object back from its positional representation"""
+    return PlaylistItem(*values)
+
+
+# Compiled once, reused for every entry
+# Names start after a non-name character: a failed match is never retried
+# from within the same name, which is quadratic on long runs of name characters
+EXTINF_ATTR_RE = re.compile(r'(?<![a-zA-Z0-9_-])([a-zA-Z0-9_-]+)=("[^"]*"|[^,]+)')
+LICENSE_KEY_PROPERTY = "inputstream.adaptive.license_key"
+# #KODIPROP keys kept for playback: the inputstream add-on and its settings
+# (e.g. inputstream.adaptive.manifest_type)
+INPUTSTREAM_PROPERTY = "inputstream"
+INPUTSTREAM_PROPERTY_PREFIX = "inputstream."
+# PlaylistItem fields set by #EXTVLCOPT options and #EXTHTTP headers (lowercase)
+VLC_OPTION_FIELDS = {
+  "http-user-agent": "user_agent",
+  "http-referrer": "referer",
+  "http-referer": "referer",
+}
+HTTP_HEADER_FIELDS = {
+  "user-agent": "user_agent",
+  "referer": "referer",
+  "cookie": "cookie",
+}
+# Decodes #EXTHTTP JSON, anything after the value is ignored. Much faster
+# than json.loads(), which checks the input type and the trailing text
+JSON_DECODER = json.JSONDecoder()
+# Characters str.splitlines() treats as line boundaries
+LINE_BREAKS = frozenset("\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029")
+# Line boundaries other than \n and \r\n, left to the line parser
+UNUSUAL_LINE_BREAKS = LINE_BREAKS - {"\n", "\r"}
+
+# Batch parsing: an M3U entry (the lines up to its URL line) is either
+# - plain: only an #EXTINF line with a duration (no whitespace), quoted
+#   attributes and a title, and comments. Its title (after the first comma,
+#   without "=" as any would be taken for an attribute), tvg-logo and
+#   group-title (the last of each, as the line parser keeps) and URL lines
+#   are captured directly
+# - anything else, captured whole for the line parser
+_SPACE = r"[^\S\n]*"  # Whitespace within a line
+_COMMENTS = r"(?:" + _SPACE + r"(?:#(?!EXTINF|EXTVLCOPT|EXTHTTP|KODIPROP)[^\n]*)?\n)*"
+BATCH_ENTRY_RE = re.compile(
+  r"(" + _COMMENTS + _SPACE + r'#EXTINF:[^,"=\s]*'
+  r'(?:[^\S\n]+(?:tvg-logo="([^"\n]*)"|group-title="([^"\n]*)"'
+  # Any other attribute, never the two above: matching an attribute more
+  # than one way would make failed matches backtrack exponentially
+  r'|(?!tvg-logo=|group-title=)[a-zA-Z0-9_-]+="[^"\n]*"))*'
+  + _SPACE + r",([^=\n]*)\n" + _COMMENTS + _SPACE + r"([^#\s][^\n]*)\n?)"
+  r"|((?:" + _SPACE + r"(?:#[^\n]*)?\n)*" + _SPACE + r"[^#\s][^\n]*\n?)"
+)
+# Entries sampled at the start of each block to tell how many have directives
+DIRECTIVE_SAMPLE_ENTRIES = 100
+# Share of entries with directives from which blocks are parsed line by line:
+# the regex would mostly delimit entries for the line parser, which costs more
+# than splitting them into lines directly (bench_directives.py)
+LINE_PARSER_DIRECTIVE_SHARE = 0.8
+
+
+def _iter_lines(stream: Iterable[Union[str, bytes]]) -> Iterator[str]:
+  """
+  Splits the stream into lines the same way str.splitlines() would.
+  Text items are taken as whole lines, byte items as arbitrary UTF-8 chunks,
+  of which at most one partial line is held in memory.
+  """
+  if isinstance(stream, (str, bytes, bytearray)):
+    stream = (stream,)
+  decoder = codecs.getincrementaldecoder("utf-8")()
+  pending = ""
+
+  for chunk in stream:
+    if isinstance(chunk, str):
+      yield from chunk.splitlines()
+      continue
+
+    text = pending + decoder.decode(chunk)
+    if not text:
+      continue
+    lines = text.splitlines()
+    # Keep the trailing partial line until its line break arrives
+    pending = "" if text[-1] in LINE_BREAKS else lines.pop()
+    yield from lines
+
+  pending += decoder.decode(b"", final=True)
+  if pending:
+    yield from pending.splitlines()
+
+
+def _parse_url_line(item: PlaylistItem, line: str) -> None:
+  # Handle pipe separated parameters (url|User-Agent=...&Referer=...)
+  url, has_params, params = line.partition("|")
+  item.url = url
+  if has_params:
+    headers = {}
+    for p in params.split("|", 1)[0].split("&"):
+      k, has_value, v = p.partition("=")
+      if not has_value:
+        continue
+      k_lower = k.lower()
+      if k_lower == "user-agent":
+        item.user_agent = _intern(v)
+      elif k_lower == "referer":
+        item.referer = _intern(v)
+      elif k_lower == "cookie":
+        item.cookie = v
+      else:
+        headers[k] = v
+    # Over those of #EXTHTTP
+    item.headers = {**item.headers, **headers}
+
+
+def _set_field(item: PlaylistItem, field: str, value: str) -> None:
+  # Cookies are mostly unique to a channel, not worth interning
+  setattr(item, field, value if field == "cookie" else sys.intern(value))
+
+
+def _extinf(item: PlaylistItem, line: str) -> None:
+  # Extract Attributes (tvg-logo, group-title, the last of each)
+  # Regex for key="value" or key=value
+  tvg_logo = group_title = ""
+  for name, value in EXTINF_ATTR_RE.findall(line):
+    if name == "tvg-logo":
+      tvg_logo = value
+    elif name == "group-title":
+      group_title = value
+  item.tvg_logo = sys.intern(tvg_logo.strip('"'))
+  item.group_title = sys.intern(group_title.strip('"'))
+
+  # Extract Title (everything after the last comma)
+  title_split = line.rsplit(',', 1)
+  item.title = title_split[1].strip() if len(title_split) > 1 else "Unknown Channel"
+
+
+def _extvlcopt(item: PlaylistItem, line: str) -> None:
+  # VLC option, #EXTVLCOPT:name=value
+  name, _, value = line.partition(":")[2].partition("=")
+  field = VLC_OPTION_FIELDS.get(name.strip().lower())
+  if field:
+    _set_field(item, field, value.strip())
 
 
-def parse_m3u(content: str):
-  lines = content.splitlines()
-  items: list[PlaylistItem] = []
-  current_item = None
+def _exthttp(item: PlaylistItem, line: str) -> None:
+  # Custom HTTP headers format often found in these M3Us, a JSON object
+  try:
+    data = JSON_DECODER.raw_decode(line.partition(":")[2].strip())[0]
+  except ValueError as e:
+    log_error("m3u_parser", f"Ignoring invalid #EXTHTTP JSON ({e}): {line[:100]}")
+    return
+  if not isinstance(data, dict):
+    log_error("m3u_parser", f"Ignoring #EXTHTTP that isn't a JSON object: {line[:100]}")
+    return
+
+  for name, value in data.items():
+    if not isinstance(value, str):
+      continue
+    field = HTTP_HEADER_FIELDS.get(name.lower())
+    if field:
+      _set_field(item, field, value)
+    elif item._headers is None:
+      item._headers = {name: value}
+    else:
+      item._headers[name] = value
+
+
+def _kodiprop(item: PlaylistItem, line: str) -> None:
+  # Kodi ListItem property, #KODIPROP:key=value
+  key, _, value = line.partition(":")[2].partition("=")
+  key = key.strip().lower()
+  value = value.strip()
+  if key == LICENSE_KEY_PROPERTY:
+    # License String for DRM
+    item.license_string = value
+  elif value and (key == INPUTSTREAM_PROPERTY or key.startswith(INPUTSTREAM_PROPERTY_PREFIX)):
+    if item._kodi_properties is None:
+      item._kodi_properties = {}
+    item._kodi_properties[key] = sys.intern(value)
 
-  # Buffers for properties appearing before the URL line
-  buf_user_agent = None
-  buf_cookie = None
-  buf_referer = None
-  buf_license_string = None
-  buf_attrs = None
-  buf_title = None
 
+# Handlers of the directives understood before a URL line, looked up by
+# the character at DIRECTIVE_KEY_INDEX (the first position where all their
+# names differ) then checked against the whole name: a single lookup per line.
+# BATCH_ENTRY_RE leaves entries with any of them but #EXTINF to _parse_entry()
+DIRECTIVES: tuple[tuple[str, Callable[[PlaylistItem, str], None]], ...] = (
+  ("#EXTINF", _extinf),
+  ("#EXTVLCOPT", _extvlcopt),
+  ("#EXTHTTP", _exthttp),
+  ("#KODIPROP", _kodiprop),
+)
+DIRECTIVE_KEY_INDEX = 5
+DIRECTIVES_BY_KEY = {name[DIRECTIVE_KEY_INDEX]: (name, handler) for name, handler in DIRECTIVES}
+assert len(DIRECTIVES_BY_KEY) == len(DIRECTIVES), "directive names must differ at DIRECTIVE_KEY_INDEX"
+
+
+def _parse_entry(lines: list[str]) -> Optional[PlaylistItem]:
+  """
+  Builds the PlaylistItem of an entry: its stripped, non-empty lines, the
+  last one being the URL line (None when there is none).
+  """
+  item = PlaylistItem()
   for line in lines:
+    if line[0] != "#":
+      break
+    # One character strings are cached, no new string to hash
+    directive = DIRECTIVES_BY_KEY.get(line[DIRECTIVE_KEY_INDEX:DIRECTIVE_KEY_INDEX + 1])
+    if directive is not None and line.startswith(directive[0]):
+      directive[1](item, line)
+  else:
+    return None
+
+  # Must be URL Line
+  item.is_drm = bool(item.license_string)
+  _parse_url_line(item, line)
+  return item
+
+
+def iter_m3u(stream: Iterable[Union[str, bytes]]) -> Iterator[PlaylistItem]:
+  """
+  Parses an M3U playlist lazily, line by line.
+  Accepts the whole content, an iterable of lines (e.g. a text file) or an
+  iterable of UTF-8 byte chunks (e.g. a streamed HTTP response) and yields
+  every PlaylistItem as soon as its URL line has been read.
+  """
+  for block in iter_m3u_blocks(stream):
+    yield _parse_entry(block)
+
+
+def iter_m3u_blocks(stream: Iterable[Union[str, bytes]]) -> Iterator[list[str]]:
+  """
+  Splits an M3U playlist into its entries: the stripped, non-empty lines up to
+  and including each URL line. Entries are independent of each other, so
+  iter_m3u(block) yields exactly the PlaylistItem of a block.
+  """
+  block = []
+  for line in _iter_lines(stream):
     line = line.strip()
     if not line:
       continue
+    block.append(line)
+    if line[0] != "#":
+      yield block
+      block = []
 
-    if line.startswith("#EXTINF"):
-      # Extract Attributes (tvg-logo, group-title)
-      # Regex for key="value" or key=value
-      matches = re.findall(r'([a-zA-Z0-9_-]+)=("[^"]*"|[^,]+)', line)
-      attrs = {m[0]: m[1].strip('"') for m in matches}
 
-      buf_attrs = attrs
+def _entries_end(text: str, final: bool) -> int:
+  """
+  Position right after the last URL line of the text (and its line break),
+  0 if there is none. Unless final, the text may end mid-line and only
+  complete lines count.
+  """
+  end = len(text) if final and text[-1:] != "\n" else text.rfind("\n")
+  while end >= 0:
+    start = text.rfind("\n", 0, end) + 1
+    line = text[start:end].strip()
+    if line and line[0] != "#":
+      return end + 1
+    end = start - 1
+  return 0
 
-      # Extract Title (everything after the last comma)
-      title_split = line.rsplit(',', 1)
-      if len(title_split) > 1:
-        buf_title = title_split[1].strip()
-      else:
-        buf_title = "Unknown Channel"
-
-    elif line.startswith("#EXTVLCOPT"):
-      # Handle VLC Options
-      if "http-user-agent=" in line:
-        buf_user_agent = line.split("http-user-agent=")[1]
-      if "http-referrer=" in line:
-        buf_referer = line.split("http-referrer=")[1]
-
-    elif line.startswith("#EXTHTTP"):
-      # Custom HTTP headers format often found in these M3Us
-      try:
-        json_str = line.replace("#EXTHTTP:", "")
-        data = json.loads(json_str)
-        if "cookie" in data:
-          buf_cookie = data["cookie"]
-        if "user-agent" in data:
-          buf_user_agent = data["user-agent"]
-      except:
-        pass
-
-    elif line.startswith("#KODIPROP:inputstream.adaptive.license_key="):
-      # License String for DRM
-      buf_license_string = line.split("=", 1)[1]
-
-    elif not line.startswith("#"):
-      # Must be URL Line
-      current_item = PlaylistItem()
-
-      # Apply buffered items
-      if buf_user_agent:
-        current_item.user_agent = buf_user_agent
-      if buf_cookie:
-        current_item.cookie = buf_cookie
-      if buf_referer:
-        current_item.referer = buf_referer
-      if buf_license_string:
-        current_item.license_string = buf_license_string
-        current_item.is_drm = True
-      if buf_attrs:
-        if "tvg-logo" in buf_attrs:
-          current_item.tvg_logo = buf_attrs["tvg-logo"]
-        if "group-title" in buf_attrs:
-          current_item.group_title = buf_attrs["group-title"]
-      if buf_title:
-        current_item.title = buf_title
-
-      # Reset buffers
-      buf_user_agent = None
-      buf_cookie = None
-      buf_referer = None
-      buf_license_string = None
-      buf_attrs = None
-      buf_title = None
-
-      full_url_line = line
-
-      # Handle pipe separated parameters (url|User-Agent=...&Referer=...)
-      if "|" in full_url_line:
-        url_parts = full_url_line.split("|")
-        current_item.url = url_parts[0]
-        params = url_parts[1].split("&")
-        for p in params:
-          if "=" in p:
-            k, v = p.split("=", 1)
-            if k.lower() == "user-agent":
-              current_item.user_agent = v
-            elif k.lower() == "referer":
-              current_item.referer = v
-            elif k.lower() == "cookie":
-              current_item.cookie = v
-            else:
-              current_item.headers[k] = v
-      else:
-        current_item.url = full_url_line
 
-      items.append(current_item)
-      current_item = None  # Reset for next item
+def _has_unusual_line_break(text: str) -> bool:
+  # Substring searches, much faster than a regex over a whole playlist
+  if "\r" in text and text.count("\r") != text.count("\r\n"):
+    return True
+  return any(char in text for char in UNUSUAL_LINE_BREAKS)
+
+
+def _directive_share(text: str, end: int) -> float:
+  """
+  Share of the first DIRECTIVE_SAMPLE_ENTRIES entries of text[:end] with
+  directives besides #EXTINF.
+  """
+  entries = with_directives = 0
+  has_directive = False
+  position = 0
+  while position < end and entries < DIRECTIVE_SAMPLE_ENTRIES:
+    line_end = text.find("\n", position, end)
+    if line_end < 0:
+      line_end = end
+    line = text[position:line_end].strip()
+    position = line_end + 1
+    if not line:
+      continue
+    if line[0] != "#":
+      entries += 1
+      with_directives += has_directive
+      has_directive = False
+      continue
+    directive = DIRECTIVES_BY_KEY.get(line[DIRECTIVE_KEY_INDEX:DIRECTIVE_KEY_INDEX + 1])
+    if directive is not None and directive[1] is not _extinf and line.startswith(directive[0]):
+      has_directive = True
+  return with_directives / entries if entries else 0.0
+
+
+def _batch_entries(text: str, end: int) -> Iterator[tuple[str, Optional[PlaylistItem]]]:
+  for entry, logo, group, title, url, block in BATCH_ENTRY_RE.findall(text, 0, end):
+    if block:
+      yield block, None
+      continue
+    if ',' in title:
+      # After the last comma of the line
+      title = title.rsplit(',', 1)[1]
+    item = PlaylistItem(title.strip(), "", logo, group)
+    _parse_url_line(item, url.rstrip())
+    yield entry, item
+
+
+def iter_m3u_entries(stream: Union[str, bytes, Iterable[bytes]]) -> Iterator[tuple[str, Optional[PlaylistItem]]]:
+  """
+  Splits an M3U playlist into its entries in batch, a regex extracting the
+  title, logo, group and URL of all the plain entries (no directives
+  besides #EXTINF) of large blocks at once. Blocks where most entries have
+  directives are parsed line by line instead.
+  Accepts the whole content or an iterable of UTF-8 byte chunks and yields
+  every entry's text, along with its PlaylistItem for plain entries and for
+  all those of blocks parsed line by line, and None for the others, to parse
+  with parse_m3u_entry(). Entries are independent of each other.
+  """
+  if isinstance(stream, (str, bytes, bytearray)):
+    stream = (stream,)
+  chunks = iter(stream)
+  decoder = codecs.getincrementaldecoder("utf-8")()
+  pending = ""
+
+  for chunk in itertools.chain(chunks, (None,)):
+    final = chunk is None
+    if final:
+      text = pending + decoder.decode(b"", final=True)
+    else:
+      text = pending + (chunk if isinstance(chunk, str) else decoder.decode(chunk))
+    # Up to the last URL line: every line start then begins an entry the
+    # regex matches. Lines after it wait for the next chunk (or, at the
+    # end, have no URL line and make no entry)
+    end = _entries_end(text, final)
+
+    if _has_unusual_line_break(text if final else text[:end]):
+      # Left to the line parser, for the rest of the playlist
+      rest = itertools.chain((text.encode() + decoder.getstate()[0],), chunks)
+      for block in iter_m3u_blocks(rest):
+        yield "\n".join(block), None
+      return
+
+    if _directive_share(text, end) >= LINE_PARSER_DIRECTIVE_SHARE:
+      for block in iter_m3u_blocks((text[:end],)):
+        yield "\n".join(block), _parse_entry(block)
+    else:
+      yield from _batch_entries(text, end)
+    pending = text[end:]
+
+
+def parse_m3u_entry(text: str) -> Optional[PlaylistItem]:
+  """
+  Parses an entry of iter_m3u_entries() line by line.
+  """
+  return _parse_entry([line for line in map(str.strip, text.splitlines()) if line])
+
+
+def iter_m3u_batch(stream: Union[str, bytes, Iterable[bytes]]) -> Iterator[PlaylistItem]:
+  """
+  Parses an M3U playlist lazily, in batch (see iter_m3u_entries()).
+  """
+  for text, item in iter_m3u_entries(stream):
+    yield item if item is not None else parse_m3u_entry(text)
+
 
-  return items
+def parse_m3u(content: str) -> list[PlaylistItem]:
+  return list(iter_m3u_batch(content))
@@ -0,0 +1,204 @@
+import json
+import time
+import functools
+import threading
+from typing import Iterable, Iterator, Optional
+from lib.config import ADDON, PROFILE_PATH
+from lib.logger import log_error, log_info
+from lib.files import write_atomic
+from lib.locks import ProfileLock
+
+"""
+  Lightweight timing of the hot paths (fetch, decrypt, parse, cache, render).
+
+  with span("parse"):
+    ...
+
+  @timed("fetch")
+  def fetch(...):
+    ...
+
+  for chunk in timed_iter("decrypt", chunks):  # Time spent producing chunks
+    ...
+
+  Disabled unless one of the diagnostics settings is on: span() then returns
+  a shared no-op context manager and timed() leaves functions undecorated.
+"""
+
+PERF_STATS_FILE_PATH = PROFILE_PATH / "perf_stats.json"
+PERF_STATS_MAX_SAMPLES = 500  # Most recent samples kept per span
+PERF_STATS_PERCENTILES = (50, 90, 99)
+PERF_STATS_LOCK_TIMEOUT = 1  # Seconds waited for another process updating the stats, else the timings are dropped
+
+LOG_SUMMARY = ADDON.getSettingBool('perf_log_summary')
+RECORD_STATS = ADDON.getSettingBool('perf_record_stats')
+ENABLED = LOG_SUMMARY or RECORD_STATS
+
+_timings: dict[str, list[float]] = {}
+_timings_lock = threading.Lock()
+
+
+class _NullSpan:
+  __slots__ = ()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    return False
+
+  def exclude(self, elapsed: float) -> None:
+    pass
+
+
+class _Span:
+  __slots__ = ("name", "started", "excluded")
+
+  def __init__(self, name: str):
+    self.name = name
+    self.excluded = 0.0
+
+  def __enter__(self):
+    self.started = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc_info):
+    _record(self.name, time.perf_counter() - self.started - self.excluded)
+    return False
+
+  def exclude(self, elapsed: float) -> None:
+    """
+    Takes time measured under another name out of this span.
+    """
+    self.excluded += elapsed
+
+
+def _record(name: str, elapsed: float) -> None:
+  with _timings_lock:
+    _timings.setdefault(name, []).append(elapsed)
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str):
+  """
+  Context manager timing the enclosed block under name.
+  """
+  return _Span(name) if ENABLED else _NULL_SPAN
+
+
+def timed(name: str):
+  """
+  Decorator timing every call of the function under name.
+  """
+  def decorator(func):
+    if not ENABLED:
+      return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+      with _Span(name):
+        return func(*args, **kwargs)
+    return wrapper
+  return decorator
+
+
+def timed_iter(name: str, iterable: Iterable, within: Optional[_Span] = None) -> Iterator:
+  """
+  Iterates over iterable, timing the production of its items (e.g. chunks
+  decrypted as a parser asks for them) as a single sample under name. That
+  time is taken out of the span within, the consumer's, when given.
+  """
+  if not ENABLED:
+    return iter(iterable)
+  return _timed_iter(name, iter(iterable), within or _NULL_SPAN)
+
+
+def _timed_iter(name: str, iterator: Iterator, within) -> Iterator:
+  elapsed = 0.0
+  try:
+    while True:
+      started = time.perf_counter()
+      try:
+        item = next(iterator)
+      except StopIteration:
+        return
+      finally:
+        step = time.perf_counter() - started
+        elapsed += step
+        within.exclude(step)
+      yield item
+  finally:
+    _record(name, elapsed)
+
+
+def _percentile(sorted_samples: list[float], percentile: int) -> float:
+  # Nearest rank
+  rank = max(1, -(-len(sorted_samples) * percentile // 100))
+  return sorted_samples[rank - 1]
+
+
+def _record_stats(timings: dict[str, list[float]]) -> None:
+  # Plugin invocations and the service flush side by side, an update made
+  # between another process' read and write would be lost
+  lock = ProfileLock("perf_stats")
+  if not lock.acquire(PERF_STATS_LOCK_TIMEOUT):
+    return
+  try:
+    _update_stats(timings)
+  finally:
+    lock.release()
+
+
+def _update_stats(timings: dict[str, list[float]]) -> None:
+  try:
+    stats = json.loads(PERF_STATS_FILE_PATH.read_text(encoding="utf-8"))
+  except FileNotFoundError:
+    stats = {}
+  except Exception as e:
+    log_error("perf", f"Resetting unreadable timing stats: {e}")
+    stats = {}
+
+  for name, durations in timings.items():
+    entry = stats.get(name) or {}
+    samples = (entry.get("samples", []) + [d * 1000 for d in durations])
+    samples = samples[-PERF_STATS_MAX_SAMPLES:]
+    ordered = sorted(samples)
+    entry = {
+      "count": entry.get("count", 0) + len(durations),
+      "samples": samples,
+    }
+    for percentile in PERF_STATS_PERCENTILES:
+      entry[f"p{percentile}_ms"] = round(_percentile(ordered, percentile), 3)
+    stats[name] = entry
+
+  write_atomic(PERF_STATS_FILE_PATH, json.dumps(stats))
+
+
+def flush(label: str) -> None:
+  """
+  Ends the timings of this invocation: logs their summary and/or adds them
+  to the cumulative stats in the addon profile, as configured.
+  """
+  if not ENABLED:
+    return
+  with _timings_lock:
+    timings = dict(_timings)
+    _timings.clear()
+  if not timings:
+    return
+
+  if LOG_SUMMARY:
+    summary = ", ".join(
+      f"{name} {sum(durations) * 1000:.1f}ms" +
+      (f" ({len(durations)}x)" if len(durations) > 1 else "")
+      for name, durations in timings.items()
+    )
+    log_info("perf", f"[{label}] {summary}")
+
+  if RECORD_STATS:
+    try:
+      _record_stats(timings)
+    except Exception as e:
+      log_error("perf", f"Failed to record timing stats: {e}")
@@ -0,0 +1,86 @@
+import re
+from urllib.parse import urlencode
+from lib.m3u_parser import PlaylistItem, INPUTSTREAM_PROPERTY, LICENSE_KEY_PROPERTY
+
+"""
+  Playback descriptors
+  Everything play_video needs to resolve a channel (final path and the
+  ListItem properties for inputstream.adaptive), computed once when the
+  playlist is parsed and stored with the channel.
+"""
+
+# Manifests played through inputstream.adaptive ('.m3u' also covers '.m3u8')
+ADAPTIVE_URL_MARKERS = ('.mpd', '.m3u')
+# Clearkey license given inline as KID:KEY (one or more hex digits each side)
+HEX_PAIR_RE = re.compile(r'^[0-9a-fA-F]+:[0-9a-fA-F]+$')
+CLEARKEY_SYSTEM = "org.w3.clearkey"
+ADAPTIVE_ADDON = "inputstream.adaptive"
+LICENSE_TYPE_PROPERTY = "inputstream.adaptive.license_type"
+# License types converted to drm_legacy, any other is handed over as declared
+CLEARKEY_LICENSE_TYPES = frozenset((CLEARKEY_SYSTEM, "clearkey"))
+
+
+def stream_headers(channel: PlaylistItem) -> dict:
+  """
+  Request headers the channel's stream expects: its own, then its
+  User-Agent, Referer and Cookie.
+  """
+  # A dictionary either way, faster than dict() on the read-only empty mapping
+  headers = channel.headers.copy()
+  if channel.user_agent:
+    headers['User-Agent'] = channel.user_agent
+  if channel.referer:
+    headers['Referer'] = channel.referer
+  if channel.cookie:
+    headers['Cookie'] = channel.cookie
+  return headers
+
+
+def build_playback(channel: PlaylistItem) -> dict:
+  """
+  Resolves how a channel is played.
+  :return: Dictionary with the "path" to hand to Kodi and the ListItem
+    "properties" to set, in order.
+  """
+  url = channel.url
+  properties = {}
+  # Declared by the playlist (#KODIPROP), taking precedence over the defaults below
+  declared = channel.kodi_properties
+
+  headers = stream_headers(channel)
+
+  license_string = channel.license_string
+  if declared.get(INPUTSTREAM_PROPERTY, ADAPTIVE_ADDON) != ADAPTIVE_ADDON:
+    # Another inputstream add-on, set up as declared
+    properties.update(declared)
+  elif license_string or declared or any(marker in url for marker in ADAPTIVE_URL_MARKERS):
+    properties['inputstream'] = ADAPTIVE_ADDON
+
+    if headers:
+      # Construct standard headers string for Kodi
+      encoded_headers = '&'.join([f'{k}={v}' for k, v in headers.items()])
+      properties['inputstream.adaptive.manifest_headers'] = encoded_headers
+      properties['inputstream.adaptive.stream_headers'] = encoded_headers
+      url += '|' + encoded_headers
+
+    license_type = declared.get(LICENSE_TYPE_PROPERTY, CLEARKEY_SYSTEM)
+    if license_string and license_type not in CLEARKEY_LICENSE_TYPES:
+      # Other DRM systems (e.g. Widevine), license key in the playlist's format
+      properties[LICENSE_TYPE_PROPERTY] = license_type
+      properties[LICENSE_KEY_PROPERTY] = license_string
+    elif license_string:
+      if HEX_PAIR_RE.match(license_string):
+        properties['inputstream.adaptive.drm_legacy'] = f"{CLEARKEY_SYSTEM}|{license_string}"
+      # Clearkey license server
+      elif license_string.startswith('http'):
+        # Imported here, lib.req loads the whole requests stack
+        from lib.req import license_headers
+        properties['inputstream.adaptive.drm_legacy'] = (
+          f"{CLEARKEY_SYSTEM}|{license_string}|{urlencode(license_headers)}")
+
+    for key, value in declared.items():
+      # The clearkey license type is given through drm_legacy
+      if key != LICENSE_TYPE_PROPERTY or license_type not in CLEARKEY_LICENSE_TYPES:
+        properties[key] = value
+
+  return {'path': url, 'properties': properties}
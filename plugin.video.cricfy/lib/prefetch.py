@@ -0,0 +1,150 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Hashable, Iterable, Optional, TypeVar
+from urllib.parse import urlparse
+import xbmc
+from lib.logger import log_error, log_info
+from lib.providers import refresh_channels_once
+
+POLL_INTERVAL = 0.5  # Seconds between abort/time budget checks
+
+K = TypeVar("K", bound=Hashable)
+T = TypeVar("T")
+
+
+class _Cancelled(Exception):
+  """
+  Raised by tasks skipped after a stop.
+  """
+
+
+class RateLimiter:
+  """
+  Spaces out task starts to at most rate per second, across threads.
+  """
+
+  def __init__(self, rate: float):
+    self.interval = 1 / rate if rate > 0 else 0
+    self._next_start = 0.0
+    self._lock = threading.Lock()
+
+  def wait(self, stop: threading.Event) -> bool:
+    """
+    Blocks until the caller may start.
+    :return: False if stop was set in the meantime.
+    """
+    if not self.interval:
+      return not stop.is_set()
+    with self._lock:
+      now = time.monotonic()
+      start = max(now, self._next_start)
+      self._next_start = start + self.interval
+    return not stop.wait(start - now)
+
+
+def run_bounded(
+  items: Iterable[K],
+  task: Callable[[K], T],
+  host_of: Callable[[K], str],
+  max_workers: int = 4,
+  max_per_host: int = 2,
+  rate: float = 0,
+  time_budget: float = 120,
+  monitor: Optional[xbmc.Monitor] = None,
+  component: str = "prefetch",
+) -> dict[K, T]:
+  """
+  Runs task on every item in parallel, with at most max_workers at once,
+  at most max_per_host against the same server and, when rate is set, at
+  most rate starts per second. Tasks not started within time_budget
+  seconds, or when Kodi asks the add-on to abort, are cancelled.
+  :return: Results of the tasks that completed, by item. Failures are logged.
+  """
+  items = list(dict.fromkeys(items))
+  if not items:
+    return {}
+
+  monitor = monitor or xbmc.Monitor()
+  stop = threading.Event()
+  limiter = RateLimiter(rate)
+  host_limits = {}
+  host_limits_lock = threading.Lock()
+
+  def _host_limit(item: K) -> threading.BoundedSemaphore:
+    with host_limits_lock:
+      host = host_of(item)
+      if host not in host_limits:
+        host_limits[host] = threading.BoundedSemaphore(max(1, max_per_host))
+      return host_limits[host]
+
+  def _run(item: K):
+    with _host_limit(item):
+      if stop.is_set() or not limiter.wait(stop):
+        raise _Cancelled()
+      return task(item)
+
+  deadline = time.monotonic() + time_budget
+  executor = ThreadPoolExecutor(
+    max_workers=max(1, max_workers), thread_name_prefix=f"cricfy-{component}")
+  pending = {executor.submit(_run, item): item for item in items}
+  results = {}
+
+  try:
+    while pending:
+      if monitor.abortRequested():
+        log_info(component, "Abort requested, cancelling remaining tasks")
+        break
+      if time.monotonic() >= deadline:
+        log_info(component, "Time budget exhausted, cancelling remaining tasks")
+        break
+
+      done, _ = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+      for future in done:
+        item = pending.pop(future)
+        try:
+          results[item] = future.result()
+        except _Cancelled:
+          pass
+        except Exception as e:
+          log_error(component, f"Task failed for {item}: {e}")
+  finally:
+    stop.set()
+    for future in pending:
+      future.cancel()
+    # Tasks already running finish on their own (bounded by their timeout)
+    executor.shutdown(wait=False)
+
+  return results
+
+
+def prefetch_channels(
+  provider_urls: Iterable[str],
+  max_workers: int = 4,
+  max_per_host: int = 2,
+  time_budget: float = 120,
+  monitor: Optional[xbmc.Monitor] = None,
+) -> int:
+  """
+  Fetches, decrypts and parses the playlists of all providers in parallel to
+  fill the channel cache ahead of the user opening them. Providers a plugin
+  invocation is fetching at the same time aren't fetched twice.
+  At most max_workers downloads run at once, and at most max_per_host
+  against the same server. Downloads not started within time_budget seconds,
+  or when Kodi asks the add-on to abort, are cancelled.
+  :return: Number of providers prefetched successfully.
+  """
+  urls = list(dict.fromkeys(provider_urls))
+  results = run_bounded(
+    urls,
+    refresh_channels_once,
+    lambda url: urlparse(url).netloc,
+    max_workers=max_workers,
+    max_per_host=max_per_host,
+    time_budget=time_budget,
+    monitor=monitor,
+    component="prefetch",
+  )
+  if urls:
+    log_info("prefetch", f"Prefetched {len(results)}/{len(urls)} providers")
+  return len(results)
@@ -1,35 +1,162 @@
 import time
 import json
 import hashlib
-from lib.config import cache
+import threading
+from typing import BinaryIO, Iterable, Iterator, Optional, Union
+from lib.config import PROFILE_PATH, cache
 from lib.logger import log_error, log_info
-from lib.crypto_utils import decrypt_content, decrypt_data
-from lib.req import fetch_url
-from lib.m3u_parser import PlaylistItem, parse_m3u
-from lib.remote_config import get_provider_api_url
+from lib.perf import span, timed, timed_iter
+from lib.m3u_parser import PlaylistItem, iter_m3u_entries, parse_m3u_entry
+from lib.channel_store import ChannelFile, write_channel_file
+from lib.playback import build_playback
+from lib.search import has_search_index, update_search_index_in_background
+from lib.locks import ProfileLock, single_flight
+from lib.files import write_atomic
+
+# The network and crypto stack (requests, Cryptodome, Firebase config) is only
+# imported by the functions hitting the network, so cache hits never load it.
 
 PROVIDERS_CACHE_KEY = "cricfy_providers"
-CHANNEL_CACHE_TTL = 3600  # 1 hour
+# Last decrypted cats.txt by ciphertext digest, kept in the profile so an
+# unchanged provider list is never decrypted again, even after cache clears
+PROVIDERS_MEMO_FILE_PATH = PROFILE_PATH / "providers_memo.json"
+CHANNEL_CACHE_SOFT_TTL = 3600  # 1 hour, served without refreshing
+CHANNEL_CACHE_HARD_TTL = 24 * 3600  # 1 day, served while refreshing in background
+# Bumped whenever the layout of cached channels changes, older entries are refetched
+CHANNEL_CACHE_VERSION = 10
+# Channel lists (lib.channel_store files), named after the metadata pointing at them
+CHANNEL_FILES_DIR = PROFILE_PATH / "channels"
 
 
-def _hash_key(key: str) -> str:
+def hash_key(key: str) -> str:
   """
   Simple hash function for caching keys.
   """
   return hashlib.sha256(key.encode()).hexdigest()
 
 
+def _digest(text: str) -> str:
+  """
+  Content digest used to detect unchanged payloads and playlist entries.
+  """
+  return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def _open_channel_file(provider_hash: str, meta: dict) -> Optional[ChannelFile]:
+  """
+  Maps the channel file the metadata points at, None if it is gone or
+  unreadable (e.g. from an older version).
+  """
+  file_name = meta.get('file')
+  if not file_name:
+    return None
+  try:
+    return ChannelFile(CHANNEL_FILES_DIR / file_name)
+  except FileNotFoundError:
+    return None
+  except Exception as e:
+    log_error("providers", f"Ignoring unreadable channel file {file_name}: {e}")
+    return None
+
+
+def _remove_channel_file(file_name: str) -> None:
+  try:
+    (CHANNEL_FILES_DIR / file_name).unlink()
+  except FileNotFoundError:
+    pass
+  except OSError as e:
+    # Still mapped by another process on some platforms, dropped on next startup
+    log_error("providers", f"Failed to remove channel file {file_name}: {e}")
+
+
+def clear_channel_files() -> None:
+  """
+  Removes every channel file, to go along with a cleared cache.
+  """
+  if CHANNEL_FILES_DIR.is_dir():
+    for path in CHANNEL_FILES_DIR.iterdir():
+      _remove_channel_file(path.name)
+
+
+def _read_providers_memo(digest: str) -> Optional[str]:
+  try:
+    memo = json.loads(PROVIDERS_MEMO_FILE_PATH.read_text(encoding="utf-8"))
+  except FileNotFoundError:
+    return None
+  except Exception as e:
+    log_error("providers", f"Ignoring unreadable providers memo: {e}")
+    return None
+  if memo.get('digest') == digest:
+    return memo.get('data')
+  return None
+
+
+def _write_providers_memo(digest: str, data: str) -> None:
+  try:
+    write_atomic(PROVIDERS_MEMO_FILE_PATH, json.dumps({'digest': digest, 'data': data}))
+  except Exception as e:
+    log_error("providers", f"Failed to write providers memo: {e}")
+
+
+def _decrypt_providers(response: str) -> Optional[str]:
+  """
+  Decrypts cats.txt, unless the same ciphertext was decrypted before.
+  """
+  from lib.crypto_utils import decrypt_data
+
+  digest = _digest(response)
+  decrypted_data = _read_providers_memo(digest)
+  if decrypted_data:
+    return decrypted_data
+  decrypted_data = decrypt_data(response)
+  if decrypted_data:
+    _write_providers_memo(digest, decrypted_data)
+  return decrypted_data
+
+
+def get_cached_providers() -> list:
+  """
+  Returns the providers if they are cached, without any network access.
+  """
+  cached_providers = cache.get(PROVIDERS_CACHE_KEY)
+  if cached_providers and isinstance(cached_providers, str):
+    return json.loads(cached_providers)
+  return []
+
+
 def get_providers():
   """
   Fetches and decrypts the list of providers from Cricfy.
-  Uses caching to avoid repeated network calls.
+  Uses caching to avoid repeated network calls. Plugin invocations missing
+  the cache at the same time fetch it once, the others wait for the result.
   """
   cached_providers = cache.get(PROVIDERS_CACHE_KEY)
   if cached_providers and isinstance(cached_providers, str):
     return json.loads(cached_providers)
 
+  with single_flight(PROVIDERS_CACHE_KEY):
+    # Possibly cached by the invocation waited for
+    cached_providers = cache.get(PROVIDERS_CACHE_KEY)
+    if cached_providers and isinstance(cached_providers, str):
+      return json.loads(cached_providers)
+    return _fetch_providers()
+
+
+def refresh_providers() -> list:
+  """
+  Fetches and decrypts the list of providers again, whatever the state of
+  the cache. The cached list stays when the fetch fails.
+  """
+  with single_flight(PROVIDERS_CACHE_KEY):
+    return _fetch_providers()
+
+
+def _fetch_providers() -> list:
   log_info("providers", "[Cache Miss] Fetching providers from remote URL")
 
+  from lib.remote_config import get_provider_api_url
+  from lib.req import fetch_url
+
   url = get_provider_api_url()
 
   if not url:
@@ -42,7 +169,7 @@ def get_providers():
   )
   if response:
     try:
-      decrypted_data = decrypt_data(response)
+      decrypted_data = _decrypt_providers(response)
       if not decrypted_data:
         return []
 
@@ -63,28 +190,452 @@ def get_channels(provider_url: str):
   """
   Fetches channels for a specific provider.
   """
-  channel_cache_key = f"channels_{_hash_key(provider_url)}"
-  cached_channels = cache.get(channel_cache_key)
-  if cached_channels and isinstance(cached_channels, str):
-    channel_data = json.loads(cached_channels)
-    fetch_time = float(channel_data.get('fetch_time'))
-    channels = json.loads(channel_data.get('channels', "[]"))
-    if (time.time() - fetch_time <= CHANNEL_CACHE_TTL) and isinstance(channels, list):
-      return [PlaylistItem.from_dict(item) for item in channels]
+  provider_hash = hash_key(provider_url)
+  meta = _get_channel_meta(provider_hash)
+  channels = _load_channels(provider_hash, meta) if meta else None
+  if channels is not None:
+    age = time.time() - float(meta.get('fetch_time', 0))
+    if age <= CHANNEL_CACHE_SOFT_TTL:
+      return channels
+    if age <= CHANNEL_CACHE_HARD_TTL:
+      _refresh_channels_in_background(provider_url)
+      return channels
+
+  try:
+    return _refresh_channels_once(
+      provider_url, meta, meta if channels is not None else None)
+  except Exception:
+    if channels is None:
+      raise
+    log_error(
+      "providers", f"Serving stale channels of M3U URL ({provider_url})")
+    return channels
+
+
+def _refresh_lock_name(provider_hash: str) -> str:
+  return f"channels_{provider_hash}"
+
+
+def _refresh_channels_once(provider_url: str, seen_meta: Optional[dict],
+                           meta: Optional[dict]) -> list[PlaylistItem]:
+  """
+  refresh_channels(), unless another plugin invocation is already
+  refreshing the provider: waits for it instead and serves its result.
+  :param seen_meta: Metadata the caller found in cache, if any.
+  """
+  provider_hash = hash_key(provider_url)
+  with single_flight(_refresh_lock_name(provider_hash)):
+    current = _get_channel_meta(provider_hash)
+    if current and current.get('fetch_time') != (seen_meta or {}).get('fetch_time'):
+      # Refreshed by the invocation waited for
+      channels = _load_channels(provider_hash, current)
+      if channels is not None:
+        return channels
+    log_info(
+      "providers", f"[Cache Miss] Fetching M3U URL ({provider_url}) content")
+    return refresh_channels(provider_url, meta)
+
+
+def refresh_channels_once(provider_url: str) -> list[PlaylistItem]:
+  """
+  Refreshes the channel cache of a provider, or serves the result of the
+  plugin invocation refreshing it at the same time.
+  """
+  meta = _get_channel_meta(hash_key(provider_url))
+  return _refresh_channels_once(provider_url, meta, meta)
+
+
+def channel_cache_age(provider_url: str) -> Optional[float]:
+  """
+  Seconds since the channels of a provider were fetched, None if they
+  aren't cached.
+  """
+  meta = _get_channel_meta(hash_key(provider_url))
+  return time.time() - float(meta.get('fetch_time', 0)) if meta else None
+
+
+@timed("cache_load")
+def _get_channel_meta(provider_hash: str) -> Optional[dict]:
+  """
+  Returns the metadata (fetch time, validators, digests, channel file) of the
+  cached channels of a provider if they are in the current layout.
+  """
+  cached_meta = cache.get(f"channels_meta_{provider_hash}")
+  if cached_meta and isinstance(cached_meta, str):
+    meta = json.loads(cached_meta)
+    if meta.get('version') == CHANNEL_CACHE_VERSION:
+      return meta
+  return None
+
+
+@timed("cache_load")
+def _load_channel_lists(provider_hash: str, meta: dict) -> Optional[list[list]]:
+  channel_file = _open_channel_file(provider_hash, meta)
+  if channel_file is None:
+    return None
+  with channel_file:
+    return channel_file.records()
+
+
+def _load_channels(provider_hash: str, meta: dict) -> Optional[list[PlaylistItem]]:
+  channel_lists = _load_channel_lists(provider_hash, meta)
+  if channel_lists is None:
+    return None
+  return [PlaylistItem.from_list(values) for values in channel_lists]
+
+
+def _hashing(chunks: Iterable[bytes], digest) -> Iterator[bytes]:
+  for chunk in chunks:
+    digest.update(chunk)
+    yield chunk
+
+
+def _new_digest():
+  # Incremental _digest(), fed with the UTF-8 encoded text
+  return hashlib.blake2b(digest_size=16)
+
+
+def _previous_entries(provider_hash: str, meta: Optional[dict]) -> dict[str, list]:
+  """
+  Channels of the cached copy (positional form) by the digest of their
+  entry, for refreshes to reuse those unchanged.
+  """
+  if not meta:
+    return {}
+  cached_digests = cache.get(f"channels_entries_{provider_hash}")
+  previous_lists = _load_channel_lists(provider_hash, meta)
+  if cached_digests and isinstance(cached_digests, str) and previous_lists:
+    previous_digests = json.loads(cached_digests)
+    if len(previous_digests) == len(previous_lists):
+      return dict(zip(previous_digests, previous_lists))
+  return {}
+
+
+def _parse_channels(content: Iterable[Union[str, bytes]],
+                    previous: dict[str, list]) -> tuple[list[PlaylistItem], list[str], int]:
+  """
+  Parses the M3U content (text or a stream of UTF-8 chunks), only
+  rebuilding the entries missing from the previous ones (_previous_entries).
+  :return: Tuple (channels, entry digests, number of parsed entries)
+  """
+  channels = []
+  digests = []
+  parsed = 0
+  for text, item in iter_m3u_entries(content):
+    digest = _digest(text)
+    digests.append(digest)
+    values = previous.get(digest)
+    if values is not None:
+      channels.append(PlaylistItem.from_list(values))
+      continue
+    # Entries not parsed already (see iter_m3u_entries) are parsed line by line
+    if item is None:
+      item = parse_m3u_entry(text)
+    if item is not None:
+      channels.append(item)
+    parsed += 1
+  return channels, digests, parsed
+
+
+def _parse_payload(provider_hash: str, body: BinaryIO,
+                   meta: Optional[dict]) -> tuple[list[PlaylistItem], list[str], int, str]:
+  """
+  Decrypts and parses a fetched M3U payload as it is read, in chunks.
+  :return: Tuple (channels, entry digests, number of parsed entries,
+    digest of the decrypted content)
+  """
+  from lib.crypto_utils import iter_content_chunks, iter_payload_chunks
+
+  previous = _previous_entries(provider_hash, meta)
+  content_digest = _new_digest()
+  # Chunks are decrypted as the parser asks for them, timed apart
+  with span("parse") as parse_span:
+    try:
+      parsed = _parse_channels(timed_iter(
+        "decrypt", _hashing(iter_content_chunks(body), content_digest), parse_span), previous)
+    except ValueError as e:
+      # Served as is then, like decrypt_content() does
+      log_error("providers", f"Content decryption failed: {e}")
+      content_digest = _new_digest()
+      parsed = _parse_channels(_hashing(iter_payload_chunks(body), content_digest), previous)
+  return (*parsed, content_digest.hexdigest())
 
+
+def _log_refresh_stats(provider_url: str, stats: dict) -> None:
   log_info(
-    "providers", f"[Cache Miss] Fetching M3U URL ({provider_url}) content")
+    "providers",
+    f"Refreshed M3U URL ({provider_url}): {stats['bytes']} bytes, "
+    f"{stats['changed']}/{stats['total']} channels changed, "
+    f"took {stats['duration']:.3f}s, saved ~{stats['saved']:.3f}s")
+
+
+def _refresh_unchanged(provider_url: str, provider_hash: str, meta: dict, response,
+                       raw_digest: str, channels: list[PlaylistItem], started: float,
+                       fetch_time: float) -> list[PlaylistItem]:
+  """
+  Refreshes the metadata of a cached copy found unchanged, without
+  serializing its channels again.
+  """
+  meta.update({
+    'fetch_time': fetch_time,
+    'etag': response.etag or meta.get('etag', ""),
+    'last_modified': response.last_modified or meta.get('last_modified', ""),
+    'raw_digest': raw_digest or meta.get('raw_digest', ""),
+  })
+  meta['stats'] = {
+    'bytes': response.size,
+    'changed': 0,
+    'total': len(channels),
+    'duration': time.perf_counter() - started,
+    'saved': meta.get('parse_time', 0) + meta.get('store_time', 0),
+  }
+  cache.set(f"channels_meta_{provider_hash}", json.dumps(meta))
+  if not has_search_index(provider_hash):
+    update_search_index_in_background(
+      provider_hash, provider_url, [ch.to_list() for ch in channels])
+  _log_refresh_stats(provider_url, meta['stats'])
+  return channels
+
+
+def refresh_channels(provider_url: str, meta: Optional[dict] = None) -> list[PlaylistItem]:
+  """
+  Fetches, decrypts and parses the M3U of a provider and (re)fills its
+  channel cache, whatever the state of the cached copy.
+  The payload is streamed: it is downloaded into a temporary file, then
+  decrypted and parsed chunk by chunk, never held whole in memory.
+  When the metadata of the cached copy is given, the refresh is cut short
+  as soon as the content is known to be unchanged (HTTP validators, then
+  digests of the raw and decrypted payloads), and only changed entries
+  are parsed again.
+  """
+  from lib.req import fetch_url_streamed
 
+  response = None
   try:
-    content = fetch_url(provider_url, timeout=15)
-    content = decrypt_content(content)
-    channels = parse_m3u(content)
-    cache.set(channel_cache_key, json.dumps({
-      'channels': json.dumps(channels, default=lambda o: o.to_dict()),
-      'fetch_time': time.time()
+    started = time.perf_counter()
+    provider_hash = hash_key(provider_url)
+    raw_digest = _new_digest()
+    response = fetch_url_streamed(
+      provider_url,
+      timeout=15,
+      etag=meta.get('etag', "") if meta else "",
+      last_modified=meta.get('last_modified', "") if meta else "",
+      on_chunk=raw_digest.update,
+    )
+    fetch_time = time.time()
+    raw_digest = "" if response.not_modified else raw_digest.hexdigest()
+
+    if meta and (response.not_modified or raw_digest == meta.get('raw_digest')):
+      channels = _load_channels(provider_hash, meta)
+      if channels is None:
+        # Cached channels are gone, start over
+        return refresh_channels(provider_url)
+      return _refresh_unchanged(provider_url, provider_hash, meta, response, raw_digest,
+                                channels, started, fetch_time)
+    if response.body is None:
+      raise ValueError("Empty response")
+
+    parse_started = time.perf_counter()
+    channels, entry_digests, parsed, content_digest = _parse_payload(
+      provider_hash, response.body, meta)
+    parse_time = time.perf_counter() - parse_started
+
+    if (meta and content_digest == meta.get('content_digest')
+            and (CHANNEL_FILES_DIR / meta.get('file', "")).is_file()):
+      return _refresh_unchanged(provider_url, provider_hash, meta, response, raw_digest,
+                                channels, started, fetch_time)
+
+    # Estimated from the previous full parse, per reused entry
+    saved = 0.0
+    if meta and meta.get('count'):
+      saved = meta.get('parse_time', 0) / meta['count'] * (len(channels) - parsed)
+
+    store_started = time.perf_counter()
+    with span("cache_store"):
+      channel_lists = [ch.to_list() for ch in channels]
+      # A new name for every content, processes still mapping the previous
+      # file keep reading it
+      file_name = f"{provider_hash}.{content_digest[:16]}.bin"
+      write_channel_file(CHANNEL_FILES_DIR / file_name, channel_lists,
+                         [build_playback(ch) for ch in channels])
+      cache.set(f"channels_entries_{provider_hash}", json.dumps(entry_digests))
+    store_time = time.perf_counter() - store_started
+
+    stats = {
+      'bytes': response.size,
+      'changed': parsed,
+      'total': len(channels),
+      'duration': time.perf_counter() - started,
+      'saved': saved,
+    }
+    # Written last, so readers never see metadata without its channels
+    cache.set(f"channels_meta_{provider_hash}", json.dumps({
+      'fetch_time': fetch_time,
+      'etag': response.etag,
+      'last_modified': response.last_modified,
+      'raw_digest': raw_digest,
+      'content_digest': content_digest,
+      'count': len(channels),
+      'file': file_name,
+      'parse_time': parse_time + saved,
+      'store_time': store_time,
+      'stats': stats,
+      'version': CHANNEL_CACHE_VERSION
     }))
+    if meta and meta.get('file') and meta['file'] != file_name:
+      _remove_channel_file(meta['file'])
+    # Not needed by the caller, written while it uses the channels
+    update_search_index_in_background(provider_hash, provider_url, channel_lists)
+    _log_refresh_stats(provider_url, stats)
     return channels
   except Exception as e:
     log_error(
       "providers", f"Error fetching M3U URL ({provider_url}) content: {e}")
     raise e
+  finally:
+    if response is not None and response.body is not None:
+      response.body.close()
+
+
+def _refresh_channels_in_background(provider_url: str) -> None:
+  """
+  Refreshes the channel cache of a provider without blocking the caller,
+  unless this or another plugin invocation is already refreshing it.
+  """
+  provider_hash = hash_key(provider_url)
+  lock = ProfileLock(_refresh_lock_name(provider_hash))
+  if not lock.acquire(timeout=0):
+    return
+
+  def _refresh():
+    try:
+      log_info(
+        "providers", f"[Stale] Refreshing M3U URL ({provider_url}) content in background")
+      refresh_channels(provider_url, _get_channel_meta(provider_hash))
+    except Exception:
+      pass  # Already logged, the stale copy stays in use
+    finally:
+      lock.release()
+
+  threading.Thread(target=_refresh, name="cricfy-channel-refresh").start()
+
+
+def _open_fresh_channel_file(provider_url: str, provider_hash: str) -> Optional[ChannelFile]:
+  """
+  Maps the channel file of a provider unless it is missing, unreadable or
+  expired. A stale one is still served while the provider is refreshed in
+  background.
+  """
+  meta = _get_channel_meta(provider_hash)
+  if not meta:
+    return None
+  age = time.time() - float(meta.get('fetch_time', 0))
+  if age > CHANNEL_CACHE_HARD_TTL:
+    return None
+  channel_file = _open_channel_file(provider_hash, meta)
+  if channel_file is not None and age > CHANNEL_CACHE_SOFT_TTL:
+    _refresh_channels_in_background(provider_url)
+  return channel_file
+
+
+def get_channel(provider_url: str, channel_title: str) -> Optional[PlaylistItem]:
+  """
+  Resolves a single channel of a provider for playback.
+  Reads only the record of the channel from the channel file and falls back
+  to the full channel list when the file is missing, expired or out of
+  date.
+  """
+  channel_file = _open_fresh_channel_file(provider_url, hash_key(provider_url))
+  if channel_file is not None:
+    with span("cache_load"), channel_file:
+      values = channel_file.find(channel_title)
+    if values is not None:
+      return PlaylistItem.from_list(values)
+
+  channels = get_channels(provider_url=provider_url)
+  return next((ch for ch in channels if ch.title == channel_title), None)
+
+
+def get_playback(provider_url: str, channel_title: str) -> Optional[dict]:
+  """
+  Returns the playback descriptor (lib.playback) of a channel, read from its
+  record in the channel file, or built from the channel when it has none.
+  """
+  channel_file = _open_fresh_channel_file(provider_url, hash_key(provider_url))
+  if channel_file is not None:
+    with span("cache_load"), channel_file:
+      playback = channel_file.find_playback(channel_title)
+    if playback is not None:
+      return playback
+
+  channel = get_channel(provider_url, channel_title)
+  return build_playback(channel) if channel else None
+
+
+class ChannelListing:
+  """
+  Channels of a provider resolved once for a listing, read from its channel
+  file or, when the cache keeps none, from the fetched channels. Close it
+  (or use it as a context manager).
+  """
+
+  def __init__(self, channel_file: Optional[ChannelFile] = None,
+               channels: Optional[list[PlaylistItem]] = None):
+    self._channel_file = channel_file
+    self._channels = channels or []
+
+  def close(self) -> None:
+    if self._channel_file is not None:
+      self._channel_file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+    return False
+
+  def groups(self) -> list[tuple[str, int]]:
+    """
+    Group titles with their channel count, in playlist order. Channels
+    without a group are under the empty title.
+    """
+    if self._channel_file is not None:
+      with span("cache_load"):
+        return self._channel_file.groups()
+    counts = {}
+    for ch in self._channels:
+      counts[ch.group_title] = counts.get(ch.group_title, 0) + 1
+    return list(counts.items())
+
+  def summaries(self, group_title: Optional[str] = None) -> list[PlaylistItem]:
+    """
+    Channels, all of them or those of a single group, with only their
+    title, logo and group when read from the channel file.
+    """
+    if self._channel_file is not None:
+      with span("cache_load"):
+        return self._channel_file.summaries(group_title)
+    if group_title is None:
+      return self._channels
+    return [ch for ch in self._channels if ch.group_title == group_title]
+
+
+def open_channel_listing(provider_url: str) -> ChannelListing:
+  """
+  Resolves the channels of a provider for listing, fetching them when they
+  are missing or expired.
+  """
+  channel_file = _open_fresh_channel_file(provider_url, hash_key(provider_url))
+  if channel_file is not None:
+    return ChannelListing(channel_file)
+  return ChannelListing(channels=get_channels(provider_url=provider_url))
+
+
+def get_group_channels(provider_url: str, group_title: str) -> list[PlaylistItem]:
+  """
+  Fetches the channels of a single group of a provider for listing, with
+  only their title, logo and group.
+  """
+  with open_channel_listing(provider_url) as listing:
+    return listing.summaries(group_title)
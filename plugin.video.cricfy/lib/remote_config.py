@@ -1,8 +1,14 @@
-import requests
+import time
 import uuid
 import json
-from lib.config import ADDON_PATH
-from lib.logger import log_error
+import threading
+from functools import lru_cache
+from typing import Optional
+from lib.config import ADDON_PATH, PROFILE_PATH
+from lib.logger import log_error, log_info
+from lib.perf import timed
+from lib.req import request, retry_with_backoff
+from lib.files import write_atomic
 
 """
   Firebase Remote Config Fetcher
@@ -14,14 +20,22 @@ from lib.logger import log_error
 
 CRICFY_PROPERTIES_FILE_PATH = ADDON_PATH / \
   "resources" / "cricfy_properties.json"
-CRICFY_PROPERTIES = json.loads(
-  CRICFY_PROPERTIES_FILE_PATH.read_text(encoding="utf-8"))
 
-# Constants
-CRICFY_PACKAGE_NAME = CRICFY_PROPERTIES.get("cricfy_package_name")
-CRICFY_FIREBASE_API_KEY = CRICFY_PROPERTIES.get("cricfy_firebase_api_key")
-CRICFY_FIREBASE_APP_ID = CRICFY_PROPERTIES.get("cricfy_firebase_app_id")
-PROJECT_NUMBER = CRICFY_FIREBASE_APP_ID.split(":")[1]
+# Last fetched config, kept in the profile so it survives cache clears
+REMOTE_CONFIG_CACHE_FILE_PATH = PROFILE_PATH / "remote_config.json"
+REMOTE_CONFIG_SOFT_TTL = 6 * 3600  # 6 hours, served without revalidation
+REMOTE_CONFIG_HARD_TTL = 7 * 24 * 3600  # 1 week, served while revalidating in background
+
+_refresh_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _cricfy_properties() -> dict:
+  """
+  Firebase credentials, read on first use rather than at import time since
+  cached remote configs don't need them.
+  """
+  return json.loads(CRICFY_PROPERTIES_FILE_PATH.read_text(encoding="utf-8"))
 
 
 def _get_random_instance_id():
@@ -29,17 +43,24 @@ def _get_random_instance_id():
   return uuid.uuid4().hex
 
 
+@timed("remote_config")
 def fetch_remote_config():
   """
   Fetches Firebase Remote Config and returns the entries map.
   :return: Dictionary of config entries or None if fetch fails.
   """
+  properties = _cricfy_properties()
+  package_name = properties.get("cricfy_package_name")
+  api_key = properties.get("cricfy_firebase_api_key")
+  app_id = properties.get("cricfy_firebase_app_id") or ""
+  project_number = app_id.split(":")[1] if ":" in app_id else None
+
   # Basic validation
-  if not CRICFY_FIREBASE_API_KEY or not CRICFY_FIREBASE_APP_ID or not PROJECT_NUMBER:
+  if not api_key or not app_id or not project_number:
     log_error("remote_config", "Error: Missing Firebase Credentials (CRICFY_FIREBASE_API_KEY, CRICFY_FIREBASE_APP_ID, or PROJECT_NUMBER)")
     return None
 
-  url = f"https://firebaseremoteconfig.googleapis.com/v1/projects/{PROJECT_NUMBER}/namespaces/firebase:fetch"
+  url = f"https://firebaseremoteconfig.googleapis.com/v1/projects/{project_number}/namespaces/firebase:fetch"
   # Generate fake instance ID (clean hex string)
   app_instance_id = _get_random_instance_id()
 
@@ -47,14 +68,14 @@ def fetch_remote_config():
   payload = {
     "appInstanceId": app_instance_id,
     "appInstanceIdToken": "",
-    "appId": CRICFY_FIREBASE_APP_ID,
+    "appId": app_id,
     "countryCode": "US",
     "languageCode": "en-US",
     "platformVersion": "30",
     "timeZone": "UTC",
     "appVersion": "5.0",
     "appBuild": "50",
-    "packageName": CRICFY_PACKAGE_NAME,
+    "packageName": package_name,
     "sdkVersion": "22.1.0",
     "analyticsUserProperties": {}
   }
@@ -63,13 +84,14 @@ def fetch_remote_config():
   headers = {
     "Content-Type": "application/json",
     "Accept": "application/json",
-    "X-Android-Package": CRICFY_PACKAGE_NAME,
-    "X-Goog-Api-Key": CRICFY_FIREBASE_API_KEY,
+    "X-Android-Package": package_name,
+    "X-Goog-Api-Key": api_key,
     "X-Google-GFE-Can-Retry": "yes"
   }
 
   try:
-    response = requests.post(
+    response = request(
+      "POST",
       url,
       headers=headers,
       json=payload,
@@ -91,20 +113,88 @@ def fetch_remote_config():
     return None
 
 
+def _read_cached_remote_config() -> Optional[dict]:
+  try:
+    cached = json.loads(REMOTE_CONFIG_CACHE_FILE_PATH.read_text(encoding="utf-8"))
+    if isinstance(cached.get("entries"), dict):
+      return cached
+  except FileNotFoundError:
+    pass
+  except Exception as e:
+    log_error("remote_config", f"Ignoring unreadable remote config cache: {e}")
+  return None
+
+
+def _write_cached_remote_config(entries: dict) -> None:
+  try:
+    # Atomic, concurrent readers see either the old or the new config
+    write_atomic(REMOTE_CONFIG_CACHE_FILE_PATH, json.dumps({
+      "entries": entries,
+      "fetch_time": time.time()
+    }))
+  except Exception as e:
+    log_error("remote_config", f"Failed to cache remote config: {e}")
+
+
+def refresh_remote_config() -> Optional[dict]:
+  """
+  Fetches the remote config from Firebase and caches it.
+  :return: Dictionary of config entries or None if every attempt failed.
+  """
+  entries = retry_with_backoff(fetch_remote_config, attempts=3)
+  if entries:
+    _write_cached_remote_config(entries)
+  return entries
+
+
+def _refresh_in_background() -> None:
+  # At most one refresh per process
+  if not _refresh_lock.acquire(blocking=False):
+    return
+
+  def _refresh():
+    try:
+      refresh_remote_config()
+    finally:
+      _refresh_lock.release()
+
+  threading.Thread(target=_refresh, name="cricfy-remote-config").start()
+
+
+def get_remote_config() -> Optional[dict]:
+  """
+  Returns the remote config entries, stale-while-revalidate:
+  - younger than REMOTE_CONFIG_SOFT_TTL: served from cache
+  - younger than REMOTE_CONFIG_HARD_TTL: served from cache, refreshed in background
+  - older or missing: fetched from Firebase, falling back to the last known
+    good config when Firebase is unreachable
+  """
+  cached = _read_cached_remote_config()
+  if cached:
+    age = time.time() - float(cached.get("fetch_time", 0))
+    if age <= REMOTE_CONFIG_SOFT_TTL:
+      return cached["entries"]
+    if age <= REMOTE_CONFIG_HARD_TTL:
+      _refresh_in_background()
+      return cached["entries"]
+
+  log_info("remote_config", "[Cache Miss] Fetching remote config from Firebase")
+  entries = refresh_remote_config()
+  if entries:
+    return entries
+
+  if cached:
+    log_error("remote_config", "Firebase unreachable, using last known good config")
+    return cached["entries"]
+  return None
+
+
 def get_provider_api_url():
   """
   Gets the provider API URL from Firebase Remote Config.
   Prioritizes 'cric_api2' then falls back to 'cric_api1'.
   """
-  try_count = 1
-  entries = None
-
-  while try_count <= 3:
-    entries = fetch_remote_config()
-    if entries:
-      break
-    try_count += 1
-
+  entries = get_remote_config()
   if not entries:
     return None
 
@@ -116,7 +206,7 @@ def get_api_urls():
   Gets all available API URLs.
   :return: Tuple (api1, api2)
   """
-  entries = fetch_remote_config()
+  entries = get_remote_config()
   if not entries:
     return None
 
@@ -1,4 +1,14 @@
+import time
+import random
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import BinaryIO, Callable, Optional, TypeVar
 import requests
+from requests.adapters import HTTPAdapter
+from lib.perf import timed
+
+T = TypeVar("T")
 
 # Custom Headers for fetching M3U playlists
 custom_headers = {
@@ -12,14 +22,184 @@ license_headers = {
   "User-Agent": "Dalvik/2.1.0 (Linux; U; Android)",
 }
 
+POOL_CONNECTIONS = 10  # Number of hosts with a pool of kept-alive connections
+POOL_MAXSIZE = 4  # Kept-alive connections per host
+RETRY_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+STREAM_CHUNK_SIZE = 64 * 1024  # Bytes of a streamed response read at once
+SPOOL_MAX_MEMORY = 256 * 1024  # Bytes of a streamed response kept in memory, the rest goes to a temporary file
 
-def fetch_url(url: str, timeout: int = 15) -> str:
-  response = requests.get(
-    url=url,
-    headers=custom_headers,
-    timeout=timeout,
-  )
+# urllib3 transparently decodes brotli when one of these is installed
+try:
+  import brotli  # noqa: F401 # pyright: ignore[reportMissingImports]
+  ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+  try:
+    import brotlicffi  # noqa: F401 # pyright: ignore[reportMissingImports]
+    ACCEPT_ENCODING = "gzip, deflate, br"
+  except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+@dataclass
+class FetchResult:
+  text: str = ""
+  etag: str = ""
+  last_modified: str = ""
+  not_modified: bool = False
+  body: Optional[BinaryIO] = None  # Streamed fetches: the rewound body, closed by the caller
+  size: int = 0
+
+
+def get_session() -> requests.Session:
+  """
+  Returns the shared session, so that every request of this process reuses
+  the kept-alive connection (and TLS session) to its host.
+  """
+  global _session
+  with _session_lock:
+    if _session is None:
+      session = requests.Session()
+      adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+      )
+      session.mount("https://", adapter)
+      session.mount("http://", adapter)
+      session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+      _session = session
+    return _session
+
+
+def backoff_delay(attempt: int, base_delay: float = 0.5, max_delay: float = 8.0) -> float:
+  """
+  Exponential backoff with full jitter for the given (0 based) attempt.
+  """
+  return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def retry_with_backoff(func: Callable[[], Optional[T]], attempts: int = 3) -> Optional[T]:
+  """
+  Calls func until it returns a truthy value, sleeping with exponential
+  backoff and jitter between attempts.
+  :return: The first truthy result, or the last result.
+  """
+  result = None
+  for attempt in range(attempts):
+    result = func()
+    if result:
+      return result
+    if attempt < attempts - 1:
+      time.sleep(backoff_delay(attempt))
+  return result
+
+
+def _release(response: requests.Response) -> None:
+  """
+  Closes a response, returning its connection to the pool. A streamed
+  response closed before its body is read drops the connection instead.
+  """
+  response.content  # Short bodies only: empty (304) or an error page
+  response.close()
+
+
+def request(method: str, url: str, attempts: int = 1, **kwargs) -> requests.Response:
+  """
+  Sends a request through the shared session.
+  Connection errors and transient server errors are retried with backoff.
+  """
+  session = get_session()
+  attempt = 0
+  while True:
+    last_attempt = attempt >= attempts - 1
+    try:
+      response = session.request(method, url, **kwargs)
+    except requests.ConnectionError:
+      if last_attempt:
+        raise
+    else:
+      if last_attempt or response.status_code not in RETRY_STATUS_CODES:
+        return response
+      _release(response)
+    time.sleep(backoff_delay(attempt))
+    attempt += 1
+
+
+def _conditional_get(url: str, timeout: int, etag: str, last_modified: str,
+                     stream: bool = False) -> Optional[requests.Response]:
+  """
+  GET revalidating a previously fetched copy with its validators.
+  :return: None when the copy is still valid.
+  """
+  headers = dict(custom_headers)
+  if etag:
+    headers["If-None-Match"] = etag
+  if last_modified:
+    headers["If-Modified-Since"] = last_modified
+
+  response = request("GET", url, attempts=2, headers=headers, timeout=timeout, stream=stream)
+  if response.status_code == 304 and (etag or last_modified):
+    _release(response)
+    return None
   response.raise_for_status()
+  return response
+
+
+@timed("fetch")
+def fetch_url_conditional(url: str, timeout: int = 15, etag: str = "",
+                          last_modified: str = "") -> FetchResult:
+  """
+  Fetches url, revalidating a previously fetched copy when its ETag and/or
+  Last-Modified validators are given.
+  :return: FetchResult with not_modified set when the copy is still valid.
+  """
+  response = _conditional_get(url, timeout, etag, last_modified)
+  if response is None:
+    return FetchResult(etag=etag, last_modified=last_modified, not_modified=True)
   if response.status_code != 200:
-    return ""
-  return response.text
+    return FetchResult()
+  return FetchResult(
+    text=response.text,
+    etag=response.headers.get("ETag", ""),
+    last_modified=response.headers.get("Last-Modified", ""),
+  )
+
+
+@timed("fetch")
+def fetch_url_streamed(url: str, timeout: int = 15, etag: str = "", last_modified: str = "",
+                       on_chunk: Optional[Callable[[bytes], None]] = None) -> FetchResult:
+  """
+  fetch_url_conditional() reading the response in chunks into a temporary
+  file (kept in memory up to SPOOL_MAX_MEMORY) rather than into a string.
+  on_chunk, when given, sees every chunk as it arrives.
+  :return: FetchResult with the body instead of the text.
+  """
+  response = _conditional_get(url, timeout, etag, last_modified, stream=True)
+  if response is None:
+    return FetchResult(etag=etag, last_modified=last_modified, not_modified=True)
+  with response:
+    if response.status_code != 200:
+      return FetchResult()
+    body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    try:
+      for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+        body.write(chunk)
+        if on_chunk:
+          on_chunk(chunk)
+      size = body.tell()
+      body.seek(0)
+    except Exception:
+      body.close()
+      raise
+  return FetchResult(
+    etag=response.headers.get("ETag", ""),
+    last_modified=response.headers.get("Last-Modified", ""),
+    body=body,
+    size=size,
+  )
+
+
+def fetch_url(url: str, timeout: int = 15) -> str:
+  return fetch_url_conditional(url, timeout=timeout).text
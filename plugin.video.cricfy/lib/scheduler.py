@@ -0,0 +1,103 @@
+import time
+import random
+from dataclasses import dataclass
+from typing import Callable
+import xbmc
+from lib.logger import log_error, log_info
+
+"""
+  Background scheduler
+  Runs the service's periodic jobs, each on its own jittered interval, until
+  Kodi exits. Failed jobs are retried with exponential backoff, and nothing
+  runs while a video plays.
+"""
+
+SCHEDULE_JITTER = 0.1  # Intervals vary by up to 10% either way, so jobs don't run in lockstep
+RETRY_DELAY = 60  # Seconds before the first retry of a failed job, doubling on every failure
+PLAYBACK_POLL_INTERVAL = 10  # Seconds between checks for the end of playback
+MAX_IDLE_WAIT = 300  # Seconds slept at most at once, so that time jumps (suspend) are noticed
+
+
+@dataclass
+class Job:
+  name: str
+  interval: float  # Seconds between successful runs
+  # Returns whether the job succeeded. Long running work should stop when
+  # the monitor it's given reports an abort, which includes video playback.
+  run: Callable[[xbmc.Monitor], bool]
+  next_run: float = 0.0
+  failures: int = 0
+
+
+class PlaybackMonitor(xbmc.Monitor):
+  """
+  Monitor whose abortRequested() is also true while a video plays, for the
+  jobs to give way to playback.
+  """
+
+  def __init__(self, player: xbmc.Player):
+    super().__init__()
+    self.player = player
+
+  def abortRequested(self) -> bool:
+    return super().abortRequested() or self.player.isPlayingVideo()
+
+
+def _jittered(delay: float) -> float:
+  return delay * random.uniform(1 - SCHEDULE_JITTER, 1 + SCHEDULE_JITTER)
+
+
+class Scheduler:
+  def __init__(self, monitor: xbmc.Monitor, player: xbmc.Player):
+    self.monitor = monitor
+    self.player = player
+    self.job_monitor = PlaybackMonitor(player)
+    self.jobs: list[Job] = []
+
+  def add(self, job: Job) -> None:
+    """
+    Schedules the job, first run after its (jittered) interval.
+    """
+    job.next_run = time.time() + _jittered(job.interval)
+    self.jobs.append(job)
+
+  def run(self) -> None:
+    """
+    Runs the jobs as they fall due, until Kodi asks the add-on to abort.
+    """
+    while self.jobs and not self.monitor.abortRequested():
+      if self.player.isPlayingVideo():
+        if self.monitor.waitForAbort(PLAYBACK_POLL_INTERVAL):
+          break
+        continue
+
+      job = min(self.jobs, key=lambda job: job.next_run)
+      wait = job.next_run - time.time()
+      if wait > 0:
+        if self.monitor.waitForAbort(min(wait, MAX_IDLE_WAIT)):
+          break
+        continue
+      self._run_job(job)
+
+  def _run_job(self, job: Job) -> None:
+    started = time.time()
+    try:
+      succeeded = bool(job.run(self.job_monitor))
+    except Exception as e:
+      log_error("scheduler", f"Job {job.name} failed: {e}")
+      succeeded = False
+
+    if succeeded:
+      job.failures = 0
+      delay = job.interval
+    elif self.player.isPlayingVideo():
+      # Stopped for playback, run again soon after it
+      delay = RETRY_DELAY
+    else:
+      job.failures += 1
+      delay = min(job.interval, RETRY_DELAY * 2 ** (job.failures - 1))
+    job.next_run = time.time() + _jittered(delay)
+    log_info(
+      "scheduler",
+      f"Job {job.name} {'done' if succeeded else 'incomplete'} in {time.time() - started:.1f}s, "
+      f"next run in {job.next_run - time.time():.0f}s")
@@ -0,0 +1,276 @@
+import re
+import time
+import threading
+from array import array
+from pathlib import Path
+from typing import Optional
+from lib.config import PROFILE_PATH
+from lib.logger import log_error
+from lib.m3u_parser import PlaylistItem
+from lib.perf import timed
+from lib.channel_store import (
+  BYTE_ORDER_MARK, HEADER, TITLE_FIELD, TVG_LOGO_FIELD, GROUP_TITLE_FIELD, MappedFile,
+  clean_string, encode_strings,
+)
+from lib.files import write_atomic
+
+"""
+  Channel search
+  One inverted token index per provider, rebuilt in background whenever its
+  channel cache is refreshed and kept in the profile, so searching never
+  hits the network and survives cache clears.
+
+  Indexes are mapped rather than read (lib.channel_store layout rules): a
+  query bisects the sorted vocabulary, copies out the postings of matching
+  tokens and decodes the rows of the channels found only.
+  - header: the channel file's, with magic, version, byte order mark,
+    token, channel and string counts and the positions of the sections below
+  - string table: "", the provider URL, the vocabulary (sorted) and the
+    titles, logos and groups of the channels (deduplicated)
+  - postings: offsets (u32, one more than tokens) into the channel numbers
+    of every token, in playlist order
+  - rows: title, logo and group string ids of every channel
+"""
+
+SEARCH_INDEX_DIR = PROFILE_PATH / "search"
+SEARCH_INDEX_MAGIC = b"CFSI"
+SEARCH_INDEX_VERSION = 2  # Bumped whenever the layout changes, older files are rejected
+SEARCH_INDEX_SUFFIX = ".idx"
+SEARCH_INDEX_MAX_AGE = 7 * 24 * 3600  # 1 week, indexes of providers not refreshed since are dropped
+SEARCH_MAX_RESULTS = 500
+ROW_WIDTH = 3  # Title, logo and group
+URL_SID = 1
+VOCABULARY_SID = 2  # String id of the first token
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+  return TOKEN_RE.findall(text.casefold())
+
+
+def _index_path(provider_hash: str) -> Path:
+  return SEARCH_INDEX_DIR / f"{provider_hash}{SEARCH_INDEX_SUFFIX}"
+
+
+def has_search_index(provider_hash: str) -> bool:
+  return _index_path(provider_hash).exists()
+
+
+def build_search_index(provider_url: str, channel_lists: list[list]) -> bytes:
+  """
+  Encodes the search index of the given channels (in their positional
+  PlaylistItem.to_list form).
+  """
+  string_ids = {}
+  row_strings = []
+  rows = array("I")
+  tokens = {}
+  group_tokens = {}  # Group titles repeat, tokenized once each
+  for i, values in enumerate(channel_lists):
+    size = len(values)
+    title = values[TITLE_FIELD] if size > TITLE_FIELD else ""
+    logo = values[TVG_LOGO_FIELD] if size > TVG_LOGO_FIELD else ""
+    group_title = values[GROUP_TITLE_FIELD] if size > GROUP_TITLE_FIELD else ""
+    for value in (title, logo, group_title):
+      value = value or ""
+      sid = string_ids.get(value)
+      if sid is None:
+        sid = string_ids[value] = len(row_strings)
+        row_strings.append(value)
+      rows.append(sid)
+
+    if group_title not in group_tokens:
+      group_tokens[group_title] = tokenize(group_title or "")
+    for token in set(tokenize(title or "")).union(group_tokens[group_title]):
+      tokens.setdefault(token, []).append(i)
+
+  vocabulary = sorted(tokens)
+  posting_offsets = array("I", [0])
+  postings = array("I")
+  for token in vocabulary:
+    postings.extend(tokens[token])
+    posting_offsets.append(len(postings))
+  # Row strings come after the vocabulary
+  row_base = VOCABULARY_SID + len(vocabulary)
+  rows = array("I", (sid + row_base for sid in rows))
+  offsets, data = encode_strings(
+    ["", provider_url] + vocabulary + [clean_string(value) for value in row_strings])
+
+  offsets_pos = HEADER.size
+  data_pos = offsets_pos + len(offsets) * 4
+  postings_pos = data_pos + len(data)
+  rows_pos = postings_pos + (len(posting_offsets) + len(postings)) * 4
+  header = HEADER.pack(
+    SEARCH_INDEX_MAGIC, SEARCH_INDEX_VERSION, BYTE_ORDER_MARK, len(vocabulary),
+    len(rows) // ROW_WIDTH, len(offsets) - 1, offsets_pos, data_pos, postings_pos, rows_pos)
+  return b"".join((
+    header, offsets.tobytes(), data,
+    posting_offsets.tobytes(), postings.tobytes(), rows.tobytes()))
+
+
+def update_search_index(provider_hash: str, provider_url: str, channel_lists: list[list]) -> None:
+  """
+  Replaces the search index of a provider with the given channels (in their
+  positional PlaylistItem.to_list form). Each provider has its own file,
+  so concurrent refreshes of different providers don't conflict.
+  """
+  try:
+    # Atomic, concurrent searches see either the old or the new index
+    write_atomic(_index_path(provider_hash), build_search_index(provider_url, channel_lists))
+  except Exception as e:
+    log_error("search", f"Failed to update search index of ({provider_url}): {e}")
+
+
+def update_search_index_in_background(provider_hash: str, provider_url: str,
+                                      channel_lists: list[list]) -> None:
+  """
+  update_search_index() without blocking the caller, which has its channels
+  already: searches see the previous index until this one is written.
+  """
+  threading.Thread(target=update_search_index, args=(provider_hash, provider_url, channel_lists),
+                   name="cricfy-search-index").start()
+
+
+def prune_search_indexes() -> None:
+  """
+  Removes the indexes of providers not refreshed for SEARCH_INDEX_MAX_AGE
+  and those of older versions, which searches skip.
+  """
+  if not SEARCH_INDEX_DIR.is_dir():
+    return
+  now = time.time()
+  for index_path in SEARCH_INDEX_DIR.iterdir():
+    try:
+      if (index_path.suffix != SEARCH_INDEX_SUFFIX
+              or now - index_path.stat().st_mtime > SEARCH_INDEX_MAX_AGE):
+        index_path.unlink()
+    except FileNotFoundError:
+      pass
+    except OSError as e:
+      # Still mapped by a search on some platforms, dropped next time
+      log_error("search", f"Failed to remove search index {index_path.name}: {e}")
+
+
+class SearchIndex(MappedFile):
+  """
+  Read-only view of the search index of a provider.
+  """
+
+  def __init__(self, path: Path):
+    super().__init__(path)
+    try:
+      view = self._view(memoryview(self._mmap))
+      if len(view) < HEADER.size or len(view) % 4:
+        raise ValueError("Truncated search index")
+      (magic, version, byte_order_mark, token_count, channel_count, string_count,
+       offsets_pos, data_pos, postings_pos, rows_pos) = HEADER.unpack_from(view)
+      if magic != SEARCH_INDEX_MAGIC or version != SEARCH_INDEX_VERSION:
+        raise ValueError(f"Unsupported search index version {version}")
+      if byte_order_mark != BYTE_ORDER_MARK:
+        raise ValueError("Search index of another byte order")
+      if rows_pos + channel_count * ROW_WIDTH * 4 != len(view):
+        raise ValueError("Truncated search index")
+
+      words = self._view(view.cast("I"))
+      self.token_count = token_count
+      self._offsets = self._view(words[offsets_pos // 4:offsets_pos // 4 + string_count + 1])
+      self._data = self._view(view[data_pos:postings_pos])
+      postings_start = postings_pos // 4 + token_count + 1
+      self._posting_offsets = self._view(words[postings_pos // 4:postings_start])
+      self._postings = self._view(words[postings_start:rows_pos // 4])
+      self._rows = self._view(words[rows_pos // 4:])
+    except BaseException:
+      self.close()
+      raise
+
+  @property
+  def url(self) -> str:
+    return self._string(URL_SID)
+
+  def _token(self, i: int) -> str:
+    return self._string(VOCABULARY_SID + i)
+
+  def match(self, query_token: str) -> set[int]:
+    """
+    Channels having a token starting with the query token.
+    """
+    low, high = 0, self.token_count
+    while low < high:
+      middle = (low + high) // 2
+      if self._token(middle) < query_token:
+        low = middle + 1
+      else:
+        high = middle
+    matches = set()
+    i = low
+    while i < self.token_count and self._token(i).startswith(query_token):
+      # Copied out, a slice left alive would keep the mapping from closing
+      matches.update(self._postings[self._posting_offsets[i]:self._posting_offsets[i + 1]].tolist())
+      i += 1
+    return matches
+
+  def title(self, i: int) -> str:
+    return self._string(self._rows[i * ROW_WIDTH])
+
+  def summary(self, i: int) -> PlaylistItem:
+    """
+    Channel with only its title, logo and group.
+    """
+    title, logo, group_title = self._rows[i * ROW_WIDTH:(i + 1) * ROW_WIDTH].tolist()
+    return PlaylistItem(self._string(title), tvg_logo=self._string(logo),
+                        group_title=self._string(group_title))
+
+
+def _open_search_indexes() -> list[SearchIndex]:
+  """
+  Maps the search index of every provider, skipping outdated ones (removed
+  by prune_search_indexes).
+  """
+  indexes = []
+  if not SEARCH_INDEX_DIR.is_dir():
+    return indexes
+  now = time.time()
+  for index_path in sorted(SEARCH_INDEX_DIR.glob(f"*{SEARCH_INDEX_SUFFIX}")):
+    try:
+      if now - index_path.stat().st_mtime > SEARCH_INDEX_MAX_AGE:
+        continue
+      indexes.append(SearchIndex(index_path))
+    except FileNotFoundError:
+      pass  # Pruned meanwhile
+    except Exception as e:
+      log_error("search", f"Skipping unreadable search index {index_path.name}: {e}")
+  return indexes
+
+
+@timed("search")
+def search_channels(query: str, limit: int = SEARCH_MAX_RESULTS) -> list[tuple[str, PlaylistItem]]:
+  """
+  Finds the cached channels of all providers whose title or group has words
+  starting with every word of the query. Titles starting with the query
+  come first, then playlist order.
+  :return: List of (provider URL, channel) with the title, logo and group
+    of the channels only. Resolve them with get_channel() for playback.
+  """
+  query_tokens = tokenize(query)
+  if not query_tokens:
+    return []
+  query_prefix = query.strip().casefold()
+
+  indexes = _open_search_indexes()
+  try:
+    found = []
+    for index in indexes:
+      matches: Optional[set[int]] = None
+      for query_token in query_tokens:
+        token_matches = index.match(query_token)
+        matches = token_matches if matches is None else matches & token_matches
+        if not matches:
+          break
+      found += ((index, i) for i in sorted(matches or ()))
+
+    # Only titles are needed to rank, the other columns are read for results kept
+    found.sort(key=lambda match: not match[0].title(match[1]).casefold().startswith(query_prefix))
+    return [(index.url, index.summary(i)) for index, i in found[:limit]]
+  finally:
+    for index in indexes:
+      index.close()
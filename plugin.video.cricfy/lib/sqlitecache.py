@@ -0,0 +1,124 @@
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional, Union
+
+"""
+  SQLite cache backend
+  Stand-in for script.common.plugin.cache's StorageServer (same get / set /
+  delete interface) kept in a single database file of the addon profile.
+  Values are stored as is (text or bytes) and, as with StorageServer, kept
+  until replaced unless stored with a time to live. The least recently used
+  entries are evicted beyond a byte budget.
+  WAL mode lets the service and plugin processes read while one writes.
+"""
+
+SQLITE_BUSY_TIMEOUT = 30  # Seconds a writer waits for another process' transaction
+LRU_TOUCH_INTERVAL = 60  # Seconds between access time updates of an entry
+EVICTION_TARGET = 0.9  # Share of the byte budget kept after an eviction
+NEVER_EXPIRES = float("inf")  # Expiry of the entries stored without a time to live
+
+
+class SQLiteCache:
+  def __init__(self, path: Union[str, Path], timeout: float = 24,
+               max_bytes: int = 64 * 1024 * 1024):
+    """
+    :param path: Database file, created when missing.
+    :param timeout: Lifetime of StorageServer's function cache, in hours.
+      Accepted for the same signature, get / set entries don't expire.
+    :param max_bytes: Budget of the stored values, in bytes (characters
+      for text).
+    """
+    self.path = Path(path)
+    self.max_bytes = max_bytes
+    self._local = threading.local()
+
+  def _connection(self) -> sqlite3.Connection:
+    """
+    Connection of the calling thread, sqlite3 connections aren't shared.
+    """
+    conn = getattr(self._local, "conn", None)
+    if conn is None:
+      self.path.parent.mkdir(parents=True, exist_ok=True)
+      conn = sqlite3.connect(
+        str(self.path), timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None)
+      conn.execute("PRAGMA journal_mode=WAL")
+      conn.execute("PRAGMA synchronous=NORMAL")
+      # No declared type on value, text and blobs are kept as given
+      conn.execute(
+        "CREATE TABLE IF NOT EXISTS cache ("
+        "name TEXT PRIMARY KEY, value, size INTEGER NOT NULL, "
+        "expires REAL NOT NULL, accessed REAL NOT NULL)")
+      conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+      self._local.conn = conn
+    return conn
+
+  def get(self, name: str) -> Union[str, bytes]:
+    """
+    Returns the value of an entry, "" when it is missing or expired.
+    """
+    conn = self._connection()
+    row = conn.execute(
+      "SELECT value, expires, accessed FROM cache WHERE name = ?", (name,)).fetchone()
+    if row is None:
+      return ""
+    value, expires, accessed = row
+    now = time.time()
+    if expires < now:
+      return ""
+    if now - accessed > LRU_TOUCH_INTERVAL:
+      conn.execute("UPDATE cache SET accessed = ? WHERE name = ?", (now, name))
+    return value
+
+  def set(self, name: str, data: Union[str, bytes], ttl: Optional[float] = None) -> None:
+    """
+    Stores an entry, text or bytes.
+    :param ttl: Time to live in seconds, kept until replaced when None.
+    """
+    now = time.time()
+    size = len(data)
+    conn = self._connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+      conn.execute(
+        "INSERT OR REPLACE INTO cache (name, value, size, expires, accessed) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (name, data, size, NEVER_EXPIRES if ttl is None else now + ttl, now))
+      self._evict(conn, name, now)
+      conn.execute("COMMIT")
+    except BaseException:
+      conn.execute("ROLLBACK")
+      raise
+
+  def _evict(self, conn: sqlite3.Connection, name: str, now: float) -> None:
+    """
+    Drops the expired entries, then the least recently used ones (but the
+    entry just stored), once the values outgrow the byte budget.
+    """
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+    if total <= self.max_bytes:
+      return
+    conn.execute("DELETE FROM cache WHERE expires < ?", (now,))
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+    target = self.max_bytes * EVICTION_TARGET
+    evicted = []
+    for evicted_name, size in conn.execute(
+            "SELECT name, size FROM cache WHERE name != ? ORDER BY accessed", (name,)):
+      if total <= target:
+        break
+      evicted.append((evicted_name,))
+      total -= size
+    conn.executemany("DELETE FROM cache WHERE name = ?", evicted)
+
+  def delete(self, name: str) -> None:
+    """
+    Deletes the entries matching a LIKE pattern, '%' clears the cache.
+    """
+    self._connection().execute("DELETE FROM cache WHERE name LIKE ?", (name,))
+
+  def lock(self, name: str) -> bool:
+    return False
+
+  def unlock(self, name: str) -> bool:
+    return False
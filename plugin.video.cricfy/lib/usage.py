@@ -0,0 +1,68 @@
+import json
+import time
+from lib.config import PROFILE_PATH
+from lib.logger import log_error
+from lib.locks import ProfileLock
+from lib.files import write_atomic
+
+"""
+  Provider usage
+  Remembers how often and how recently each provider is opened, so that the
+  service refreshes the playlists users actually open, most used first.
+"""
+
+USAGE_FILE_PATH = PROFILE_PATH / "usage.json"
+USAGE_HALF_LIFE = 7 * 24 * 3600  # 1 week, after which an open weighs half as much
+USAGE_MAX_AGE = 30 * 24 * 3600  # 30 days, providers not opened since are forgotten
+USAGE_LOCK_TIMEOUT = 1  # Seconds waited for another process updating the log, else the open isn't recorded
+
+
+def _read_usage() -> dict:
+  """
+  Usage by provider URL: [score, last opened].
+  """
+  try:
+    usage = json.loads(USAGE_FILE_PATH.read_text(encoding="utf-8"))
+    if isinstance(usage, dict):
+      return usage
+  except FileNotFoundError:
+    pass
+  except Exception as e:
+    log_error("usage", f"Ignoring unreadable usage log: {e}")
+  return {}
+
+
+def _decayed(score: float, last_used: float, now: float) -> float:
+  return score * 0.5 ** ((now - last_used) / USAGE_HALF_LIFE)
+
+
+def record_provider_use(provider_url: str) -> None:
+  """
+  Counts an opening of the provider.
+  """
+  lock = ProfileLock("usage")
+  if not lock.acquire(USAGE_LOCK_TIMEOUT):
+    return
+  try:
+    now = time.time()
+    usage = {url: entry for url, entry in _read_usage().items()
+             if now - entry[1] <= USAGE_MAX_AGE}
+    score, last_used = usage.get(provider_url, (0.0, now))
+    usage[provider_url] = [_decayed(score, last_used, now) + 1, now]
+    write_atomic(USAGE_FILE_PATH, json.dumps(usage))
+  except Exception as e:
+    log_error("usage", f"Failed to record provider use: {e}")
+  finally:
+    lock.release()
+
+
+def frequent_providers(limit: int) -> list[str]:
+  """
+  URLs of the providers opened within USAGE_MAX_AGE, most used first (recent
+  openings weighing more than older ones).
+  """
+  now = time.time()
+  scores = {url: _decayed(score, last_used, now)
+            for url, (score, last_used) in _read_usage().items()
+            if now - last_used <= USAGE_MAX_AGE}
+  return sorted(scores, key=scores.get, reverse=True)[:limit]
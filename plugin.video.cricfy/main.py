@@ -1,153 +1,262 @@
-import re
 import sys
-from urllib.parse import urlencode, parse_qsl
+from urllib.parse import urlencode, parse_qsl, quote_plus
+import xbmc
 import xbmcgui
 import xbmcplugin
-from lib.providers import get_providers, get_channels
-from lib.req import license_headers
+from lib.config import ADDON
+from lib.providers import (
+  get_providers, get_cached_providers, get_playback, get_group_channels,
+  open_channel_listing,
+)
+from lib.search import search_channels
+from lib.health import rank_channels
+from lib.usage import record_provider_use
 from lib.logger import log_error
+from lib.perf import flush as flush_timings, span
 
 # Base URL for the addon
 BASE_URL = sys.argv[0]
 ADDON_HANDLE = int(sys.argv[1])
 
 
+UNGROUPED_TITLE = 'Other'  # Folder of the channels without group-title
+DEFAULT_PROVIDER_IMAGE = 'https://www.iconexperience.com/_img/v_collection_png/256x256/shadow/unknown.png'
+# InfoTagVideo setters only exist from Kodi 20 (getVideoInfoTag() is older),
+# setInfo (deprecated there) is the fallback
+HAS_VIDEO_INFO_TAG_SETTERS = hasattr(xbmc.InfoTagVideo, 'setTitle')
+
+
 def build_url(query):
   return f'{BASE_URL}?{urlencode(query)}'
 
 
-def list_providers():
+def provider_items(provider_list):
   """
-  Lists the providers from Cricfy
+  Builds the (url, listitem, isFolder) tuples of the providers folder
   """
-  provider_list = get_providers()
-
+  items = []
   for prov in provider_list:
     title = prov.get('title', 'Unknown')
-    image = prov.get(
-      'image', 'https://www.iconexperience.com/_img/v_collection_png/256x256/shadow/unknown.png')
+    image = prov.get('image', DEFAULT_PROVIDER_IMAGE)
     cat_link = prov.get('catLink', '')
 
     if not cat_link or not cat_link.startswith('http'):
       continue
 
     # Create a folder item for this provider
-    li = xbmcgui.ListItem(label=title)
+    li = xbmcgui.ListItem(label=title, offscreen=True)
     li.setArt({'icon': image, 'thumb': image})
 
     url = build_url({'mode': 'list_channels', 'url': cat_link, 'title': title})
-    xbmcplugin.addDirectoryItem(
-      handle=ADDON_HANDLE, url=url, listitem=li, isFolder=True)
+    items.append((url, li, True))
+  return items
+
+
+def channel_items(provider_url, channels, label_suffix=''):
+  """
+  Builds the (url, listitem, isFolder) tuples of a provider's channels
+  """
+  # Only the title differs between the playback URLs, encode the rest once.
+  # Same URLs as build_url() would give, so existing favourites keep working
+  url_prefix = build_url({'mode': 'play', 'provider_url': provider_url}) + '&channel_title='
+
+  items = []
+  append = items.append
+  for ch in channels:
+    title = ch.title
+    li = xbmcgui.ListItem(label=title + label_suffix, offscreen=True)
+    if ch.tvg_logo:
+      li.setArt({'thumb': ch.tvg_logo, 'icon': ch.tvg_logo})
+    if HAS_VIDEO_INFO_TAG_SETTERS:
+      tag = li.getVideoInfoTag()
+      tag.setTitle(title)
+      if ch.group_title:
+        tag.setGenres([ch.group_title])
+    else:
+      li.setInfo('video', {'title': title, 'genre': ch.group_title})
+    li.setProperty('IsPlayable', 'true')
+
+    # The playback URL only carries the channel title, play_video looks the
+    # channel up again from the cache
+    append((url_prefix + quote_plus(title), li, False))
+  return items
+
+
+def group_items(provider_url, groups):
+  """
+  Builds the (url, listitem, isFolder) tuples of a provider's group folders
+  """
+  items = []
+  for group_title, count in groups:
+    li = xbmcgui.ListItem(label=f'{group_title or UNGROUPED_TITLE} ({count})', offscreen=True)
+    url = build_url({'mode': 'list_group', 'url': provider_url, 'group': group_title})
+    items.append((url, li, True))
+  return items
+
+
+def page_slice(items, page):
+  """
+  Returns the items of the given page (page size from the settings, 0 shows
+  everything) and whether more pages follow
+  """
+  page_size = ADDON.getSettingInt('channels_per_page')
+  if page_size <= 0:
+    return items, False
+  start = page * page_size
+  return items[start:start + page_size], start + page_size < len(items)
+
+
+def next_page_item(query, page):
+  """
+  Builds the folder tuple opening the page after the given one
+  """
+  li = xbmcgui.ListItem(label=f'Next page ({page + 2})', offscreen=True)
+  return build_url({**query, 'page': page + 1}), li, True
+
+
+def list_providers():
+  """
+  Lists the providers from Cricfy
+  """
+  provider_list = get_providers()
+
+  with span("render"):
+    items = [(build_url({'mode': 'search'}),
+              xbmcgui.ListItem(label='Search channels', offscreen=True), True)]
+    items += provider_items(provider_list)
+    xbmcplugin.addDirectoryItems(ADDON_HANDLE, items, len(items))
+
+  xbmcplugin.endOfDirectory(ADDON_HANDLE)
+
 
+def search(query):
+  """
+  Searches the channels of every cached provider, asking for the query
+  when none is given.
+  """
+  if not query:
+    query = xbmcgui.Dialog().input('Search channels')
+    if not query:
+      xbmcplugin.endOfDirectory(ADDON_HANDLE, succeeded=False)
+      return
+
+  results = search_channels(query)
+  if not results:
+    _show_error('No channels found')
+    return
+
+  provider_titles = {prov.get('catLink', ''): prov.get('title', '')
+                     for prov in get_cached_providers()}
+  with span("render"):
+    items = []
+    for provider_url, channel in results:
+      provider_title = provider_titles.get(provider_url)
+      items += channel_items(provider_url, [channel],
+                             f' ({provider_title})' if provider_title else '')
+    xbmcplugin.addDirectoryItems(ADDON_HANDLE, items, len(items))
   xbmcplugin.endOfDirectory(ADDON_HANDLE)
 
 
-def list_channels(provider_url):
+def _show_error(message):
+  xbmcgui.Dialog().notification('Error', message, xbmcgui.NOTIFICATION_ERROR)
+  xbmcplugin.endOfDirectory(ADDON_HANDLE)
+
+
+def list_channels(provider_url, page=0):
   """
-  Fetches the M3U from the specific provider and lists channels.
+  Fetches the M3U from the specific provider and lists channels, split in
+  group folders when enabled and the playlist has several groups.
   """
   if not provider_url or not provider_url.startswith('http'):
-    xbmcgui.Dialog().notification(
-        'Error', 'Invalid provider URL', xbmcgui.NOTIFICATION_ERROR)
-    xbmcplugin.endOfDirectory(ADDON_HANDLE)
+    _show_error('Invalid provider URL')
     return
+  if page == 0:
+    # Most opened providers are kept fresh by the service
+    record_provider_use(provider_url)
 
   # Fetch M3U content
   try:
-    channels = get_channels(provider_url=provider_url)
-    if not channels:
-      xbmcgui.Dialog().notification(
-          'Error', 'No channels found', xbmcgui.NOTIFICATION_ERROR)
-      xbmcplugin.endOfDirectory(ADDON_HANDLE)
+    # Resolved once for both, a refresh or fetch happens at most once
+    with open_channel_listing(provider_url) as listing:
+      groups = listing.groups() if ADDON.getSettingBool('group_channels') else []
+      channels = listing.summaries() if len(groups) <= 1 else None
+    if channels is not None and not channels:
+      _show_error('No channels found')
       return
   except Exception as e:
     log_error("main", f"Error fetching channels: {e}")
-    xbmcgui.Dialog().notification(
-        'Error', 'Failed to fetch playlist content', xbmcgui.NOTIFICATION_ERROR)
+    _show_error('Failed to fetch playlist content')
+    return
+
+  if channels is None:
+    with span("render"):
+      items = group_items(provider_url, groups)
+      xbmcplugin.addDirectoryItems(ADDON_HANDLE, items, len(items))
     xbmcplugin.endOfDirectory(ADDON_HANDLE)
     return
 
-  for ch in channels:
-    li = xbmcgui.ListItem(label=ch.title)
-    li.setArt({'thumb': ch.tvg_logo, 'icon': ch.tvg_logo})
-    li.setInfo('video', {'title': ch.title, 'genre': ch.group_title})
-    li.setProperty('IsPlayable', 'true')
+  render_channels(provider_url, channels, page, {'mode': 'list_channels', 'url': provider_url})
 
-    # Construct URL for playback mode
-    # We encode the channel data into the URL so we don't have to re-parse on playback
-    params = {
-      'mode': 'play',
-      'provider_url': provider_url,
-      'channel_title': ch.title,
-    }
-
-    url = build_url(params)
-    xbmcplugin.addDirectoryItem(
-      handle=ADDON_HANDLE, url=url, listitem=li, isFolder=False)
+
+def list_group(provider_url, group_title, page=0):
+  """
+  Lists the channels of a single group of a provider.
+  """
+  if not provider_url or not provider_url.startswith('http'):
+    _show_error('Invalid provider URL')
+    return
+
+  try:
+    channels = get_group_channels(provider_url, group_title)
+    if not channels:
+      _show_error('No channels found')
+      return
+  except Exception as e:
+    log_error("main", f"Error fetching channels: {e}")
+    _show_error('Failed to fetch playlist content')
+    return
+
+  render_channels(provider_url, channels, page,
+                  {'mode': 'list_group', 'url': provider_url, 'group': group_title})
+
+
+def render_channels(provider_url, channels, page, query):
+  """
+  Adds one page of channels to the directory, query builds the URL of the
+  next page.
+  """
+  # Measured by the service's stream health checks, when enabled
+  channels = rank_channels(provider_url, channels,
+                           hide_dead=ADDON.getSettingBool('health_hide_dead'),
+                           sort_by_latency=ADDON.getSettingBool('health_sort_latency'))
+  with span("render"):
+    # Sliced first, only the page's ListItems are created
+    channels, has_more = page_slice(channels, page)
+    items = channel_items(provider_url, channels)
+    if has_more:
+      items.append(next_page_item(query, page))
+    xbmcplugin.addDirectoryItems(ADDON_HANDLE, items, len(items))
   xbmcplugin.endOfDirectory(ADDON_HANDLE)
 
 
 def play_video(provider_url, channel_title):
   """
-  Resolves the URL and sets up Inputstream Adaptive for DRM or HLS.
+  Resolves the URL and sets up Inputstream Adaptive for DRM or HLS, from the
+  playback descriptor computed when the playlist was parsed.
   """
   try:
-    channels = get_channels(provider_url=provider_url)
-    channel = next((ch for ch in channels if ch.title == channel_title), None)
-    if not channel:
+    playback = get_playback(provider_url, channel_title)
+    if not playback:
       raise ValueError("Channel not found")
-
-    url = channel.url
-    user_agent = channel.user_agent
-    cookie = channel.cookie
-    referer = channel.referer
-    license_string = channel.license_string
-    headers = channel.headers
   except Exception as e:
     log_error("main", f"Error resolving channel: {e}")
     xbmcgui.Dialog().notification(
         'Error', 'Failed to resolve channel URL', xbmcgui.NOTIFICATION_ERROR)
     return
 
-  li = xbmcgui.ListItem(path=url)
-
-  # Construct standard headers string for Kodi
-  stream_headers = []
-  if headers:
-    for k, v in headers.items():
-      stream_headers.append(f'{k}={v}')
-
-  if user_agent:
-    stream_headers.append(f'User-Agent={user_agent}')
-  if referer:
-    stream_headers.append(f'Referer={referer}')
-  if cookie:
-    stream_headers.append(f'Cookie={cookie}')
-
-  # Check if DASH (mpd) or HLS (m3u/m3u8) or DRM license is present
-  if '.mpd' in url or '.m3u8' in url or '.m3u' in url or license_string:
-    li.setProperty('inputstream', 'inputstream.adaptive')
-
-    if (stream_headers):
-      encoded_headers = '&'.join(stream_headers)
-      li.setProperty('inputstream.adaptive.manifest_headers', encoded_headers)
-      li.setProperty('inputstream.adaptive.stream_headers', encoded_headers)
-      url += '|' + encoded_headers
-      li.setPath(url)
-
-    if license_string:
-      # Check if Clearkey license exists
-      # Match format hex:hex (one or more hex digits each side)
-      hex_pair_re = re.compile(r'^[0-9a-fA-F]+:[0-9a-fA-F]+$')
-
-      if license_string and hex_pair_re.match(license_string):
-        drm_config = f"org.w3.clearkey|{license_string}"
-        li.setProperty('inputstream.adaptive.drm_legacy', drm_config)
-
-      # If it's a URL (Clearkey License Server)
-      elif license_string and license_string.startswith('http'):
-        drm_config = f"org.w3.clearkey|{license_string}|{urlencode(license_headers)}"
-        li.setProperty('inputstream.adaptive.drm_legacy', drm_config)
+  li = xbmcgui.ListItem(path=playback['path'], offscreen=True)
+  for key, value in playback['properties'].items():
+    li.setProperty(key, value)
   xbmcplugin.setResolvedUrl(ADDON_HANDLE, True, li)
 
 
@@ -155,18 +264,26 @@ def router(param_string):
   params = dict(parse_qsl(param_string))
   mode = params.get('mode')
 
-  if mode is None:
-    list_providers()
-  elif mode == 'list_channels':
-    list_channels(params.get('url'))
-  elif mode == 'play':
-    play_video(
-      params.get('provider_url'),
-      params.get('channel_title')
-    )
-  else:
-    xbmcgui.Dialog().notification(
-      'Error', 'Not implemented', xbmcgui.NOTIFICATION_ERROR)
+  try:
+    with span("total"):
+      if mode is None:
+        list_providers()
+      elif mode == 'list_channels':
+        list_channels(params.get('url'), int(params.get('page', 0)))
+      elif mode == 'list_group':
+        list_group(params.get('url'), params.get('group', ''), int(params.get('page', 0)))
+      elif mode == 'search':
+        search(params.get('query'))
+      elif mode == 'play':
+        play_video(
+          params.get('provider_url'),
+          params.get('channel_title')
+        )
+      else:
+        xbmcgui.Dialog().notification(
+          'Error', 'Not implemented', xbmcgui.NOTIFICATION_ERROR)
+  finally:
+    flush_timings(mode or "list_providers")
 
 
 if __name__ == '__main__':
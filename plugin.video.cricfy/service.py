@@ -1,12 +1,90 @@
-from lib.config import cache
+import xbmc
+from lib.config import ADDON, cache
 from lib.logger import log_info
-from lib.providers import get_providers
+from lib.perf import flush as flush_timings
+from lib.providers import (
+  get_providers, refresh_providers, clear_channel_files, channel_cache_age,
+  CHANNEL_CACHE_SOFT_TTL,
+)
+from lib.prefetch import prefetch_channels
+from lib.health import probe_channels
+from lib.search import prune_search_indexes
+from lib.remote_config import refresh_remote_config, REMOTE_CONFIG_SOFT_TTL
+from lib.scheduler import Job, Scheduler
+from lib.usage import frequent_providers
+
+REMOTE_CONFIG_REFRESH_INTERVAL = REMOTE_CONFIG_SOFT_TTL  # Refreshed before the plugin would revalidate it
+PROVIDERS_REFRESH_INTERVAL = 6 * 3600  # 6 hours
+# Playlists are refreshed before the plugin would find them stale
+CHANNELS_REFRESH_INTERVAL = CHANNEL_CACHE_SOFT_TTL
+
+
+def refresh_providers_job(monitor: xbmc.Monitor) -> bool:
+  return bool(refresh_providers())
+
+
+def refresh_channels_job(monitor: xbmc.Monitor) -> bool:
+  """
+  Refreshes the playlists of the most used providers, skipping those the
+  plugin fetched recently.
+  """
+  provider_urls = []
+  for url in frequent_providers(ADDON.getSettingInt('refresh_recent_providers')):
+    age = channel_cache_age(url)
+    if age is None or age >= CHANNELS_REFRESH_INTERVAL / 2:
+      provider_urls.append(url)
+  refreshed = prefetch_channels(
+    provider_urls,
+    max_workers=ADDON.getSettingInt('prefetch_workers'),
+    max_per_host=ADDON.getSettingInt('prefetch_per_host'),
+    time_budget=ADDON.getSettingInt('prefetch_time_budget'),
+    monitor=monitor,
+  )
+  flush_timings("service_refresh")
+  return refreshed == len(provider_urls)
+
 
 if __name__ == '__main__':
   # Clear all cache entries
   cache.delete('%')
+  clear_channel_files()
   log_info("service", "All cache cleared")
+  # Search indexes outlive the cache, only those of dropped providers go
+  prune_search_indexes()
 
   # Prefetch providers to warm up cache
   providers = get_providers()
   log_info("service", f"Fetched {len(providers)} providers")
+
+  provider_urls = [prov.get('catLink', '') for prov in providers
+                   if prov.get('catLink', '').startswith('http')]
+
+  # Prefetch every provider's channels so that opening one is a cache hit
+  if ADDON.getSettingBool('prefetch_channels'):
+    prefetch_channels(
+      provider_urls,
+      max_workers=ADDON.getSettingInt('prefetch_workers'),
+      max_per_host=ADDON.getSettingInt('prefetch_per_host'),
+      time_budget=ADDON.getSettingInt('prefetch_time_budget'),
+    )
+
+  # Check the channels' streams, for listings to hide dead ones or sort by latency
+  if ADDON.getSettingBool('health_probe'):
+    probe_channels(
+      provider_urls,
+      max_workers=ADDON.getSettingInt('health_workers'),
+      max_per_host=ADDON.getSettingInt('health_per_host'),
+      rate=ADDON.getSettingInt('health_rate'),
+      time_budget=ADDON.getSettingInt('health_time_budget'),
+    )
+
+  flush_timings("service")
+
+  # Keep the caches fresh until Kodi exits, so users rarely wait for a fetch
+  if ADDON.getSettingBool('background_refresh'):
+    scheduler = Scheduler(xbmc.Monitor(), xbmc.Player())
+    scheduler.add(Job("remote_config", REMOTE_CONFIG_REFRESH_INTERVAL,
+                      lambda monitor: bool(refresh_remote_config())))
+    scheduler.add(Job("providers", PROVIDERS_REFRESH_INTERVAL, refresh_providers_job))
+    scheduler.add(Job("channels", CHANNELS_REFRESH_INTERVAL, refresh_channels_job))
+    scheduler.run()